@@ -0,0 +1,55 @@
+TEST_SCRIPT_NAME=dm16_ra_kfold
+MODEL=dm16_ra
+NUM_FOLDS=5
+
+current_date=$(date +%m%d_%H%M)
+
+# Splits and folds are index lists in the metadata
+# hence every fold reads the same stored shards
+METADATA_FILE=gs://magnatagatune_dataset/all_win_rawdata/raw_win_metadata.json
+
+TRAIN_STEPS=11000
+LEARNING_RATE=0.1
+EVAL_STEPS=44
+EVAL_BATCH=12
+TRAIN_BATCH=20
+WINDOWING=SPM
+
+# The trainer uses tf.data and tf.contrib.data APIs of up to
+# TensorFlow 1.6, hence the runtime version
+REGION=us-east1
+CONFIG=config.yaml
+
+# Static cost of the model on the 12 windows of every song of a
+# tower batch, stopping before submission if over the memory of a GPU
+WINDOW_SAMPLES=38832
+MAX_ACTIVATION_MB=8000
+python -m trainer.model_specs \
+--model-functions $MODEL \
+--num-samples $WINDOW_SAMPLES \
+--batch-size $((TRAIN_BATCH*12)) \
+--max-activation-mb $MAX_ACTIVATION_MB || exit 1
+
+for (( FOLD=0; FOLD<NUM_FOLDS; FOLD++ ))
+do
+JOB_NAME=${TEST_SCRIPT_NAME}_${FOLD}_${current_date}
+JOB_DIR=gs://magnatagatune_dataset/out_$JOB_NAME
+
+gcloud ml-engine jobs submit training $JOB_NAME \
+--runtime-version 1.6 \
+--job-dir $JOB_DIR \
+--module-name trainer.task_mgpu \
+--package-path trainer/ \
+--region $REGION \
+--config $CONFIG \
+-- \
+--train-steps $TRAIN_STEPS \
+--eval-steps $EVAL_STEPS \
+--eval-batch-size $EVAL_BATCH \
+--train-batch-size $TRAIN_BATCH \
+--metadata-files $METADATA_FILE \
+--learning-rate $LEARNING_RATE \
+--windowing-type $WINDOWING \
+--model-function $MODEL \
+--fold $FOLD
+done
@@ -17,7 +17,7 @@ WINDOWING=STME
 
 gcloud ml-engine jobs submit training $JOB_NAME \
 --stream-logs \
---runtime-version 1.2 \
+--runtime-version 1.6 \
 --job-dir $JOB_DIR \
 --module-name trainer.task \
 --package-path trainer/ \
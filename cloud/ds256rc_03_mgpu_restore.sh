@@ -23,7 +23,7 @@ WINDOWING=SPM
 
 gcloud ml-engine jobs submit training $JOB_NAME \
 --stream-logs \
---runtime-version 1.2 \
+--runtime-version 1.6 \
 --job-dir $JOB_DIR \
 --module-name trainer.task_mgpu \
 --package-path trainer/ \
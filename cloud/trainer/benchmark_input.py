@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the input pipeline throughput with no model attached.
+
+    The pipeline of the DataProvider is built up to every stage in turn
+    (read, parse, decode and shuffle) and batches are drained for a number
+    of seconds. The examples/sec, bytes/sec and time per batch of every
+    stage are reported, together with the peak resident memory, to tell
+    whether a job is input-bound and to compare formats and thread counts.
+
+    Run from the cloud folder against local files, for example:
+
+    python -m trainer.benchmark_input --files magnatagatune/train_rawdata.tfrecords
+        --metadata-file magnatagatune/raw_metadata.json
+"""
+
+import argparse
+import os
+import resource
+import time
+
+import tensorflow as tf
+
+from .dataproviders import DataProvider, QUEUE_BACKEND, RAW_FEATURES, WINDOWS_PER_SONG
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+tf.logging.set_verbosity(tf.logging.INFO)
+
+# Stages of the pipeline, each including the ones before
+READ, PARSE, DECODE, SHUFFLE = 'read', 'parse', 'decode', 'shuffle'
+STAGES = [READ, PARSE, DECODE, SHUFFLE]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Stage graphs
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+def stage_ops(data_provider, stage, windows, batch_size):
+    """Build the input pipeline up to a stage.
+
+    :param data_provider: Data provider of the files benchmarked
+    :param stage: Last stage of the pipeline built
+    :param windows: Whether windowed songs are provided
+    :param batch_size: The size of batches
+    :return: Tensor whose first dimension counts the examples and
+        the tensors whose bytes are counted
+    """
+    if stage == SHUFFLE:
+        if windows:
+            features, labels = data_provider.windows_batch_in()
+        else:
+            features, labels = data_provider.batch_in()
+        return labels, [features, labels]
+
+    read_size = WINDOWS_PER_SONG*batch_size if windows else batch_size
+    serialized_example = data_provider.read(read_size)
+    if stage == READ:
+        return serialized_example, [serialized_example]
+
+    data = data_provider.parse(serialized_example)
+    if stage == PARSE:
+        return data['song'], [data['song'], data['tags']]
+
+    songs, tags = data_provider.prepare_windows(data) if windows else data_provider.prepare(data)
+    return tags, [songs, tags]
+
+
+def output_bytes(values):
+    """Number of bytes of the values fetched.
+
+    :param values: Numpy arrays, or arrays of serialized strings
+    :return: Number of bytes
+    """
+    total = 0
+    for value in values:
+        if value.dtype == object:
+            total += sum(len(item) for item in value)
+        else:
+            total += value.nbytes
+    return total
+
+
+def benchmark_stage(stage, files, metadata_file, windows, seconds, warmup, **kwargs):
+    """Drain the batches of the pipeline built up to a stage.
+
+    :param stage: Last stage of the pipeline built
+    :param files: Files read
+    :param metadata_file: Metadata of the dataset
+    :param windows: Whether windowed songs are provided
+    :param seconds: Seconds during which batches are drained
+    :param warmup: Batches run before timing
+    :param kwargs: Arguments of the DataProvider
+    :return: Dictionary with the batches, examples, bytes and seconds
+    """
+    with tf.Graph().as_default():
+        data_provider = DataProvider(files, metadata_file, num_epochs=None, **kwargs)
+        count_op, fetch_ops = stage_ops(data_provider, stage, windows, kwargs['batch_size'])
+
+        coord = tf.train.Coordinator(clean_stop_exception_types=(
+            tf.errors.CancelledError, tf.errors.OutOfRangeError))
+        with tf.Session() as session:
+            session.run([tf.global_variables_initializer(), tf.local_variables_initializer()])
+            threads = tf.train.start_queue_runners(coord=coord, sess=session)
+
+            for _ in range(warmup):
+                session.run(count_op)
+
+            batches, examples, num_bytes = 0, 0, 0
+            start = time.time()
+            while time.time() - start < seconds:
+                count, values = session.run([count_op, fetch_ops])
+                batches += 1
+                examples += len(count)
+                num_bytes += output_bytes(values)
+            elapsed = time.time() - start
+
+            coord.request_stop()
+            coord.join(threads, stop_grace_period_secs=5, ignore_live_threads=True)
+
+    return {'batches': batches, 'examples': examples, 'bytes': num_bytes, 'seconds': elapsed}
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+def run(files, metadata_file, windowing, seconds, warmup, batch_size, num_tags, num_samples,
+        backend, num_readers, shuffle_buffer_mb, features):
+    """Benchmark every stage of the input pipeline and log the results.
+
+    With the tf.data backend the stages are fused in one pipeline,
+    hence only the whole pipeline is benchmarked.
+
+    Args:
+        files (list): Files read
+        metadata_file (string): Metadata of the dataset
+        windowing (bool): Provide windowed songs with windows_batch_in
+        seconds (float): Seconds during which every stage is drained
+        warmup (int): Batches run before timing every stage
+        batch_size (int): The size of batches
+        num_tags (int): The number of tags in the targets
+        num_samples (int): Samples of the songs
+        backend (str): Input pipeline built from queue runners or tf.data
+        num_readers (int): Files read in parallel by the tf.data backend
+        shuffle_buffer_mb (float): Memory budget of the shuffle buffer in MB
+        features (str): Samples of the records or log-mel filterbanks computed from raw records
+    """
+    kwargs = {
+        'batch_size': batch_size,
+        'num_tags': num_tags,
+        'num_samples': num_samples,
+        'backend': backend,
+        'num_readers': num_readers,
+        'shuffle_buffer_mb': shuffle_buffer_mb,
+        'features': features
+    }
+    stages = STAGES if backend == QUEUE_BACKEND else [SHUFFLE]
+
+    previous_latency = 0.0
+    for stage in stages:
+        result = benchmark_stage(stage, files, metadata_file, windowing, seconds, warmup, **kwargs)
+        latency = result['seconds'] / max(result['batches'], 1)
+        tf.logging.info('{:>8}: {:10.1f} examples/sec {:10.2f} MB/sec {:8.2f} ms/batch ({:+.2f} ms for stage)'.format(
+            stage,
+            result['examples'] / result['seconds'],
+            result['bytes'] / result['seconds'] / 2.0**20,
+            latency * 1000,
+            (latency - previous_latency) * 1000))
+        previous_latency = latency
+
+    # Peak resident memory, in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tf.logging.info('Peak RSS: {:.1f} MB'.format(peak_rss / 1024.0))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Input Parsing
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--files',
+                        required=True,
+                        nargs='+',
+                        help='Local or GCS tfrecord files to read')
+
+    parser.add_argument('--metadata-file',
+                        required=True,
+                        type=str,
+                        help='Metadata file of the dataset')
+
+    parser.add_argument('--windowing',
+                        action='store_true',
+                        help='Provide windowed songs with windows_batch_in')
+
+    parser.add_argument('--seconds',
+                        type=float,
+                        default=30,
+                        help='Seconds during which every stage is drained')
+
+    parser.add_argument('--warmup',
+                        type=int,
+                        default=5,
+                        help='Batches run before timing every stage')
+
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=20,
+                        help='Batch size')
+
+    parser.add_argument('--num-tags',
+                        type=int,
+                        default=50,
+                        help='Number of tags in the targets')
+
+    parser.add_argument('--num-samples',
+                        type=int,
+                        default=-1,
+                        help='Samples of the songs')
+
+    parser.add_argument('--backend',
+                        type=str,
+                        default=QUEUE_BACKEND,
+                        help='Input pipeline built from queue runners (queue) or from tf.data (dataset)')
+
+    parser.add_argument('--num-readers',
+                        type=int,
+                        default=None,
+                        help='Files read in parallel by the tf.data backend')
+
+    parser.add_argument('--shuffle-buffer-mb',
+                        type=float,
+                        default=None,
+                        help='Memory budget in MB of the shuffle buffer')
+
+    parser.add_argument('--features',
+                        type=str,
+                        default=RAW_FEATURES,
+                        help='Samples of the records (raw) or log-mel filterbanks computed from raw records (log_mel)')
+
+    parse_args, unknown = parser.parse_known_args()
+
+    # If unknown arguments found, warn them on the console
+    tf.logging.warn('Unknown arguments: {}'.format(unknown))
+    run(**parse_args.__dict__)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the training step time and memory of the raw models.
+
+    Every raw model of models_mgpu is built with the sample-level layers
+    as conv2d with [1, k] kernels and as native 1-D convolutions and
+    pooling (NATIVE_1D), and trained on a random batch held in memory, so
+    that no input cost is measured. Every configuration runs in its own
+    process, so that the peak memory of one does not hide the next.
+
+    The memory is the peak of the allocator of the device on GPUs and
+    the peak resident memory of the process on CPUs.
+
+    Run from the cloud folder, for example:
+
+    python -m trainer.benchmark_models --batch-size 20 --num-samples 38832
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+
+import tensorflow as tf
+
+from . import models as layers_1d
+from . import models_mgpu as models
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+tf.logging.set_verbosity(tf.logging.INFO)
+
+# Models of models_mgpu reading raw windows, the full-clip models of
+# model_specs are benchmarked with --model-functions and --num-samples 465984
+RAW_MODELS = ['mkc_r', 'ds256ra', 'ds256rb', 'ds256rc', 'dm8_ra', 'dm16_ra', 'dm16_rb', 'dm64_ra', 'dm128_ra',
+              'dl16_16_ra', 'dl16_8_ra', 'dl16_4_ra', 'mul16a', 'mul16b', 'mul16c', 'mul16d', 'mul16ds',
+              'mul16f']
+
+# Implementations of the sample-level layers compared
+CONV2D, NATIVE = 'conv2d', 'native'
+PATHS = [CONV2D, NATIVE]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Model step
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+def benchmark_model(model_function, path, batch_size, num_samples, steps, warmup, device):
+    """Time the training steps of a model with one implementation of
+    the sample-level layers.
+
+    :param model_function: Name of the model in models_mgpu
+    :param path: Implementation of the layers, conv2d or native
+    :param batch_size: The size of batches
+    :param num_samples: Samples of the songs
+    :param steps: Steps timed
+    :param warmup: Steps run before timing
+    :param device: Device of the model
+    :return: Dictionary with the time per step in ms and the peak
+        memory in MB
+    """
+    # The 1-D helpers of models_mgpu are those of models
+    layers_1d.NATIVE_1D = path == NATIVE
+    on_gpu = 'gpu' in device.lower()
+
+    with tf.Graph().as_default():
+        with tf.device(device):
+            # Random batch generated once and kept in memory
+            data = tf.Variable(tf.random_uniform([batch_size, num_samples, 1], -1.0, 1.0),
+                               trainable=False, name='data')
+            logits = getattr(models, model_function)(data, models.TRAIN)
+            loss = tf.reduce_mean(tf.square(logits))
+            train_op = tf.train.AdadeltaOptimizer(0.001).minimize(loss)
+            peak_bytes = tf.contrib.memory_stats.MaxBytesInUse() if on_gpu else None
+
+        with tf.Session(config=tf.ConfigProto(allow_soft_placement=True)) as session:
+            session.run(tf.global_variables_initializer())
+            for _ in range(warmup):
+                session.run(train_op)
+
+            start = time.time()
+            for _ in range(steps):
+                session.run(train_op)
+            elapsed = time.time() - start
+
+            if on_gpu:
+                memory = session.run(peak_bytes)
+            else:
+                # Peak resident memory, in kilobytes on Linux
+                memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return {'step_ms': elapsed / steps * 1000, 'memory_mb': memory / 2.0**20}
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+def run(model_functions, batch_size, num_samples, steps, warmup, device):
+    """Benchmark every model with both implementations of the layers
+    and log the results.
+
+    Args:
+        model_functions (list): Names of the models, by default every raw model
+        batch_size (int): The size of batches
+        num_samples (int): Samples of the songs
+        steps (int): Steps timed for every model
+        warmup (int): Steps run before timing every model
+        device (str): Device of the models
+    """
+    for model_function in model_functions or RAW_MODELS:
+        results = {}
+        for path in PATHS:
+            # A new process for every configuration
+            pool = multiprocessing.Pool(1)
+            try:
+                results[path] = pool.apply(benchmark_model, (model_function, path, batch_size, num_samples,
+                                                             steps, warmup, device))
+            except Exception as error:
+                tf.logging.warn('{} ({}) failed: {}'.format(model_function, path, error))
+            finally:
+                pool.close()
+                pool.join()
+
+        if len(results) < len(PATHS):
+            continue
+        tf.logging.info('{:>10}: conv2d {:8.2f} ms/step {:8.1f} MB, native {:8.2f} ms/step {:8.1f} MB, '
+                        'speedup {:.2f}x'.format(model_function,
+                                                 results[CONV2D]['step_ms'], results[CONV2D]['memory_mb'],
+                                                 results[NATIVE]['step_ms'], results[NATIVE]['memory_mb'],
+                                                 results[CONV2D]['step_ms'] / results[NATIVE]['step_ms']))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Input Parsing
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--model-functions',
+                        nargs='+',
+                        default=None,
+                        help='Models to benchmark, by default every raw model')
+
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=20,
+                        help='Batch size')
+
+    parser.add_argument('--num-samples',
+                        type=int,
+                        default=38832,
+                        help='Samples of the songs, by default those of a window')
+
+    parser.add_argument('--steps',
+                        type=int,
+                        default=20,
+                        help='Steps timed for every model')
+
+    parser.add_argument('--warmup',
+                        type=int,
+                        default=3,
+                        help='Steps run before timing every model')
+
+    parser.add_argument('--device',
+                        type=str,
+                        default='/gpu:0',
+                        help='Device of the models, /gpu:0 or /cpu:0')
+
+    parse_args, unknown = parser.parse_known_args()
+
+    # If unknown arguments found, warn them on the console
+    tf.logging.warn('Unknown arguments: {}'.format(unknown))
+    run(**parse_args.__dict__)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Check that a model gives the same logits on the windows folded into
+the batch as on every window with tf.map_fn.
+
+    Every raw model of models_mgpu is built on a random batch of
+    windows with both paths of map_windows, sharing the variables, and
+    the largest difference of the logits is reported. Batch
+    normalization takes the moments of every window on both paths and
+    dropout is turned off, so every model has to pass the check, as
+    FOLD_WINDOWS is on by default.
+
+    Run from the cloud folder, for example:
+
+    python -m trainer.check_windows --num-samples 38832
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from . import models as windows_models
+from . import models_mgpu as models
+from .benchmark_models import RAW_MODELS
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Check
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+def window_difference(model_function, windows, batch_size, num_samples, output_size):
+    """Largest difference of the logits of the folded windows and of
+    the windows run with tf.map_fn.
+
+    :param model_function: Name of the model in models_mgpu
+    :param windows: Windows of every song
+    :param batch_size: Songs of the batch
+    :param num_samples: Samples of every window
+    :param output_size: Number of tags in the targets
+    :return: Largest absolute difference of the logits
+    """
+    fold_windows, apply_dropout = windows_models.FOLD_WINDOWS, windows_models.DROPOUT
+    model = getattr(models, model_function)
+    logits = {}
+
+    with tf.Graph().as_default():
+        # Random windows generated once, shared by both paths
+        data = tf.Variable(tf.random_uniform([windows, batch_size, num_samples, 1], -1.0, 1.0),
+                           trainable=False, name='data')
+        try:
+            windows_models.DROPOUT = False
+            for fold in [True, False]:
+                windows_models.FOLD_WINDOWS = fold
+                with tf.variable_scope('model', reuse=True if logits else None):
+                    logits[fold] = models.map_windows(model, data, windows, models.EVAL, output_size=output_size)
+        finally:
+            windows_models.FOLD_WINDOWS, windows_models.DROPOUT = fold_windows, apply_dropout
+
+        with tf.Session() as session:
+            session.run(tf.global_variables_initializer())
+            folded, mapped = session.run([logits[True], logits[False]])
+
+    return float(np.max(np.abs(folded - mapped)))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Input Parsing
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--model-functions',
+                        nargs='+',
+                        default=RAW_MODELS,
+                        help='Models of models_mgpu checked')
+
+    parser.add_argument('--windows',
+                        type=int,
+                        default=12,
+                        help='Windows of every song')
+
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=4,
+                        help='Songs of the batch')
+
+    parser.add_argument('--num-samples',
+                        type=int,
+                        default=38832,
+                        help='Samples of every window')
+
+    parser.add_argument('--num-tags',
+                        type=int,
+                        default=50,
+                        help='Number of tags in the targets')
+
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=1e-4,
+                        help='Largest difference of the logits accepted')
+
+    args = parser.parse_args()
+
+    failed = []
+    for model_function in args.model_functions:
+        difference = window_difference(model_function, args.windows, args.batch_size, args.num_samples,
+                                       args.num_tags)
+        tf.logging.info('{}: largest difference of the folded and tf.map_fn logits {:.3g}'.format(
+            model_function, difference))
+        if difference > args.tolerance:
+            failed.append(model_function)
+
+    if failed:
+        tf.logging.error('Different logits on folded windows: {}'.format(', '.join(failed)))
+        sys.exit(1)
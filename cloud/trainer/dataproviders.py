@@ -1,19 +1,124 @@
 # -*- coding: utf-8 -*-
 """Data providers.
 This module provides classes for loading data and iterating over batches of
-data points using TensorFlow's queue runners.
+data points using either TensorFlow's queue runners or a tf.data pipeline.
 
 It loads the data from the file using the TFRecord reader, decodes it,
 manipulates the samples and tags as needed, shuffles, queues and batches.
 """
 import os
 import json
+import time
+import base64
+import hashlib
+import binascii
+import threading
+import numpy as np
 import tensorflow as tf
 import multiprocessing
 from tensorflow.python.lib.io import file_io
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
+# Tag encodings written by the extraction scripts
+INT32_TAGS, PACKED_TAGS = 'int32', 'packed_bits'
+
+# Normalization by the batch maximum or the dataset statistics
+BATCH_NORM, DATASET_NORM = 'batch', 'dataset'
+
+# Input backends, queue runners or tf.data (TensorFlow 1.5 or later)
+QUEUE_BACKEND, DATASET_BACKEND = 'queue', 'dataset'
+
+# Bytes of the float32 songs and tags held in the shuffle buffer
+BYTES_PER_VALUE = 4
+
+# Windows saved per song in the windowed records
+WINDOWS_PER_SONG = 12
+
+# Bytes read at a time when copying shards to the cache
+COPY_CHUNK_BYTES = 16 * 2**20
+
+# Features provided, the samples of the records or log-mel filterbanks
+# computed from raw records as extract_ds_fbanks_tfr does with logfbank
+RAW_FEATURES, LOG_MEL_FEATURES = 'raw', 'log_mel'
+MEL_SAMPLE_RATE = 16000
+MEL_FRAME_LENGTH, MEL_FRAME_STEP = 400, 160
+MEL_FFT_LENGTH = 512
+MEL_FILTERS = 40
+MEL_PREEMPHASIS = 0.97
+MEL_FLOOR = np.finfo(np.float64).eps
+
+
+def expand_files(file_patterns):
+    """Expand comma-separated lists and glob patterns of files,
+    local or on GCS. Every pattern is a source that can be given a
+    sampling weight as pattern@weight.
+
+    :param file_patterns: List of files, patterns or comma-separated
+        lists of them
+    :return: Filenames and a list with the filenames and weight of
+        every source
+    """
+    sources = []
+    for entry in file_patterns:
+        for pattern in entry.split(','):
+            pattern, weight = pattern.strip(), 1.0
+            if not pattern:
+                continue
+            if '@' in pattern:
+                try:
+                    pattern, weight = pattern.rsplit('@', 1)[0], float(pattern.rsplit('@', 1)[1])
+                except ValueError:
+                    pass
+
+            if any(char in pattern for char in '*?['):
+                files = sorted(file_io.get_matching_files(pattern))
+                if not files:
+                    raise ValueError('No files match {}'.format(pattern))
+            else:
+                files = [pattern]
+            sources.append((files, weight))
+
+    filenames = [filename for files, _ in sources for filename in files]
+    return filenames, sources
+
+
+def load_tag_selection(filename):
+    """Load the names of the selected tags from a json file, as a
+    list or under the key 'tags'.
+
+    :param filename: Local or GCS json file
+    :return: List of tag names
+    """
+    with file_io.FileIO(filename, 'r') as f:
+        selection = json.load(f)
+    if isinstance(selection, dict):
+        selection = selection['tags']
+    return [str(tag) for tag in selection]
+
+
+def mel_filterbank(num_filters=MEL_FILTERS, fft_length=MEL_FFT_LENGTH, sample_rate=MEL_SAMPLE_RATE):
+    """Triangular mel filters between 0 Hz and the Nyquist frequency,
+    as get_filterbanks of python_speech_features.
+
+    :param num_filters: Number of filters
+    :param fft_length: Length of the FFT
+    :param sample_rate: Sample rate of the songs
+    :return: Matrix of the filters [fft_length//2 + 1, num_filters]
+    """
+    high_mel = 2595 * np.log10(1 + (sample_rate / 2.0) / 700.0)
+    mel_points = np.linspace(0, high_mel, num_filters + 2)
+    hz_points = 700 * (10 ** (mel_points / 2595.0) - 1)
+    bins = np.floor((fft_length + 1) * hz_points / sample_rate)
+
+    filters = np.zeros([num_filters, fft_length // 2 + 1])
+    for j in range(num_filters):
+        for i in range(int(bins[j]), int(bins[j + 1])):
+            filters[j, i] = (i - bins[j]) / (bins[j + 1] - bins[j])
+        for i in range(int(bins[j + 1]), int(bins[j + 2])):
+            filters[j, i] = (bins[j + 2] - i) / (bins[j + 2] - bins[j + 1])
+    return filters.T
+
 
 class DataProvider(object):
 
@@ -25,19 +130,93 @@ class DataProvider(object):
                  num_tags=None,
                  num_samples=None,
                  shuffle=True,
-                 split_nums=None):
+                 split_nums=None,
+                 normalization=BATCH_NORM,
+                 split=None,
+                 fold=None,
+                 backend=QUEUE_BACKEND,
+                 num_readers=None,
+                 prefetch_batches=2,
+                 shuffle_buffer_mb=None,
+                 worker_index=0,
+                 num_workers=1,
+                 window_count=None,
+                 window_length=None,
+                 window_hop=None,
+                 num_excerpts=None,
+                 excerpt_length=None,
+                 selected_tags=None,
+                 tag_balance=None,
+                 shard_cache=None,
+                 echo_factor=None,
+                 auto_echo=False,
+                 synthetic=False,
+                 features=RAW_FEATURES):
 
         """Class to load the data and provide batches to
         the calling function. Every run a batch is returned.
         Functions include either tfr or csv.
 
-        :param filenames: File name and location of tfrecord
+        :param filenames: File names and locations of tfrecords, glob
+            patterns or comma-separated lists of them, each optionally
+            weighted as pattern@weight (tf.data backend, TensorFlow 1.6
+            or later). If None, the files of the split in the metadata
+            are used
         :param batch_size: The size of batches to be provided
         :param num_epochs: The number of epochs to be returned.
             If None, and indefinite number is provided.
         :param num_tags: The number of tags in the target tensor
         :param num_samples: Number of samples in the feature tensors
         :param shuffle: Boolean whether to shuffle the batches or not
+        :param normalization: Normalize by the maximum of every batch
+            or by the maximum saved in the training split statistics
+        :param split: Name of the split to read, such as train. When
+            the metadata defines the splits as index lists, only the
+            shards and records of the split are read
+        :param fold: Cross-validation fold held out for validation,
+            replacing the train and valid index splits
+        :param backend: Input pipeline built from queue runners or
+            from tf.data, which needs no queue runner threads
+        :param num_readers: Files read in parallel, by default one
+            per file up to the number of CPUs
+        :param prefetch_batches: Batches prepared in advance by the
+            tf.data backend
+        :param shuffle_buffer_mb: Memory budget of the shuffle buffer
+            in MB. If None, a buffer of 5 batches is used
+        :param worker_index: Index of the worker reading the data
+        :param num_workers: Number of workers reading the data, each
+            reading its own shards, or its own records if there are
+            less shards than workers
+        :param window_count: Number of windows cut from full-clip
+            records at read time (TensorFlow 1.3 or later). If None,
+            windowed records are expected by windows_batch_in
+        :param window_length: Samples (or frames) in every window,
+            by default the clip divided by the number of windows
+        :param window_hop: Samples (or frames) between the starts of
+            consecutive windows, by default the window length
+        :param num_excerpts: Number of random excerpts drawn from
+            every song by batch_in instead of the center crop, each
+            excerpt being an example. If None, excerpts are not used
+        :param excerpt_length: Samples (or frames) in every excerpt
+        :param selected_tags: Names of the tags in the targets, in
+            the order given, instead of the top num_tags tags
+        :param tag_balance: Strength between 0 and 1 of the rejection
+            resampling of the songs by the frequency of their rarest
+            tag, 1 accepting every tag at the rate of the rarest tag.
+            If None, the songs are read with their natural frequency
+        :param shard_cache: ShardCache copying the files read to a
+            local directory, read instead once copied
+        :param echo_factor: Times every prepared example is reused,
+            reshuffled with the other examples, when the input cannot
+            keep up with the model. If None, examples are used once
+        :param auto_echo: Echo the examples only while the input
+            stalls, as detected by the InputMonitorHook
+        :param synthetic: Provide random batches with the shapes of
+            the songs and tags in the metadata instead of reading any
+            file, to benchmark the models without input costs
+        :param features: Samples of the records, or log-mel filterbanks
+            computed from raw records while decoding, with the frames
+            as samples and the filters as depth
         :return:
         """
         self._batch_size = batch_size
@@ -45,6 +224,32 @@ class DataProvider(object):
         self._split_nums = split_nums
         self._num_samples = num_samples
         self._shuffle = shuffle
+        self._num_epochs = num_epochs
+        self._window_count = window_count
+        self._window_length = window_length
+        self._window_hop = window_hop
+        self._num_excerpts = num_excerpts
+        self._excerpt_length = excerpt_length
+        if num_excerpts is not None and not excerpt_length:
+            raise ValueError('An excerpt length is needed for random excerpts')
+        if num_excerpts is not None and window_count is not None:
+            raise ValueError('Random excerpts and windows cannot be used together')
+        self._shuffle_buffer_mb = shuffle_buffer_mb
+
+        # Examples reused echo_count times, set by the InputMonitorHook
+        # between 1 and echo_factor in the automatic mode
+        if auto_echo and not (echo_factor and echo_factor > 1):
+            raise ValueError('Automatic echoing needs an echo factor above 1')
+        self._echo_factor = echo_factor
+        self._auto_echo = auto_echo
+        self.echo_count = 1 if auto_echo else (echo_factor or 1)
+
+        # Input monitoring tensors, set when the batches are built
+        self.queue_size = None
+        self.queue_capacity = None
+        self.dequeue_wait = None
+        self._num_examples = None
+        self.mixing_window = None
 
         with file_io.FileIO(metadata_file, 'r') as f:
             metadata = json.load(f)
@@ -53,9 +258,182 @@ class DataProvider(object):
         self._max_samples = metadata['max_num_samples']
         self._max_tags = metadata['max_num_tags']
         self._sample_depth = metadata['sample_depth']
+        self._tag_encoding = metadata.get('tag_encoding', INT32_TAGS)
+
+        # Shapes of the songs in the records, the provided songs
+        # are shaped as the log-mel frames if computed
+        self._record_samples = self._max_samples
+        self._record_depth = self._sample_depth
+        self._features = features
+        if features == LOG_MEL_FEATURES:
+            if self._record_depth != 1:
+                raise ValueError('Log-mel features need records of raw samples')
+            self._mel_matrix = mel_filterbank().astype(np.float32)
+            self._max_samples = 1 + int(np.ceil(max(self._record_samples - MEL_FRAME_LENGTH, 0) /
+                                                float(MEL_FRAME_STEP)))
+            self._sample_depth = MEL_FILTERS
+        elif features != RAW_FEATURES:
+            raise ValueError('Features {} not recognised'.format(features))
+
+        # Untagged songs are only removed if the extraction did not
+        # already keep only the songs with one of the top tags used
+        filtered_top_tags = metadata.get('filtered_top_tags')
+        self._remove_unused = filtered_top_tags is None or num_tags is None or num_tags < filtered_top_tags
+
+        # Columns of the selected tags gathered from the targets
+        self._tag_columns = None
+        if selected_tags is not None:
+            missing = [tag for tag in selected_tags if tag not in self._label_map]
+            if missing:
+                raise ValueError('Tags {} not in the label map'.format(missing))
+            self._tag_columns = [self._label_map.index(tag) for tag in selected_tags]
+            self._num_tags = len(selected_tags)
+            self._remove_unused = True
+
+        # Acceptance rate of the songs by each of their tags
+        self._tag_acceptance = None
+        if tag_balance:
+            self._tag_acceptance = self.tag_acceptance(metadata, tag_balance, fold)
+
+        self._normalization = normalization
+        if normalization == DATASET_NORM:
+            if features == LOG_MEL_FEATURES:
+                raise ValueError('The dataset statistics are of the raw samples, not of the log-mel features')
+            try:
+                self._norm_factor = metadata['splits']['train']['sample_stats']['max_abs']
+            except (KeyError, TypeError):
+                raise ValueError('Metadata has no training statistics for dataset normalization')
+        elif normalization != BATCH_NORM:
+            raise ValueError('Normalization {} not recognised'.format(normalization))
+
+        sources = None
+        if filenames:
+            filenames, sources = expand_files(filenames)
+
+        self._split_mask = None
+        if split in metadata.get('splits', {}) and 'tids' in metadata['splits'][split]:
+            self._num_examples = len(metadata['splits'][split]['tids'])
 
-        self._filename_queue = tf.train.string_input_producer(
-            filenames, num_epochs=num_epochs)
+        self._synthetic = synthetic
+        self._backend = backend
+        self._shard_cache = shard_cache
+        self._prefetch_batches = prefetch_batches
+        if synthetic:
+            self._worker_shard, self._record_shard, self._sources = None, None, None
+            return
+
+        if split is not None:
+            filenames = self.select_split(metadata, metadata_file, filenames, split, fold)
+        elif not filenames:
+            raise ValueError('No files given and no split to read from the metadata')
+
+        self._worker_shard = None
+        self._record_shard = None
+        if num_workers > 1:
+            if len(filenames) >= num_workers:
+                filenames = filenames[worker_index::num_workers]
+            elif any('shard_indices' in info for info in metadata.get('splits', {}).values()):
+                self._worker_shard = (worker_index, num_workers)
+            else:
+                # Legacy records without a song index are shared by
+                # the position or key of the records read
+                tf.logging.warn('Records have no song index, the {} workers share them record by record, '
+                                'extract at least as many shards as workers to share them by shard'.format(
+                                    num_workers))
+                self._record_shard = (worker_index, num_workers)
+
+        # Sources are only kept apart when sampled with different weights
+        self._sources = None
+        if sources is not None and len(set(weight for _, weight in sources)) > 1:
+            self._sources = [([filename for filename in files if filename in filenames], weight)
+                             for files, weight in sources]
+            self._sources = [(files, weight) for files, weight in self._sources if files]
+
+        # Files are read in a new random order every epoch when shuffling
+        self._num_readers = num_readers or min(len(filenames), multiprocessing.cpu_count())
+        if backend == QUEUE_BACKEND:
+            if self._sources is not None:
+                raise ValueError('Weighted sources need the {} backend'.format(DATASET_BACKEND))
+            self._filename_queue = tf.train.string_input_producer(
+                filenames, num_epochs=num_epochs, shuffle=shuffle)
+            if shard_cache is not None:
+                self._filename_queue = shard_cache.cached_queue(self._filename_queue)
+        elif backend == DATASET_BACKEND:
+            self._filenames = list(filenames)
+        else:
+            raise ValueError('Backend {} not recognised'.format(backend))
+
+    def select_split(self, metadata, metadata_file, filenames, split, fold=None):
+        """Select the files holding a split and the records to keep.
+
+        With splits saved as separate files, the files of the split
+        are returned. With index splits the shards holding songs of
+        the split are selected and, if a shard also holds other songs,
+        a mask over the song indices is kept to filter the records.
+
+        :param metadata: Metadata dictionary of the dataset
+        :param metadata_file: Metadata file, whose folder holds the shards
+        :param filenames: Files given, possibly None
+        :param split: Name of the split
+        :param fold: Cross-validation fold held out for validation
+        :return: Filenames to read
+        """
+        folder = os.path.dirname(metadata_file)
+        if 'index_splits' not in metadata:
+            if fold is not None:
+                raise ValueError('Metadata has no index splits for cross-validation folds')
+            if filenames:
+                return filenames
+            if split not in metadata.get('splits', {}):
+                raise ValueError('Split {} not in the metadata'.format(split))
+            return [os.path.join(folder, name) for name in metadata['splits'][split]['files']]
+
+        members = self.split_members(metadata, split, fold)
+        self._num_examples = len(members)
+
+        stored = metadata['splits']['all']
+        shard_files, partial = [], False
+        for name, indices in zip(stored['files'], stored['shard_indices']):
+            in_split = members.intersection(indices)
+            if in_split:
+                shard_files.append(name)
+                partial = partial or len(in_split) < len(indices)
+
+        if filenames:
+            selected = [filename for filename in filenames if os.path.basename(filename) in shard_files]
+            if not selected:
+                raise ValueError('None of the files given hold the {} split'.format(split))
+        else:
+            selected = [os.path.join(folder, name) for name in shard_files]
+
+        if partial:
+            self._split_mask = [False] * (max(members) + 1)
+            for idx in members:
+                self._split_mask[idx] = True
+        return selected
+
+    @staticmethod
+    def split_members(metadata, split, fold=None):
+        """Indices of the songs of a split defined by index lists.
+
+        :param metadata: Metadata dictionary of the dataset
+        :param split: Name of the split
+        :param fold: Cross-validation fold held out for validation
+        :return: Set of the song indices of the split
+        """
+        if fold is None:
+            if split not in metadata['index_splits']:
+                raise ValueError('Split {} not in the metadata'.format(split))
+            return set(metadata['index_splits'][split])
+
+        folds = metadata.get('folds')
+        if not folds or not 0 <= fold < len(folds):
+            raise ValueError('Fold {} not in the metadata'.format(fold))
+        if split == 'train':
+            return set(idx for num, indices in enumerate(folds) if num != fold for idx in indices)
+        elif split == 'valid':
+            return set(folds[fold])
+        return set(metadata['index_splits'][split])
 
     def batch_in(self):
         """ Function to provide batch data in.
@@ -65,23 +443,15 @@ class DataProvider(object):
         function and hence provides a batch of data each time,
         the function is run in a session.
 
+        When windows are cut at read time, the windows of every
+        song are folded into the batch.
+
         :returns: Features and Labels of a batch
         """
-        # Load the data from the
-        data = self.data_load(self._batch_size)
-        loaded_songs, loaded_tags = self.decode(data)
-
-        # Data preparation
-        tags = self.tag_prep(loaded_tags, self._num_tags)
-        songs = self.sample_prep(loaded_songs)
-        songs, tags = self.remove_unused(songs, tags)
-        songs = self.normalize(songs)
-
-        # Queuing and output
-        features, labels = self.batch(songs, tags)
-        features = self.set_shape(features, axis=-1)
-        features, labels = self.split_batch(features, labels)
-        return features, labels
+        features, labels = self.load_batch()
+        if self._window_count is not None:
+            features, labels = self.fold_windows(self.window(features), labels)
+        return self.output(features, labels)
 
     def windows_batch_in(self):
         """ Function to provide batch data where windowed data
@@ -93,58 +463,218 @@ class DataProvider(object):
         (or higher for fbanks) is processed and provided  to the
         user. This is a TensorFlow function and hence provides a
         batch of data each time, the function is run in a session.
+        The windows are either read from windowed records or cut
+        from full-clip records.
 
         :returns: Features and Labels of a batch
         """
-        windows_per_song = 12
-        # Load data from file and decode data
-        # First dimension is the window dimension * self._batch_size
-        data = self.data_load(windows_per_song*self._batch_size)
+        features, labels = self.load_batch(windows=True)
+        return self.output(features, labels, windows=True)
+
+    def load_batch(self, windows=False):
+        """Function to load, prepare and queue a batch of songs
+        and tags with the backend chosen.
+
+        :param windows: Whether windowed songs are needed
+        :return: Batch of prepared songs and tags
+        """
+        if windows and self._window_count is not None:
+            features, labels = self.load_batch()
+            return self.window(features), labels
+        elif self._synthetic:
+            return self.synthetic_batch(windows)
+        elif windows:
+            # First dimension read is the window dimension * self._batch_size
+            prepare, read_size, block_length = self.prepare_windows, WINDOWS_PER_SONG*self._batch_size, WINDOWS_PER_SONG
+        else:
+            prepare, read_size, block_length = self.prepare, self._batch_size, 1
+
+        if self._backend == DATASET_BACKEND:
+            features, labels = self.dataset_batch(prepare, read_size, block_length)
+        else:
+            # Every reader reads from the files in parallel
+            prepared = [prepare(self.data_load(read_size, block_length)) for _ in range(self._num_readers)]
+            features, labels = self.batch(prepared)
+        return features, labels
+
+    def output(self, features, labels, windows=False):
+        """Function to shape a batch for the models.
+
+        :param features: Batch of songs
+        :param labels: Batch of tags
+        :param windows: Whether the songs are windowed
+        :return: Features and Labels of a batch, split if needed
+        """
+        features = self.set_shape(features, axis=-1)
+        if windows:
+            features = self.transpose_for_mapfn(features)
+            features, labels = self.split_batch(features, labels, feature_axis=1)
+        else:
+            features, labels = self.split_batch(features, labels)
+        return features, labels
+
+    # Prepare data
+    def prepare(self, data):
+        """Decode and prepare songs read from the records.
+
+        :param data: Data read from the records
+        :return: Prepared songs and tags
+        """
+        loaded_songs, loaded_tags = self.decode(data)
+
+        tags = self.tag_prep(loaded_tags, self._num_tags)
+        if self._num_excerpts is not None:
+            songs, tags = self.random_excerpts(loaded_songs, tags)
+        else:
+            songs = self.sample_prep(loaded_songs)
+        if self._remove_unused:
+            songs, tags = self.remove_unused(songs, tags)
+        if self._tag_acceptance is not None:
+            songs, tags = self.balance_tags(songs, tags)
+        if self._echo_factor:
+            songs, tags = self.echo(songs, tags)
+        songs = self.normalize(songs)
+        return songs, tags
+
+    # Prepare windowed data
+    def prepare_windows(self, data):
+        """Decode windowed songs read from the records and merge
+        the windows of every song.
+
+        :param data: Data read from the records, with the windows
+            of a song as consecutive records
+        :return: Prepared songs with the window dimension and tags
+        """
         loaded_songs, loaded_tags = self.decode(data)
 
         # Merge songs and batch
         # Split into a list of 12 tensors each denoting the corresponding song
-        windowed_songs = tf.split(loaded_songs, windows_per_song, name='WindowedSongs')
+        windowed_songs = tf.split(loaded_songs, WINDOWS_PER_SONG, name='WindowedSongs')
         # Re-stack the data
         songs = tf.stack(windowed_songs, name='StackedSongs')
         if self._sample_depth == 1:
-            songs = tf.reshape(songs, [-1, windows_per_song, self._max_samples])
+            songs = tf.reshape(songs, [-1, WINDOWS_PER_SONG, self._max_samples])
         else:
-            songs = tf.reshape(songs, [-1, windows_per_song, self._max_samples, self._sample_depth])
+            songs = tf.reshape(songs, [-1, WINDOWS_PER_SONG, self._max_samples, self._sample_depth])
 
         # Gather the tags of the corresponding songs
-        tags = self.tag_prep(loaded_tags, self._num_tags+1)
-        tags = tf.strided_slice(tags, [0, 0], [-1, -1], [windows_per_song, 1])
+        tags = self.tag_prep(loaded_tags, self._num_tags)
+        tags = tags[::WINDOWS_PER_SONG]
 
         # Data preparation
-        songs, tags = self.remove_unused(songs, tags)
+        if self._remove_unused:
+            songs, tags = self.remove_unused(songs, tags)
+        if self._tag_acceptance is not None:
+            songs, tags = self.balance_tags(songs, tags)
+        if self._echo_factor:
+            songs, tags = self.echo(songs, tags)
         songs = self.normalize(songs)
-
-        # Queuing and output
-        features, labels = self.batch(songs, tags)
-        features = self.set_shape(features, axis=-1)
-        features = self.transpose_for_mapfn(features)
-        features, labels = self.split_batch(features, labels, feature_axis=1)
-        return features, labels
+        return songs, tags
 
     # Load data
-    def data_load(self, read_size):
+    def data_load(self, read_size, block_length=1):
         """Function to load the data from the record.
 
         :param read_size: Amount to read from record.
+        :param block_length: Consecutive records of a song
         :return: data (needs to be decoded)
         """
         with tf.name_scope('InputGenerator'):
-            reader = tf.TFRecordReader()
-            _, serialized_example = reader.read_up_to(self._filename_queue,
-                                                      num_records=read_size)
-            data = tf.parse_example(
-                serialized_example,
-                features={
-                    'tags': tf.FixedLenFeature([], tf.string),
-                    'song': tf.FixedLenFeature([], tf.string)
-                }
-            )
+            serialized_example = self.read(read_size, block_length)
+            data = self.parse(serialized_example)
+        return data
+
+    # Read the records
+    def read(self, read_size, block_length=1):
+        """Function to read serialized records from the files.
+
+        :param read_size: Amount to read from record.
+        :param block_length: Consecutive records of a song
+        :return: Serialized records
+        """
+        reader = tf.TFRecordReader()
+        keys, serialized_example = reader.read_up_to(self._filename_queue,
+                                                     num_records=read_size)
+        if self._record_shard is not None:
+            serialized_example = self.record_shard(keys, serialized_example, block_length)
+        return serialized_example
+
+    # Keep the records of this worker
+    def record_shard(self, keys, serialized_example, block_length=1):
+        """Function to keep the records of this worker when the
+        workers share files whose records have no song index.
+
+        The records are assigned to the workers by a hash of their
+        key, the file and offset of the record, which is the same on
+        every worker whatever the order of the reads. Keys of files
+        read from the shard cache are hashed with the original file,
+        so that cached and remote reads agree. The windows of a song,
+        read together, follow the key of the first window.
+
+        :param keys: Keys of the records read
+        :param serialized_example: Serialized records
+        :param block_length: Consecutive records of a song
+        :return: Serialized records of this worker
+        """
+        worker_index, num_workers = self._record_shard
+        with tf.name_scope('RecordShard'):
+            song_keys = tf.reshape(keys, [-1, block_length])[:, 0]
+            if self._shard_cache is not None:
+                song_keys = self._shard_cache.original_keys(song_keys)
+            keep = tf.equal(tf.string_to_hash_bucket_fast(song_keys, num_workers), worker_index)
+            keep = tf.reshape(tf.tile(tf.expand_dims(keep, 1), [1, block_length]), [-1])
+            serialized_example = tf.boolean_mask(serialized_example, keep)
+        return serialized_example
+
+    # Parse the records
+    def parse(self, serialized_example):
+        """Function to parse a batch of serialized records.
+
+        :param serialized_example: Serialized records
+        :return: data (needs to be decoded)
+        """
+        with tf.name_scope('Parse'):
+            features = {
+                'tags': tf.FixedLenFeature([], tf.string),
+                'song': tf.FixedLenFeature([], tf.string)
+            }
+            filter_records = self._split_mask is not None or self._worker_shard is not None
+            if filter_records:
+                features['index'] = tf.FixedLenFeature([], tf.int64, default_value=-1)
+            data = tf.parse_example(serialized_example, features=features)
+
+            if filter_records:
+                data = self.split_filter(data)
+        return data
+
+    # Keep the records of the split
+    def split_filter(self, data):
+        """Function to keep the records whose song index is in the
+        split, when the shards read also hold songs of other splits,
+        and the records of this worker, when the workers share shards.
+
+        All the windows of a song share its index, hence windowed
+        songs are kept or removed as a whole.
+
+        :param data: Data read from the record with the song index
+        :return: Data of the records in the split
+        """
+        with tf.name_scope('SplitFilter'):
+            index = data.pop('index')
+            keep = tf.greater_equal(index, 0)
+
+            if self._split_mask is not None:
+                split_mask = tf.constant(self._split_mask, dtype=tf.bool)
+                clipped_index = tf.clip_by_value(index, 0, len(self._split_mask) - 1)
+                in_split = tf.logical_and(tf.less(index, len(self._split_mask)),
+                                          tf.gather(split_mask, clipped_index))
+                keep = tf.logical_and(keep, in_split)
+
+            if self._worker_shard is not None:
+                worker_index, num_workers = self._worker_shard
+                keep = tf.logical_and(keep, tf.equal(tf.floormod(index, num_workers), worker_index))
+
+            data = {name: tf.boolean_mask(value, keep) for name, value in data.items()}
         return data
 
     # Decode
@@ -155,15 +685,52 @@ class DataProvider(object):
         :return: Decoded data depending on type
         """
         with tf.name_scope('Decoding'):
-            if self._sample_depth != 1:
+            if self._record_depth != 1:
                 original_songs = tf.cast(tf.decode_raw(data['song'], tf.float64), tf.float32)
-                songs = tf.reshape(original_songs, [-1, self._max_samples, self._sample_depth])
+                songs = tf.reshape(original_songs, [-1, self._record_samples, self._record_depth])
 
             else:
                 songs = tf.cast(tf.decode_raw(data['song'], tf.int32), tf.float32)
-            tags = tf.cast(tf.decode_raw(data['tags'], tf.int32), tf.float32)
+                if self._features == LOG_MEL_FEATURES:
+                    songs = self.log_mel(songs)
+
+            # Packed tags are unpacked in tag_prep so that
+            # only the bytes of the needed tags are expanded
+            if self._tag_encoding == PACKED_TAGS:
+                tags = tf.decode_raw(data['tags'], tf.uint8)
+            else:
+                tags = tf.cast(tf.decode_raw(data['tags'], tf.int32), tf.float32)
         return songs, tags
 
+    # Log-mel filterbanks of raw songs
+    def log_mel(self, songs):
+        """Function to compute the log-mel filterbanks of raw songs
+        as logfbank of python_speech_features with the parameters of
+        extract_ds_fbanks_tfr: pre-emphasis, rectangular frames of
+        25 ms every 10 ms, the last zero padded, power spectrum of a
+        512 point FFT and 40 mel filters. The frames are cut with a
+        single gather and the spectra computed in one batched FFT
+        (TensorFlow 1.5 or later). Values match the fbank records up
+        to float32 precision.
+
+        :param songs: Batch of raw songs
+        :return: Batch of log-mel filterbanks [songs, frames, filters]
+        """
+        with tf.name_scope('LogMel'):
+            emphasized = tf.concat([songs[:, :1], songs[:, 1:] - MEL_PREEMPHASIS * songs[:, :-1]], axis=1)
+            padding = (self._max_samples - 1) * MEL_FRAME_STEP + MEL_FRAME_LENGTH - self._record_samples
+            emphasized = tf.pad(emphasized, [[0, 0], [0, padding]])
+
+            indices = (MEL_FRAME_STEP * np.arange(self._max_samples)[:, np.newaxis] +
+                       np.arange(MEL_FRAME_LENGTH)[np.newaxis, :])
+            frames = tf.gather(emphasized, indices.astype(np.int32), axis=1)
+            spectrum = tf.spectral.rfft(frames, fft_length=[MEL_FFT_LENGTH])
+            power = tf.square(tf.abs(spectrum)) / MEL_FFT_LENGTH
+
+            mel = tf.tensordot(power, tf.constant(self._mel_matrix, name='mel_matrix'), axes=1)
+            log_mel = tf.log(tf.maximum(mel, MEL_FLOOR))
+        return log_mel
+
     # Reduce samples as needed
     def sample_prep(self, songs):
         """Songs' samples preparation (if needed).
@@ -186,28 +753,286 @@ class DataProvider(object):
                 clipped_songs = tf.slice(songs, [0, start_red, 0], [-1, num_samples, -1])
         return clipped_songs
 
+    # tf.data pipeline
+    def dataset_batch(self, prepare, read_size, block_length=1):
+        """Function to provide batches with a tf.data pipeline.
+
+        Records are interleaved from a number of files in parallel,
+        parsed and prepared in parallel in groups of read_size,
+        shuffled, batched and prefetched.
+
+        :param prepare: Function preparing the songs and tags from
+            the parsed records
+        :param read_size: Number of records prepared together
+        :param block_length: Consecutive records taken from a file,
+            so that the windows of a song are kept together
+        :return: Batch of songs and tags
+        """
+        with tf.name_scope('InputDataset'):
+            if self._sources is None:
+                records = self.dataset_records(self._filenames, block_length)
+            else:
+                # Sample the sources by weight, keeping the windows
+                # of a song together
+                sources = [self.dataset_records(files, block_length).batch(block_length)
+                           for files, _ in self._sources]
+                weights = [weight for _, weight in self._sources]
+                records = tf.contrib.data.sample_from_datasets(sources, [weight / sum(weights) for weight in weights])
+                records = records.flat_map(tf.data.Dataset.from_tensor_slices)
+
+            dataset = records.batch(read_size)
+            dataset = dataset.map(lambda serialized: prepare(self.parse(serialized)),
+                                  num_parallel_calls=multiprocessing.cpu_count())
+            dataset = dataset.flat_map(lambda songs, tags: tf.data.Dataset.from_tensor_slices((songs, tags)))
+
+            # Shuffled training batches hold exactly batch_size songs,
+            # unshuffled ones keep the last partial batch of the split
+            if self._shuffle:
+                _, min_after_dequeue = self.shuffle_size(dataset.output_shapes)
+                dataset = dataset.shuffle(min_after_dequeue + self._batch_size)
+                dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(self._batch_size))
+            else:
+                dataset = dataset.batch(self._batch_size)
+
+            dataset = dataset.prefetch(self._prefetch_batches)
+            iterator = dataset.make_one_shot_iterator()
+            features, labels = self.timed_dequeue(iterator.get_next)
+        return features, labels
+
+    # Random batches
+    def synthetic_batch(self, windows=False):
+        """Function to provide a random batch with the shapes and
+        types of the prepared songs and tags, generated once and
+        repeated with tf.data (TensorFlow 1.5 or later).
+
+        An epoch has as many batches as the split in the metadata,
+        the batches are repeated indefinitely if the number of epochs
+        or of songs in the split is not known.
+
+        :param windows: Whether windowed songs are needed
+        :return: Batch of songs and tags
+        """
+        if windows:
+            example_shape = [WINDOWS_PER_SONG, self._max_samples]
+        elif self._num_excerpts is not None:
+            example_shape = [self._excerpt_length]
+        elif self._num_samples is None or self._num_samples == -1:
+            example_shape = [self._max_samples]
+        else:
+            example_shape = [min(self._num_samples, self._max_samples)]
+        if self._sample_depth != 1:
+            example_shape.append(self._sample_depth)
+        num_tags = self._num_tags or self._max_tags
+
+        count = None
+        if self._num_epochs is not None and self._num_examples is not None:
+            count = self._num_epochs * max(self._num_examples // self._batch_size, 1)
+
+        def random_batch(_):
+            songs = tf.random_uniform([self._batch_size] + example_shape, -1.0, 1.0)
+            tags = tf.cast(tf.random_uniform([self._batch_size, num_tags]) < 0.5, tf.float32)
+            return songs, tags
+
+        with tf.name_scope('SyntheticData'):
+            dataset = tf.data.Dataset.from_tensors(0).map(random_batch).cache().repeat(count)
+            dataset = dataset.prefetch(self._prefetch_batches)
+            iterator = dataset.make_one_shot_iterator()
+            features, labels = self.timed_dequeue(iterator.get_next)
+        return features, labels
+
+    # Cut windows from full clips
+    def window(self, songs):
+        """Function to cut windows from a batch of full clips with
+        a single gather of the window sample indices.
+
+        :param songs: Batch of songs
+        :return: Batch of songs with dim1 being window dim
+        """
+        with tf.name_scope('Windowing'):
+            num_samples = songs.get_shape()[1].value
+            window_length = self._window_length or num_samples // self._window_count
+            window_hop = self._window_hop or window_length
+            if (self._window_count - 1) * window_hop + window_length > num_samples:
+                raise ValueError('{} windows of {} with hop {} longer than the {} samples of the songs'.format(
+                    self._window_count, window_length, window_hop, num_samples))
+
+            indices = (window_hop * np.arange(self._window_count)[:, np.newaxis] +
+                       np.arange(window_length)[np.newaxis, :])
+            windows = tf.gather(songs, indices.astype(np.int32), axis=1)
+        return windows
+
+    # Fold windows into the batch
+    def fold_windows(self, windows, tags):
+        """Function to make every window an example of the batch,
+        with the tags of its song.
+
+        :param windows: Batch of songs with dim1 being window dim
+        :param tags: Tags of the songs
+        :return: Batch of windows and their tags
+        """
+        with tf.name_scope('FoldWindows'):
+            window_shape = windows.get_shape()[2:].as_list()
+            features = tf.reshape(windows, [-1] + window_shape)
+            labels = self.repeat_tags(tags, self._window_count)
+        return features, labels
+
+    # Draw random excerpts
+    def random_excerpts(self, songs, tags):
+        """Function to draw random excerpts from every song with a
+        single gather of the excerpt sample indices. Every excerpt is
+        an example with the tags of its song.
+
+        :param songs: Decoded songs
+        :param tags: Tags of the songs
+        :return: Excerpts and their tags
+        """
+        with tf.name_scope('RandomExcerpts'):
+            if self._excerpt_length > self._max_samples:
+                raise ValueError('Excerpts of {} longer than the {} samples of the songs'.format(
+                    self._excerpt_length, self._max_samples))
+
+            # Indices in the songs flattened along the samples
+            num_songs = tf.shape(songs)[0]
+            starts = tf.random_uniform([num_songs, self._num_excerpts], 0,
+                                       self._max_samples - self._excerpt_length + 1, dtype=tf.int32)
+            starts += tf.expand_dims(tf.range(num_songs) * self._max_samples, 1)
+            indices = tf.reshape(starts, [-1, 1]) + tf.range(self._excerpt_length)
+
+            if self._sample_depth == 1:
+                flat_songs = tf.reshape(songs, [-1])
+            else:
+                flat_songs = tf.reshape(songs, [-1, self._sample_depth])
+            excerpts = tf.gather(flat_songs, indices)
+            excerpt_tags = self.repeat_tags(tags, self._num_excerpts)
+        return excerpts, excerpt_tags
+
+    # Repeat the tags of every song
+    @staticmethod
+    def repeat_tags(tags, count):
+        """Function to repeat the tags of every song for the
+        examples cut from it.
+
+        :param tags: Tags of the songs
+        :param count: Examples cut from every song
+        :return: Tags of the examples
+        """
+        return tf.reshape(tf.tile(tf.expand_dims(tags, 1), [1, count, 1]),
+                          [-1, tags.get_shape()[-1].value])
+
+    # Records of a list of files
+    def dataset_records(self, filenames, block_length=1):
+        """Function to interleave the records of a number of files
+        read in parallel.
+
+        :param filenames: Files to read
+        :param block_length: Consecutive records taken from a file
+        :return: Dataset of serialized records
+        """
+        files = tf.data.Dataset.from_tensor_slices(filenames)
+        if self._shuffle:
+            files = files.shuffle(len(filenames))
+        files = files.repeat(self._num_epochs)
+        if self._shard_cache is not None:
+            files = files.map(self._shard_cache.cached_filename)
+
+        # Workers sharing files whose records have no song index keep
+        # every num_workers-th song of every file
+        read_file = tf.data.TFRecordDataset
+        if self._record_shard is not None:
+            worker_index, num_workers = self._record_shard
+            read_file = lambda filename: tf.data.TFRecordDataset(filename).batch(block_length).shard(
+                num_workers, worker_index).flat_map(tf.data.Dataset.from_tensor_slices)
+
+        records = files.apply(tf.contrib.data.parallel_interleave(
+            read_file,
+            cycle_length=min(self._num_readers, len(filenames)),
+            block_length=block_length,
+            sloppy=self._shuffle))
+        return records
+
     # Batch songs and queue
-    def batch(self, songs, tags):
-        """Shuffelling, queuing and batching function.
+    def batch(self, prepared):
+        """Shuffelling, queuing and batching function. Every
+        shuffled batch has exactly batch_size songs, unshuffled
+        batches keep the last partial batch once the files are read.
 
-        :param songs: Songs to be shuffled and queued
-        :param tags: Tags to be shuffled and queued
+        :param prepared: List with the songs and tags to be shuffled
+            and queued from every reader
         :return: Batch of songs and tags
         """
         # Batch and enqueue
         with tf.name_scope('Shuffle'):
+            songs, tags = prepared[0]
+            shapes = [songs.get_shape()[1:], tags.get_shape()[1:]]
             if self._shuffle:
-                features, labels = tf.train.shuffle_batch(
-                    [songs, tags],
-                    batch_size=self._batch_size,
-                    capacity=self._batch_size*5,
-                    num_threads=multiprocessing.cpu_count(),
-                    enqueue_many=True,
-                    min_after_dequeue=self._batch_size)
+                capacity, min_after_dequeue = self.shuffle_size(shapes)
+                queue = tf.RandomShuffleQueue(capacity, min_after_dequeue, [tf.float32, tf.float32],
+                                              shapes=shapes, name='shuffle_queue')
+                num_threads = multiprocessing.cpu_count()
             else:
-                features, labels = songs, tags
+                capacity = self._batch_size*2
+                queue = tf.FIFOQueue(capacity, [tf.float32, tf.float32], shapes=shapes, name='batch_queue')
+                num_threads = 1
+
+            enqueue_ops = [queue.enqueue_many(list(reader_data)) for reader_data in prepared]
+            num_threads = max(num_threads, len(enqueue_ops))
+            tf.train.add_queue_runner(tf.train.QueueRunner(
+                queue, [enqueue_ops[thread % len(enqueue_ops)] for thread in range(num_threads)]))
+
+            self.queue_size = queue.size()
+            self.queue_capacity = capacity
+            tf.summary.scalar('queue_fraction_full', tf.cast(self.queue_size, tf.float32) / capacity)
+            if self._shuffle:
+                dequeue = lambda: queue.dequeue_many(self._batch_size)
+            else:
+                dequeue = lambda: queue.dequeue_up_to(self._batch_size)
+            features, labels = self.timed_dequeue(dequeue)
         return features, labels
 
+    # Time the wait for a batch
+    def timed_dequeue(self, dequeue):
+        """Function to dequeue a batch and measure the time waited
+        for it, which is exported as a summary.
+
+        :param dequeue: Function dequeuing a batch
+        :return: Batch of songs and tags
+        """
+        start = tf.py_func(time.time, [], tf.float64, stateful=True, name='dequeue_start')
+        with tf.control_dependencies([start]):
+            features, labels = dequeue()
+        with tf.control_dependencies([features, labels]):
+            end = tf.py_func(time.time, [], tf.float64, stateful=True, name='dequeue_end')
+        self.dequeue_wait = tf.cast(end - start, tf.float32)
+        tf.summary.scalar('dequeue_wait_ms', self.dequeue_wait * 1000)
+        return features, labels
+
+    # Shuffle buffer size from the memory budget
+    def shuffle_size(self, example_shapes):
+        """Function to size the shuffle buffer from the memory
+        budget and the size of a prepared example, and log the
+        effective mixing window.
+
+        :param example_shapes: Shapes of the song and tags of an example
+        :return: Capacity and minimum after dequeue of the buffer
+        """
+        example_size = sum(shape.num_elements() or 0 for shape in example_shapes)
+        if self._shuffle_buffer_mb is None or not example_size:
+            capacity, min_after_dequeue = self._batch_size*5, self._batch_size
+        else:
+            example_bytes = example_size * BYTES_PER_VALUE
+            capacity = max(int(self._shuffle_buffer_mb * 2**20 // example_bytes), 2*self._batch_size)
+            min_after_dequeue = capacity - self._batch_size
+
+        # Every example is drawn from the examples left after dequeue
+        # together with the ones of the batch being dequeued
+        self.mixing_window = min_after_dequeue + self._batch_size
+        message = 'Shuffle buffer of {} examples ({:.1f} MB), mixing window of {} examples'.format(
+            capacity, capacity * example_size * BYTES_PER_VALUE / 2.0**20, self.mixing_window)
+        if self._num_examples:
+            message += ' ({:.1%} of the split)'.format(min(1.0, self.mixing_window / float(self._num_examples)))
+        tf.logging.info(message)
+        return capacity, min_after_dequeue
+
     # Transpose for window index before batch
     def transpose_for_mapfn(self, songs):
         """Function to put window number prior to batch for
@@ -245,20 +1070,132 @@ class DataProvider(object):
             feats = tf.expand_dims(songs, axis=axis)
         return feats
 
-    # Strip to top 50 tags
-    @staticmethod
-    def tag_prep(tags, shrink):
-        """Clip tags to top 50.
+    # Strip to top N tags
+    def tag_prep(self, tags, shrink):
+        """Clip tags to the top N tags, or project them on the
+        selected tags.
 
-        __FUTURE__ clip tags to specified amount
+        Tags are sorted by frequency, hence the top N tags are
+        the first N. Bit-packed tags are unpacked in a single
+        vectorized op from the bytes holding the first N bits.
+        Selected tags are taken with a single gather of their
+        precomputed columns.
 
         :param tags: Tags to be clipped
-        :return: Top 50 tags
+        :param shrink: Number of top tags to keep
+        :return: Top N tags
         """
         with tf.name_scope('TagPrep'):
-            clipped_tags = tf.slice(tags, [0, 0], [-1, shrink])
+            if self._tag_columns is not None:
+                if self._tag_encoding == PACKED_TAGS:
+                    tags = self.unpack_bits(tags, max(self._tag_columns) + 1)
+                clipped_tags = tf.gather(tags, self._tag_columns, axis=1)
+            else:
+                if self._tag_encoding == PACKED_TAGS:
+                    tags = self.unpack_bits(tags, shrink)
+                clipped_tags = tf.slice(tags, [0, 0], [-1, shrink])
         return clipped_tags
 
+    # Unpack bit-packed tags
+    @staticmethod
+    def unpack_bits(packed_tags, num_tags):
+        """Unpack the bytes holding the first N bit-packed tags in
+        a single vectorized op.
+
+        :param packed_tags: Bit-packed tags (uint8)
+        :param num_tags: Number of tags needed
+        :return: Multi-hot tags, with the bits up to a full byte
+        """
+        num_bytes = -(-num_tags // 8)
+        packed_tags = tf.cast(tf.slice(packed_tags, [0, 0], [-1, num_bytes]), tf.int32)
+        bit_values = tf.constant([128, 64, 32, 16, 8, 4, 2, 1], dtype=tf.int32)
+        bits = tf.floormod(tf.floordiv(tf.expand_dims(packed_tags, -1), bit_values), 2)
+        return tf.cast(tf.reshape(bits, [-1, num_bytes * 8]), tf.float32)
+
+    # Tag frequencies to acceptance rates
+    def tag_acceptance(self, metadata, tag_balance, fold=None):
+        """Function to compute the rate at which songs with every
+        tag are accepted by the tag balancing, from the number of
+        songs of the training split with every tag, so that the
+        held-out songs do not change the rates.
+
+        With index splits the songs of the training split, or of
+        the training folds, with every tag are counted from the
+        indices of the songs with every tag saved in the metadata.
+
+        The rarest tag is always accepted and a tag n times more
+        frequent is accepted at a rate of (1/n)**tag_balance.
+
+        :param metadata: Metadata dictionary of the dataset
+        :param tag_balance: Strength of the balancing between 0 and 1
+        :param fold: Cross-validation fold held out for validation
+        :return: Acceptance rate of every tag in the targets
+        """
+        if not 0 < tag_balance <= 1:
+            raise ValueError('Tag balance {} not between 0 and 1'.format(tag_balance))
+        splits = metadata.get('splits', {})
+        if 'index_splits' in metadata:
+            tag_songs = splits.get('all', {}).get('tag_songs')
+            if not tag_songs:
+                raise ValueError('Metadata has no songs per tag for tag balancing, the dataset needs to be '
+                                 're-extracted')
+            members = self.split_members(metadata, 'train', fold)
+            counts = [len(members.intersection(indices)) for indices in tag_songs]
+        else:
+            counts = splits.get('train', {}).get('tag_counts')
+            if not counts:
+                raise ValueError('Metadata has no tag counts of the train split for tag balancing, the dataset '
+                                 'needs to be re-extracted')
+
+        counts = np.asarray(counts, dtype=np.float64)
+        if self._tag_columns is not None:
+            counts = counts[self._tag_columns]
+        else:
+            counts = counts[:self._num_tags or self._max_tags]
+        counts = np.maximum(counts, 1)
+        acceptance = np.power(np.min(counts) / counts, tag_balance)
+        tf.logging.info('Tag balancing accepts songs at rates between {:.3f} and 1'.format(np.min(acceptance)))
+        return acceptance.astype(np.float32)
+
+    # Rejection resampling by the rarest tag
+    def balance_tags(self, songs, tags):
+        """Function to keep songs at the acceptance rate of their
+        rarest tag, so that rare tags are seen at a controlled rate.
+        Untagged songs are accepted at the lowest rate.
+
+        :param songs: Songs in batch
+        :param tags: Tags in batch
+        :return: Batch with the accepted songs
+        """
+        with tf.name_scope('BalanceTags'):
+            acceptance = tf.constant(self._tag_acceptance, name='tag_acceptance')
+            song_acceptance = tf.reduce_max(tags * acceptance, axis=1)
+            song_acceptance = tf.maximum(song_acceptance, float(np.min(self._tag_acceptance)))
+            where = tf.random_uniform(tf.shape(song_acceptance)) < song_acceptance
+            indices = tf.squeeze(tf.where(where), axis=1, name='accepted_indices')
+            balanced_songs = tf.gather(songs, indices, name='song_balancing')
+            balanced_tags = tf.gather(tags, indices, name='tags_balancing')
+        return balanced_songs, balanced_tags
+
+    # Reuse examples when input bound
+    def echo(self, songs, tags):
+        """Function to repeat every example echo_count times before
+        the examples are shuffled, so that the reused examples are
+        spread over different batches. The count is read every time
+        the examples are prepared, so that it can change during
+        training.
+
+        :param songs: Songs in batch
+        :param tags: Tags in batch
+        :return: Batch with every song and its tags repeated
+        """
+        with tf.name_scope('Echo'):
+            count = tf.py_func(lambda: np.int32(self.echo_count), [], tf.int32, stateful=True, name='echo_count')
+            indices = tf.tile(tf.range(tf.shape(tags)[0]), tf.reshape(count, [1]), name='echo_indices')
+            echoed_songs = tf.gather(songs, indices, name='song_echo')
+            echoed_tags = tf.gather(tags, indices, name='tags_echo')
+        return echoed_songs, echoed_tags
+
     # Function to remove all samples that have all zeros in tags
     @staticmethod
     def remove_unused(songs, tags):
@@ -277,19 +1214,514 @@ class DataProvider(object):
         return filtered_songs, filtered_tags
 
     # Normalize function for features between -1 and 1
-    @staticmethod
-    def normalize(songs):
-        """Function to batch normalize the songs.
+    def normalize(self, songs):
+        """Function to normalize the songs, either by the batch
+        maximum or by the constant dataset maximum in the metadata.
 
         :param songs: Batch of songs to be normalized
         :return: Normalized batch
         """
         with tf.name_scope('InputNormalization'):
-            scale_max = tf.reduce_max(songs)
-            scale_min = tf.reduce_min(songs)
-            factor = tf.maximum(scale_max, scale_min)
+            if self._normalization == DATASET_NORM:
+                factor = tf.constant(self._norm_factor, dtype=tf.float32)
+            else:
+                scale_max = tf.reduce_max(songs)
+                scale_min = tf.reduce_min(songs)
+                factor = tf.maximum(scale_max, scale_min)
             norm_song = tf.div(songs, factor)
         return norm_song
 
 
+def stage_towers(features, labels, devices):
+    """Stage the batch of every tower on its device, so that the
+    next batch is copied while the current step computes. Every
+    step gets the batch staged by the previous step, the staging
+    op needs to run with the training op and once before the first
+    step (StagingHook).
+
+    :param features: List of the features of every tower
+    :param labels: List of the labels of every tower
+    :param devices: Device of every tower, GPUs or virtual CPUs
+    :return: Staged features and labels of every tower and the op
+        staging the next batches
+    """
+    staged_features, staged_labels, stage_ops = [], [], []
+    with tf.name_scope('TowerStaging'):
+        for tower_features, tower_labels, device in zip(features, labels, devices):
+            with tf.device(device):
+                area = tf.contrib.staging.StagingArea(
+                    dtypes=[tower_features.dtype, tower_labels.dtype],
+                    shapes=[tower_features.get_shape(), tower_labels.get_shape()])
+                stage_ops.append(area.put([tower_features, tower_labels]))
+                tower_features, tower_labels = area.get()
+            staged_features.append(tower_features)
+            staged_labels.append(tower_labels)
+    return staged_features, staged_labels, tf.group(*stage_ops, name='stage_towers')
+
+
+class ShardCache(object):
+
+    def __init__(self, cache_dir, max_size_mb=None, copy_threads=2):
+        """Class to cache the files read, such as tfrecord shards on
+        GCS, in a local directory. A file not yet cached is read from
+        its location while it is copied in the background, later
+        epochs and evaluations read the local copy.
+
+        Copies are checked against the size of the original and the
+        md5 checksum of the GCS object, or of the bytes read for other
+        files and without the google-cloud-storage package, which is
+        saved next to them. A cached file is validated against it in
+        the background before its first use, read from its location
+        until then.
+
+        Once the cache is full, files not cached are read from their
+        location and no file is evicted, as the locations already
+        handed to the readers have to stay readable.
+
+        :param cache_dir: Local directory of the cache, such as a
+            directory on a local SSD
+        :param max_size_mb: Maximum size of the cache in MB. If None,
+            every file read is cached
+        :param copy_threads: Files copied or validated at the same time
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = None if max_size_mb is None else int(max_size_mb * 2**20)
+        self._lock = threading.Lock()
+        self._copy_slots = threading.Semaphore(copy_threads)
+        self._copying = set()
+        self._validated = set()
+        self._failed = set()
+        self._originals = {}
+
+        file_io.recursive_create_dir(cache_dir)
+        self._used_bytes = 0
+        for name in file_io.list_directory(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if name.endswith('.tmp'):
+                file_io.delete_file(path)
+            elif not name.endswith('.md5'):
+                self._used_bytes += file_io.stat(path).length
+
+    def local_path(self, filename):
+        """Path of the cached copy of a file, named after a hash of
+        its location so that files with the same name do not clash.
+
+        :param filename: Location of the file
+        :return: Path in the cache directory
+        """
+        key = hashlib.md5(filename.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self._cache_dir, '{}-{}'.format(key, os.path.basename(filename)))
+
+    def resolve(self, filename):
+        """Location to read a file from, its cached copy if validated.
+        Otherwise the copy is validated, or made, in the background
+        and the original location is returned.
+
+        :param filename: Location of the file
+        :return: Location to read
+        """
+        if isinstance(filename, bytes):
+            filename = filename.decode('utf-8')
+        local = self.local_path(filename)
+
+        with self._lock:
+            if local in self._validated:
+                self._originals[local] = filename
+                return local
+            if local in self._copying or filename in self._failed:
+                return filename
+            self._copying.add(local)
+
+        thread = threading.Thread(target=self.fill, args=(filename, local))
+        thread.daemon = True
+        thread.start()
+        return filename
+
+    def fill(self, filename, local):
+        """Validate the cached copy of a file, copying the file if
+        the copy is missing or invalid.
+
+        :param filename: Location of the file
+        :param local: Path of the copy in the cache
+        """
+        try:
+            with self._copy_slots:
+                if file_io.file_exists(local):
+                    if self.validate(filename, local):
+                        with self._lock:
+                            self._validated.add(local)
+                        return
+                    self.evict(local)
+                self.copy(filename, local)
+        except Exception as error:
+            tf.logging.warn('Could not cache {}: {}'.format(filename, error))
+            with self._lock:
+                self._failed.add(filename)
+        finally:
+            with self._lock:
+                self._copying.discard(local)
+
+    def copy(self, filename, local):
+        """Copy a file to the cache, writing its checksum once the
+        copy is complete and checked.
+
+        :param filename: Location of the file
+        :param local: Path of the copy in the cache
+        """
+        size = file_io.stat(filename).length
+        with self._lock:
+            if self._max_bytes is not None and self._used_bytes + size > self._max_bytes:
+                tf.logging.warn('Shard cache full, reading {} from its location'.format(filename))
+                self._failed.add(filename)
+                return
+            self._used_bytes += size
+
+        temporary = local + '.tmp'
+        try:
+            read_checksum = hashlib.md5()
+            with file_io.FileIO(filename, 'rb') as source, file_io.FileIO(temporary, 'wb') as target:
+                while True:
+                    chunk = source.read(COPY_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    read_checksum.update(chunk)
+                    target.write(chunk)
+            if file_io.stat(temporary).length != size:
+                raise IOError('Copy of {} is incomplete'.format(filename))
+
+            remote = self.remote_md5(filename)
+            expected = remote or read_checksum.hexdigest()
+            if self.checksum(temporary) != expected:
+                raise IOError('Copy of {} does not match its md5 checksum'.format(filename))
+            file_io.write_string_to_file(local + '.md5', expected)
+            file_io.rename(temporary, local, overwrite=True)
+        except Exception:
+            if file_io.file_exists(temporary):
+                file_io.delete_file(temporary)
+            with self._lock:
+                self._used_bytes -= size
+            raise
+
+        with self._lock:
+            self._validated.add(local)
+        tf.logging.info('Cached {}, checked against the md5 of {}'.format(
+            filename, 'the object' if remote else 'the bytes read'))
+
+    @staticmethod
+    def remote_md5(filename):
+        """md5 checksum of a GCS object, from its metadata.
+
+        :param filename: Location of the file
+        :return: Hexadecimal md5 checksum, or None for other files,
+            composite objects and without the google-cloud-storage
+            package
+        """
+        if not filename.startswith('gs://'):
+            return None
+        try:
+            from google.cloud import storage
+        except ImportError:
+            return None
+        bucket, _, name = filename[len('gs://'):].partition('/')
+        blob = storage.Client().bucket(bucket).get_blob(name)
+        if blob is None or not blob.md5_hash:
+            return None
+        return binascii.hexlify(base64.b64decode(blob.md5_hash)).decode('ascii')
+
+    @staticmethod
+    def checksum(path):
+        """md5 checksum of a file.
+
+        :param path: Path of the file
+        :return: Hexadecimal md5 checksum
+        """
+        checksum = hashlib.md5()
+        with file_io.FileIO(path, 'rb') as f:
+            while True:
+                chunk = f.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                checksum.update(chunk)
+        return checksum.hexdigest()
+
+    def validate(self, filename, local):
+        """Check a cached file against its saved md5 checksum, and
+        the saved checksum against the GCS object if it changed.
+
+        :param filename: Location of the file
+        :param local: Path of the copy in the cache
+        :return: Whether the copy is valid
+        """
+        if not file_io.file_exists(local + '.md5'):
+            return False
+        saved = file_io.read_file_to_string(local + '.md5').strip()
+        remote = self.remote_md5(filename)
+        if remote is not None and remote != saved:
+            return False
+        return self.checksum(local) == saved
+
+    def evict(self, local):
+        """Remove an invalid copy and its checksum from the cache.
+
+        :param local: Path of the copy in the cache
+        """
+        tf.logging.warn('Removing invalid cached file {}'.format(local))
+        with self._lock:
+            self._used_bytes -= file_io.stat(local).length
+        file_io.delete_file(local)
+        if file_io.file_exists(local + '.md5'):
+            file_io.delete_file(local + '.md5')
+
+    def cached_filename(self, filename):
+        """Map a filename tensor to the location to read.
+
+        :param filename: Scalar string tensor
+        :return: Scalar string tensor of the location to read
+        """
+        location = tf.py_func(lambda name: self.resolve(name).encode('utf-8'), [filename], tf.string,
+                              stateful=True, name='ShardCache')
+        location.set_shape([])
+        return location
+
+    def original_keys(self, keys):
+        """Map the keys of the records read by a TFRecordReader,
+        file:offset, from the cached copies to the original files.
+
+        :param keys: String tensor of the keys
+        :return: String tensor of the keys with the original files
+        """
+        def original(keys):
+            originals = []
+            for key in keys:
+                location, _, offset = key.decode('utf-8').rpartition(':')
+                originals.append('{}:{}'.format(self._originals.get(location, location), offset).encode('utf-8'))
+            return np.array(originals, dtype=object)
+
+        original_keys = tf.py_func(original, [keys], tf.string, stateful=False, name='OriginalKeys')
+        original_keys.set_shape(keys.get_shape())
+        return original_keys
+
+    def cached_queue(self, filename_queue, capacity=32):
+        """Queue of the locations to read the files of a filename
+        queue from, filled by a queue runner.
+
+        :param filename_queue: Queue of the filenames
+        :param capacity: Capacity of the queue
+        :return: Queue of the locations to read
+        """
+        with tf.name_scope('ShardCache'):
+            queue = tf.FIFOQueue(capacity, tf.string, shapes=[[]], name='cached_filenames')
+            enqueue = queue.enqueue(self.cached_filename(filename_queue.dequeue()))
+            tf.train.add_queue_runner(tf.train.QueueRunner(queue, [enqueue]))
+        return queue
+
+
+class EvalDataCache(object):
+
+    def __init__(self, data_provider, windows=False, num_epochs=1):
+        """Class to decode the evaluation split once into host
+        memory and provide the batches of every later evaluation
+        from memory. Songs are kept as float16 and tags bit-packed.
+
+        The data provider should read one epoch without shuffling,
+        so that every example of the split is loaded once. The models
+        needing batches of a static size, the last batch is completed
+        with the first examples of the split.
+
+        :param data_provider: Data provider of the evaluation split
+        :param windows: Whether the records hold windowed songs
+        :param num_epochs: The number of epochs provided by every
+            evaluation. If None, and indefinite number is provided.
+        """
+        self._data_provider = data_provider
+        self._windows = windows
+        self._num_epochs = num_epochs
+        self._songs = None
+        self._tags = None
+
+        if data_provider._synthetic and (data_provider._num_epochs is None or data_provider._num_examples is None):
+            raise ValueError('Synthetic batches are repeated indefinitely without the number of epochs and of songs '
+                             'in the split, they cannot be cached')
+
+        with tf.name_scope('EvalDataCache'):
+            self._load_ops = data_provider.load_batch(windows)
+            songs, tags = self._load_ops
+            self._num_tags = int(tags.get_shape()[-1])
+            self._songs_input = tf.placeholder(tf.float16, shape=[None] + songs.get_shape().as_list()[1:],
+                                               name='songs')
+            self._tags_input = tf.placeholder(tf.uint8, shape=[None, -(-self._num_tags // 8)], name='tags')
+
+    def batch_in(self):
+        """Function to provide the batches of the cached split.
+
+        :returns: Features and Labels of a batch
+        """
+        data_provider = self._data_provider
+        with tf.name_scope('EvalDataCache'):
+            dataset = tf.data.Dataset.from_tensor_slices((self._songs_input, self._tags_input))
+            dataset = dataset.repeat(self._num_epochs)
+            dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(data_provider._batch_size))
+            dataset = dataset.prefetch(1)
+
+            self._iterator = dataset.make_initializable_iterator()
+            songs, packed_tags = self._iterator.get_next()
+            songs = tf.cast(songs, tf.float32)
+            tags = tf.slice(data_provider.unpack_bits(packed_tags, self._num_tags), [0, 0], [-1, self._num_tags])
+            features, labels = data_provider.output(songs, tags, windows=self._windows)
+
+        # Models flatten with the static batch size
+        for batch in features if isinstance(features, list) else [features]:
+            if None in batch.get_shape().as_list():
+                raise ValueError('Cached evaluation batches of shape {} are not static'.format(batch.get_shape()))
+        return features, labels
+
+    def initialize(self, session, coord):
+        """Load the split on the first call and initialize the
+        batches from memory.
+
+        :param session: Session of the evaluation graph
+        :param coord: Coordinator of the queue runner threads
+        """
+        if self._songs is None:
+            self.load(session, coord)
+        session.run(self._iterator.initializer,
+                    feed_dict={self._songs_input: self._songs, self._tags_input: self._tags})
+
+    def load(self, session, coord):
+        """Read and decode the whole split into host memory.
+
+        :param session: Session of the evaluation graph
+        :param coord: Coordinator of the queue runner threads
+        """
+        if self._data_provider._backend == QUEUE_BACKEND:
+            tf.train.start_queue_runners(coord=coord, sess=session)
+
+        songs, tags = [], []
+        try:
+            while True:
+                loaded_songs, loaded_tags = session.run(self._load_ops)
+                songs.append(loaded_songs.astype(np.float16))
+                tags.append(np.packbits(loaded_tags != 0, axis=1))
+        except tf.errors.OutOfRangeError:
+            pass
+
+        self._songs = np.concatenate(songs)
+        self._tags = np.concatenate(tags)
+        num_examples = self._songs.shape[0]
+
+        # Models need batches of a static size, hence the last batch
+        # is completed with the first examples of the split
+        batch_size = self._data_provider._batch_size
+        if num_examples % batch_size:
+            indices = np.arange(num_examples + batch_size - num_examples % batch_size) % num_examples
+            self._songs = self._songs[indices]
+            self._tags = self._tags[indices]
+
+        tf.logging.info('Cached {} evaluation examples ({:.1f} MB)'.format(
+            num_examples, (self._songs.nbytes + self._tags.nbytes) / 2.0**20))
+
+
+class InputMonitorHook(tf.train.SessionRunHook):
+
+    def __init__(self, data_provider, every_n_steps=100, stall_fraction=0.5, stall_intervals=3, resume_fraction=0.05):
+        """Hook logging the queue occupancy, the time waited for
+        the batches and the examples per second of a data provider,
+        and warning of sustained input stalls.
+
+        :param data_provider: Data provider whose batches are built
+        :param every_n_steps: Steps between logs
+        :param stall_fraction: Fraction of the step time waiting for
+            the input above which an interval is stalled
+        :param stall_intervals: Consecutive stalled intervals before
+            warning of an input stall
+        :param resume_fraction: Fraction of the step time waiting for
+            the input below which an interval is fed
+
+        With automatic echoing, the examples of the data provider are
+        echoed after stall_intervals consecutive stalled intervals, and
+        used once again after stall_intervals consecutive fed intervals.
+        Echoing hides the stall, so the fed intervals only show that
+        the input may keep up, which the intervals without echo check.
+        """
+        self._data_provider = data_provider
+        self._every_n_steps = every_n_steps
+        self._stall_fraction = stall_fraction
+        self._stall_intervals = stall_intervals
+        self._resume_fraction = resume_fraction
+        self._stalled = 0
+        self._fed = 0
+        self._reset()
+
+    def _reset(self):
+        self._steps = 0
+        self._examples = 0
+        self._wait = 0.0
+        self._step_time = 0.0
+        self._queue_size = 0
+
+    def before_run(self, run_context):
+        self._start = time.time()
+        fetches = {'wait': self._data_provider.dequeue_wait}
+        if self._data_provider.queue_size is not None:
+            fetches['queue_size'] = self._data_provider.queue_size
+        return tf.train.SessionRunArgs(fetches)
+
+    def after_run(self, run_context, run_values):
+        results = run_values.results
+        self._steps += 1
+        self._examples += self._data_provider._batch_size
+        self._wait += results['wait']
+        self._step_time += time.time() - self._start
+        self._queue_size += results.get('queue_size', 0)
+
+        if self._steps >= self._every_n_steps:
+            self._log()
+            self._reset()
+
+    def _log(self):
+        """Log the statistics of the interval as json and warn if
+        the input stalled for the last intervals."""
+        wait_fraction = self._wait / max(self._step_time, 1e-9)
+        stats = {
+            'steps': self._steps,
+            'examples_per_sec': self._examples / max(self._step_time, 1e-9),
+            'dequeue_wait_ms': self._wait / self._steps * 1000,
+            'wait_fraction': wait_fraction
+        }
+        if self._data_provider.queue_size is not None:
+            stats['queue_fraction_full'] = self._queue_size / float(self._steps * self._data_provider.queue_capacity)
+        if self._data_provider._echo_factor:
+            stats['echo_count'] = self._data_provider.echo_count
+        tf.logging.info('Input: {}'.format(json.dumps(stats, sort_keys=True)))
+
+        self._stalled = self._stalled + 1 if wait_fraction > self._stall_fraction else 0
+        self._fed = self._fed + 1 if wait_fraction < self._resume_fraction else 0
+        if self._stalled >= self._stall_intervals:
+            tf.logging.warning('Input stall: {:.0%} of the step time waiting for batches over the last {} steps, '
+                               'add reader threads or use a faster data format'.format(
+                                   wait_fraction, self._stalled * self._every_n_steps))
+
+        if self._data_provider._auto_echo:
+            echo_count = self._data_provider.echo_count
+            if self._stalled >= self._stall_intervals:
+                echo_count = self._data_provider._echo_factor
+            elif self._fed >= self._stall_intervals:
+                echo_count = 1
+            if echo_count != self._data_provider.echo_count:
+                tf.logging.info('Input echo count set to {}'.format(echo_count))
+                self._data_provider.echo_count = echo_count
+                self._stalled, self._fed = 0, 0
+
+
+class StagingHook(tf.train.SessionRunHook):
+
+    def __init__(self, stage_op):
+        """Hook staging the first batches of the towers once the
+        session is created and the queue runners are started.
+
+        :param stage_op: Op staging the batches (stage_towers)
+        """
+        self._stage_op = stage_op
 
+    def after_create_session(self, session, coord):
+        session.run(self._stage_op)
@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""Declarative specs of the sample-level models and their static cost.
+
+    A spec is the list of the layers of a model, from the samples to the
+    output layer, which build_spec of models turns into a graph with
+    the variable names of the former hand-written models, so that their
+    checkpoints still restore. Nested lists are sequences of layers.
+
+    The cost of a spec (parameters, FLOPs per example, activation memory
+    and output size of every layer) is computed from the shapes alone,
+    without TensorFlow, so that oversized configurations are rejected
+    before a job is submitted. Run from the cloud folder, for example:
+
+    python -m trainer.model_specs --model-functions dm16_ra mul16c --num-samples 38832
+        --batch-size 20 --max-activation-mb 4000
+"""
+
+import argparse
+import sys
+
+# Layer types
+CONV, MAX_POOL, AVG_POOL, BRANCHES = 'conv', 'max_pool', 'avg_pool', 'branches'
+DROPOUT, FLATTEN, DENSE = 'dropout', 'flatten', 'dense'
+
+# Activations of the dense layers
+SIGMOID, IDENTITY = 'sigmoid', 'identity'
+
+# Bytes of the float32 values
+FLOAT_BYTES = 4
+
+# Tensors kept for the backward pass of every convolution, the
+# outputs of the convolution, of batch normalization and of elu
+CONV_TENSORS = 3
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Layers
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+def conv(name, depth, length, stride=1, dil_rate=1):
+    """Convolution followed by batch normalization and elu, built with
+    SAME padding under the scope name.
+
+    Args:
+        name (str): Scope of the layer
+        depth (int): Number of filters
+        length (int): Length of the filters
+        stride (int): Stride of the filters
+        dil_rate (int): Dilation rate of the filters
+
+    Returns:
+        Layer of a spec
+    """
+    return {'type': CONV, 'name': name, 'depth': depth, 'length': length, 'stride': stride, 'dil_rate': dil_rate}
+
+
+def max_pool(name, length, stride):
+    """Max pooling with VALID padding."""
+    return {'type': MAX_POOL, 'name': name, 'length': length, 'stride': stride}
+
+
+def avg_pool(name, length, stride):
+    """Average pooling with VALID padding."""
+    return {'type': AVG_POOL, 'name': name, 'length': length, 'stride': stride}
+
+
+def conv_max(conv_name, depth, length, stride, pool_name, pool_length, pool_stride, dil_rate=1):
+    """Convolution followed by max pooling, as conv_max_layers_1d."""
+    return [conv(conv_name, depth, length, stride, dil_rate), max_pool(pool_name, pool_length, pool_stride)]
+
+
+def conv_avg(conv_name, depth, length, stride, pool_name, pool_length, pool_stride, dil_rate=1):
+    """Convolution followed by average pooling, as conv_avg_layers_1d."""
+    return [conv(conv_name, depth, length, stride, dil_rate), avg_pool(pool_name, pool_length, pool_stride)]
+
+
+def branches(name, *paths):
+    """Sequences of layers run on the same input, their outputs being
+    concatenated along the depth.
+
+    Args:
+        name (str): Name of the layer in the costs, the concatenation
+            is left unnamed in the graph
+        paths (list): Sequences of layers of every branch
+
+    Returns:
+        Layer of a spec
+    """
+    return {'type': BRANCHES, 'name': name, 'paths': list(paths)}
+
+
+def classifier(activation=SIGMOID):
+    """Dropout, flattening and the dense output layer FCL, whose size
+    is the number of tags in the targets.
+
+    Args:
+        activation (str): Activation of the output layer, sigmoid or identity
+
+    Returns:
+        Layers of a spec
+    """
+    return [{'type': DROPOUT, 'name': 'DROP'},
+            {'type': FLATTEN, 'name': 'FLTN'},
+            {'type': DENSE, 'name': 'FCL', 'units': None, 'activation': activation}]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Model specs
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+MODEL_SPECS = {
+    # Deeper Models similar to proposed by Lee et al.
+    # Structure: 7 Conv, 1 MLP
+    'dm8_ra': [
+        conv('CL1', 64, 8, 8),
+        conv_max('CL2', 64, 4, 1, 'MP1', 4, 4),
+        conv_max('CL3', 128, 4, 1, 'MP2', 4, 4),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 4, 4),
+        conv_max('CL6', 256, 4, 1, 'MP5', 2, 2),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    'dm16_ra': [
+        conv('CL1', 64, 16, 16),
+        conv_max('CL2', 64, 4, 1, 'MP1', 4, 4),
+        conv_max('CL3', 128, 4, 1, 'MP2', 4, 4),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 2, 2),
+        conv_max('CL6', 256, 4, 1, 'MP5', 2, 2),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    # Logits as outputs
+    'dm16_rb': [
+        conv('CL1', 64, 16, 16),
+        conv_max('CL2', 64, 4, 1, 'MP1', 4, 4),
+        conv_max('CL3', 128, 4, 1, 'MP2', 4, 4),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 2, 2),
+        conv_max('CL6', 256, 4, 1, 'MP5', 2, 2),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(IDENTITY),
+    ],
+    # Full clips of 465984 samples, pooling every 8 samples first
+    'dm16_rc': [
+        conv('CL1', 64, 16, 16),
+        conv_max('CL2', 64, 4, 1, 'MP1', 8, 8),
+        conv_max('CL3', 128, 4, 1, 'MP2', 8, 8),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 4, 4),
+        conv_max('CL6', 256, 4, 1, 'MP5', 4, 4),
+        conv('CL7', 512, 4, 4),
+        classifier(),
+    ],
+    'dm64_ra': [
+        conv('CL1', 64, 64, 64),
+        conv_max('CL2', 64, 4, 1, 'MP1', 4, 4),
+        conv_max('CL3', 128, 4, 1, 'MP2', 2, 2),
+        conv_max('CL4', 128, 4, 1, 'MP3', 2, 2),
+        conv_max('CL5', 256, 4, 1, 'MP4', 2, 2),
+        conv_max('CL6', 256, 4, 1, 'MP5', 2, 2),
+        conv('CL7', 512, 4, 4),
+        classifier(),
+    ],
+    'dm128_ra': [
+        conv('CL1', 64, 128, 128),
+        conv_max('CL2', 64, 4, 1, 'MP1', 2, 2),
+        conv_max('CL3', 128, 4, 1, 'MP2', 2, 2),
+        conv_max('CL4', 128, 4, 1, 'MP3', 2, 2),
+        conv_max('CL5', 256, 4, 1, 'MP4', 2, 2),
+        conv_max('CL6', 256, 4, 1, 'MP5', 2, 2),
+        conv('CL7', 512, 4, 4),
+        classifier(),
+    ],
+
+    # Deeper Models with dilated convolutions
+    'dl16_16_ra': [
+        conv('CL1', 64, 16, 16),
+        conv_max('CL2', 64, 4, 1, 'MP1', 4, 4, dil_rate=16),
+        conv_max('CL3', 128, 4, 1, 'MP2', 4, 4, dil_rate=8),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4, dil_rate=4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 2, 2, dil_rate=2),
+        conv_max('CL6', 256, 4, 1, 'MP5', 2, 2),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    'dl16_8_ra': [
+        conv('CL1', 64, 16, 16),
+        conv_max('CL2', 64, 4, 1, 'MP1', 4, 4, dil_rate=8),
+        conv_max('CL3', 128, 4, 1, 'MP2', 4, 4, dil_rate=4),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4, dil_rate=2),
+        conv_max('CL5', 256, 4, 1, 'MP4', 2, 2),
+        conv_max('CL6', 256, 4, 1, 'MP5', 2, 2),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    'dl16_4_ra': [
+        conv('CL1', 64, 16, 16),
+        conv_max('CL2', 64, 4, 1, 'MP1', 4, 4, dil_rate=4),
+        conv_max('CL3', 128, 4, 1, 'MP2', 4, 4, dil_rate=2),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 2, 2),
+        conv_max('CL6', 256, 4, 1, 'MP5', 2, 2),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+
+    # Multi-branch models
+    'mul16a': [
+        conv('CL1', 64, 16, 16),
+        branches('L2',
+                 conv_max('CL2a', 32, 4, 1, 'MP1a', 4, 4),
+                 conv_avg('CL2b', 32, 16, 1, 'MP1b', 4, 4)),
+        branches('L3',
+                 conv_max('CL3a', 64, 4, 1, 'MP2a', 4, 4),
+                 conv_avg('CL3b', 64, 16, 1, 'MP2b', 4, 4)),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 4, 4),
+        conv_max('CL6', 256, 4, 1, 'MP5', 4, 4),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    'mul16b': [
+        conv('CL1', 32, 16, 16),
+        branches('L2',
+                 conv_max('CL2a', 32, 4, 1, 'MP1a', 4, 4),
+                 [conv('CL2ba', 32, 8, 1, dil_rate=8),
+                  conv('CL2bb', 32, 8, 1, dil_rate=4),
+                  conv_avg('CL2b', 32, 8, 1, 'MP1b', 4, 4, dil_rate=2)]),
+        branches('L3',
+                 conv_max('CL3a', 64, 4, 1, 'MP2a', 4, 4),
+                 [conv('CL3ba', 32, 8, 1, dil_rate=8),
+                  conv('CL3bb', 32, 8, 1, dil_rate=4),
+                  conv_avg('CL3b', 32, 8, 1, 'MP2b', 4, 4, dil_rate=2)]),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 4, 4),
+        conv_max('CL6', 256, 4, 1, 'MP5', 4, 4),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    'mul16c': [
+        conv('CL1', 32, 16, 16),
+        branches('L2',
+                 conv_max('CL2a', 32, 4, 1, 'MP1a', 4, 4),
+                 [conv('CL2ba', 32, 8, 1, dil_rate=8),
+                  conv('CL2bb', 32, 8, 1, dil_rate=4),
+                  conv_avg('CL2b', 32, 8, 1, 'MP1b', 4, 4, dil_rate=2)],
+                 conv_avg('CL2c', 32, 16, 1, 'MP1c', 4, 4)),
+        branches('L3',
+                 conv_max('CL3a', 64, 4, 1, 'MP2a', 4, 4),
+                 [conv('CL3ba', 32, 8, 1, dil_rate=8),
+                  conv('CL3bb', 32, 8, 1, dil_rate=4),
+                  conv_avg('CL3b', 32, 8, 1, 'MP2b', 4, 4, dil_rate=2)],
+                 conv_avg('CL3c', 64, 16, 1, 'MP2c', 4, 4)),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 4, 4),
+        conv_max('CL6', 256, 4, 1, 'MP5', 4, 4),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    'mul16d': [
+        branches('L1',
+                 [conv('CL1a', 32, 16, 16)],
+                 [conv('CL1b', 64, 64, 16)]),
+        branches('L2',
+                 conv_max('CL2a', 32, 4, 1, 'MP1a', 4, 4),
+                 conv_avg('CL2b', 32, 16, 1, 'MP1b', 4, 4)),
+        branches('L3',
+                 conv_max('CL3a', 64, 4, 1, 'MP2a', 4, 4),
+                 conv_avg('CL3b', 64, 16, 1, 'MP2b', 4, 4)),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 4, 4),
+        conv_max('CL6', 256, 4, 1, 'MP5', 4, 4),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    'mul16ds': [
+        branches('L1',
+                 [conv('CL1a', 32, 16, 16)],
+                 [conv('CL1b', 64, 64, 16)]),
+        conv_max('CL2', 64, 4, 1, 'MP1', 4, 4),
+        conv_max('CL3', 128, 4, 1, 'MP2', 4, 4),
+        conv_max('CL4', 128, 4, 1, 'MP3', 4, 4),
+        conv_max('CL5', 256, 4, 1, 'MP4', 4, 4),
+        conv_max('CL6', 256, 4, 1, 'MP5', 4, 4),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+    'mul16f': [
+        conv('CL1', 64, 16, 16),
+        branches('L2',
+                 [conv('CL2aa', 32, 4, 1), conv_max('CL2ab', 32, 4, 1, 'MP1', 4, 4)],
+                 [avg_pool('AVG1', 4, 4)]),
+        branches('L3',
+                 [conv('CL3aa', 32, 4, 1), conv_max('CL3ab', 32, 4, 1, 'MP2', 4, 4)],
+                 [avg_pool('AVG2', 4, 4)]),
+        branches('L4',
+                 [conv('CL4aa', 32, 4, 1), conv_max('CL4ab', 32, 4, 1, 'MP3', 4, 4)],
+                 [avg_pool('AVG3', 4, 4)]),
+        branches('L5',
+                 [conv('CL5aa', 64, 4, 1), conv_max('CL5ab', 64, 4, 1, 'MP4', 4, 4)],
+                 [avg_pool('AVG4', 4, 4)]),
+        branches('L6',
+                 [conv('CL6aa', 64, 4, 1), conv_max('CL6ab', 64, 4, 1, 'MP5', 4, 4)],
+                 [avg_pool('AVG5', 4, 4)]),
+        conv_max('CL7', 512, 4, 1, 'MP6', 2, 2),
+        classifier(),
+    ],
+}
+
+
+# Models sized for full clips of 465984 samples, whose pooling windows
+# are longer than their input on windows, left out of the default checks
+FULL_CLIP_MODELS = ['dm16_rc']
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Static cost
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+def layer_costs(layers, shape, output_size, costs):
+    """Append the cost of every layer of a sequence to costs.
+
+    Args:
+        layers (list): Layers of the sequence, nested lists being sequences
+        shape (tuple): Length and depth of the input of the sequence
+        output_size (int): Number of tags in the targets
+        costs (list): Costs of the layers so far
+
+    Returns:
+        Length and depth of the output of the sequence
+    """
+    for layer in layers:
+        if isinstance(layer, list):
+            shape = layer_costs(layer, shape, output_size, costs)
+            continue
+
+        length, depth = shape
+        params, flops, tensors = 0, 0, 1
+        if layer['type'] == CONV:
+            # SAME padding
+            out_shape = (-(-length // layer['stride']), layer['depth'])
+            # Filters without bias and the beta of batch normalization,
+            # the moving statistics are not trained
+            params = layer['length'] * depth * layer['depth'] + layer['depth']
+            flops = 2 * layer['length'] * depth * layer['depth'] * out_shape[0]
+            tensors = CONV_TENSORS
+        elif layer['type'] in (MAX_POOL, AVG_POOL):
+            if length < layer['length']:
+                raise ValueError('Layer {} pools {} samples with windows of {}'.format(
+                    layer['name'], length, layer['length']))
+            # VALID padding
+            out_shape = ((length - layer['length']) // layer['stride'] + 1, depth)
+            flops = layer['length'] * out_shape[0] * depth
+        elif layer['type'] == BRANCHES:
+            outputs = [layer_costs(path, shape, output_size, costs) for path in layer['paths']]
+            lengths = set(output[0] for output in outputs)
+            if len(lengths) > 1:
+                raise ValueError('Branches of layer {} output different lengths {}'.format(
+                    layer['name'], sorted(lengths)))
+            out_shape = (outputs[0][0], sum(output[1] for output in outputs))
+        elif layer['type'] == DROPOUT:
+            out_shape = shape
+        elif layer['type'] == FLATTEN:
+            # Reshape of the same buffer
+            out_shape = (1, length * depth)
+            tensors = 0
+        elif layer['type'] == DENSE:
+            units = layer['units'] or output_size
+            out_shape = (length, units)
+            params = depth * units + units
+            flops = 2 * length * depth * units
+        else:
+            raise ValueError('Layer type {} not recognized'.format(layer['type']))
+
+        costs.append({
+            'name': layer['name'],
+            'type': layer['type'],
+            'output': out_shape,
+            'params': params,
+            'flops': flops,
+            'activation_bytes': tensors * out_shape[0] * out_shape[1] * FLOAT_BYTES
+        })
+        shape = out_shape
+    return shape
+
+
+def estimate_cost(spec, num_samples, depth, output_size, batch_size=1):
+    """Compute the cost of a model from the shapes of its layers.
+
+    The FLOPs count the multiply-adds of the convolutions and dense
+    layers as two operations and every value of the pooling windows as
+    one, the elementwise operations being left out. The activation
+    memory counts the float32 outputs of every layer kept for the
+    backward pass, a lower bound of the memory of the gradients.
+
+    Args:
+        spec (list): Layers of the model
+        num_samples (int): Samples of the songs, or frames of the filterbanks
+        depth (int): Depth of the samples
+        output_size (int): Number of tags in the targets
+        batch_size (int): Examples run at once by a tower
+
+    Returns:
+        Dictionary with the costs of every layer, the number of parameters,
+        the FLOPs and activation bytes per example, the activation memory
+        of the batch in MB and the output shape
+    """
+    costs = []
+    output = layer_costs(spec, (num_samples, depth), output_size, costs)
+    activation_bytes = sum(cost['activation_bytes'] for cost in costs)
+    return {
+        'layers': costs,
+        'params': sum(cost['params'] for cost in costs),
+        'flops': sum(cost['flops'] for cost in costs),
+        'activation_bytes': activation_bytes,
+        'activation_mb': batch_size * activation_bytes / 2.0**20,
+        'batch_size': batch_size,
+        'output': output
+    }
+
+
+def check_cost(cost, max_params=None, max_activation_mb=None):
+    """Reject a model whose cost is over the limits.
+
+    Args:
+        cost (dict): Cost of the model from estimate_cost
+        max_params (int): Maximum number of parameters, or None
+        max_activation_mb (float): Maximum activation memory of a batch in MB, or None
+    """
+    if max_params is not None and cost['params'] > max_params:
+        raise ValueError('Model of {} parameters over the limit of {}'.format(cost['params'], max_params))
+    if max_activation_mb is not None and cost['activation_mb'] > max_activation_mb:
+        raise ValueError('Activations of {:.1f} MB for batches of {} over the limit of {} MB'.format(
+            cost['activation_mb'], cost['batch_size'], max_activation_mb))
+
+
+def format_cost(cost):
+    """Lines of a table of the cost of every layer and the totals."""
+    lines = ['{:>6} {:>9} {:>14} {:>10} {:>10} {:>12}'.format(
+        'layer', 'type', 'output', 'params', 'MFLOPs', 'activ. KB')]
+    for layer in cost['layers']:
+        lines.append('{:>6} {:>9} {:>14} {:>10} {:>10.2f} {:>12.1f}'.format(
+            layer['name'], layer['type'], '{}x{}'.format(*layer['output']), layer['params'],
+            layer['flops'] / 1e6, layer['activation_bytes'] / 1024.0))
+    lines.append('Total: {} parameters, {:.1f} MFLOPs and {:.1f} KB of activations per example, '
+                 '{:.1f} MB of activations for batches of {}'.format(
+                     cost['params'], cost['flops'] / 1e6, cost['activation_bytes'] / 1024.0,
+                     cost['activation_mb'], cost['batch_size']))
+    return lines
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Input Parsing
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--model-functions',
+                        nargs='+',
+                        default=sorted(set(MODEL_SPECS) - set(FULL_CLIP_MODELS)),
+                        help='Models estimated, by default every model with a spec built on windows')
+
+    parser.add_argument('--num-samples',
+                        type=int,
+                        default=38832,
+                        help='Samples of the songs, by default those of a window')
+
+    parser.add_argument('--depth',
+                        type=int,
+                        default=1,
+                        help='Depth of the samples, 40 for log-mel filterbanks')
+
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=20,
+                        help='Examples run at once by a tower, windows included')
+
+    parser.add_argument('--num-tags',
+                        type=int,
+                        default=50,
+                        help='Number of tags in the targets')
+
+    parser.add_argument('--max-params',
+                        type=int,
+                        default=None,
+                        help='Maximum number of parameters of a model')
+
+    parser.add_argument('--max-activation-mb',
+                        type=float,
+                        default=None,
+                        help='Maximum activation memory in MB of the batches of a tower')
+
+    args = parser.parse_args()
+
+    rejected = []
+    for model_function in args.model_functions:
+        if model_function not in MODEL_SPECS:
+            parser.error('Model {} has no spec'.format(model_function))
+        print(model_function)
+        try:
+            model_cost = estimate_cost(MODEL_SPECS[model_function], args.num_samples, args.depth,
+                                       args.num_tags, args.batch_size)
+            print('\n'.join(format_cost(model_cost)))
+            check_cost(model_cost, args.max_params, args.max_activation_mb)
+        except ValueError as error:
+            print('Rejected: {}'.format(error))
+            rejected.append(model_function)
+        print('')
+
+    # Non-zero status to stop the submission of oversized models
+    sys.exit(1 if rejected else 0)
@@ -2,14 +2,42 @@
 
 import tensorflow as tf
 
+from .model_specs import (AVG_POOL, BRANCHES, CONV, DENSE, DROPOUT, FLATTEN, IDENTITY, MAX_POOL, MODEL_SPECS, SIGMOID,
+                          check_cost, estimate_cost, format_cost)
+
 TRAIN, EVAL, PREDICT = 'TRAIN', 'EVAL', 'PREDICT'
 STME, SPM = 'STME', 'SPM'
 
 TRUE_POSITIVE_FACTOR = 10
 TAG_BALANCING_FACTOR = 0
 
+# Default number of tags in the targets
+NUM_OUTPUTS = 50
+
+# Run the model once on the windows folded into the batch
+# dimension instead of once per window with tf.map_fn. The batch
+# normalization helpers below take their moments per window, so
+# that the logits are those of tf.map_fn, as check_windows checks
+FOLD_WINDOWS = True
+
+# Apply the dropout of the models, check_windows turns it off to
+# compare the logits of both paths of map_windows
+DROPOUT = True
+
+# Run the sample-level layers as native 1-D convolutions and pooling
+# instead of conv2d with [1, k] kernels on inputs of unit height, in
+# the 1-D helpers below, which models_mgpu shares
+NATIVE_1D = True
+
 PARALLEL_ITERS = 1
 
+# Activations of the dense layers of the model specs
+SPEC_ACTIVATIONS = {SIGMOID: tf.nn.sigmoid, IDENTITY: tf.identity}
+
+# Number of windows folded into the batch by map_windows while the
+# model is built, None otherwise
+_folded_windows = None
+
 # ---------------------------------------------------------------------------------------------------------------------
 # Controller
 # ---------------------------------------------------------------------------------------------------------------------
@@ -25,10 +53,13 @@ def controller(function_name,
     global_step = tf.contrib.framework.get_or_create_global_step()
     model = globals()[function_name]
 
+    # Output layers follow the number of tags in the targets
+    output_size = int(targets_batch.get_shape()[-1])
+
     with tf.name_scope('Model') as scope:
-        logits = get_logits(model, data_batch, window, mode)
+        logits = get_logits(model, data_batch, window, mode, output_size)
         with tf.name_scope('loss'):
-            class_weights = balancing_weights(50, 'log', TAG_BALANCING_FACTOR)
+            class_weights = balancing_weights(output_size, 'log', TAG_BALANCING_FACTOR)
             loss = weighted_sigmoid_cross_entropy(logits=logits,
                                                   labels=targets_batch,
                                                   false_negatives_weight=TRUE_POSITIVE_FACTOR,
@@ -68,40 +99,70 @@ def controller(function_name,
                 }
 
 
-def get_logits(model, data_batch, window, mode):
+def get_logits(model, data_batch, window, mode, output_size=NUM_OUTPUTS):
 
     if window in SPM:
-        logits_array = tf.map_fn(lambda w: model(w),
-                                 elems=data_batch,
-                                 back_prop=True,
-                                 parallel_iterations=PARALLEL_ITERS,
-                                 swap_memory=True,
-                                 name='MapModels')
+        logits_array = map_windows(model, data_batch, PARALLEL_ITERS, output_size=output_size)
 
         # logits = superpool_a(tf.concat(tf.unstack(logits_array), axis=1, name='mergingLogits'))
         # logits = superpool_b(tf.concat(tf.unstack(logits_array), axis=1, name='mergingLogits'))
-        logits = superpool_c(tf.stack(tf.unstack(logits_array), axis=-1, name='mergingLogits'))
+        logits = superpool_c(tf.stack(tf.unstack(logits_array), axis=-1, name='mergingLogits'),
+                             output_size=output_size)
         # logits = superpool_d(tf.stack(tf.unstack(logits_array), axis=1, name='mergingLogits'))
         # logits = superpool_e(tf.concat(tf.unstack(logits_array), axis=1, name='mergingLogits'))
         # logits = superpool_f(tf.concat(tf.unstack(logits_array), axis=1, name='mergingLogits'))
 
     elif window in STME and mode in EVAL:
-        logits_array = tf.map_fn(lambda w: model(w),
-                                 elems=data_batch,
-                                 back_prop=True,
-                                 parallel_iterations=PARALLEL_ITERS,
-                                 swap_memory=True,
-                                 name='MapModels')
+        logits_array = map_windows(model, data_batch, PARALLEL_ITERS, output_size=output_size)
         logits = tf.reduce_mean(logits_array, axis=0, name='averageLogits')
 
     elif window in STME and mode in TRAIN:
-        logits = model(data_batch, mode)
+        logits = model(data_batch, output_size=output_size)
     else:
         raise ValueError('Window {} or mode {} not recognised!'.format(window, mode))
 
     return logits
 
 
+def map_windows(model, data_batch, parallel_iterations, *args, **kwargs):
+    """Run the model on every window of a batch [windows, batch, ...].
+
+    With FOLD_WINDOWS the windows are folded into the batch dimension
+    and the model runs once on [windows*batch, ...], the logits being
+    reshaped back. The variables are the same as with tf.map_fn, and
+    batch_norm and batch_normalization take the moments of every
+    window, as tf.map_fn does, so the logits are the same.
+
+    Args:
+        model (function): Model of a batch of windows
+        data_batch (tensor): Windows of the songs [windows, batch, ...]
+        parallel_iterations (int): Windows run in parallel by tf.map_fn
+        args: Other arguments of the model
+        kwargs: Other keyword arguments of the model
+
+    Returns:
+        Logits of every window [windows, batch, outputs]
+    """
+    global _folded_windows
+
+    if FOLD_WINDOWS:
+        shape = data_batch.get_shape().as_list()
+        folded = tf.reshape(data_batch, [shape[0] * shape[1]] + shape[2:], name='FoldWindows')
+        _folded_windows = shape[0]
+        try:
+            logits = model(folded, *args, **kwargs)
+        finally:
+            _folded_windows = None
+        return tf.reshape(logits, [shape[0], shape[1], -1], name='UnfoldLogits')
+
+    return tf.map_fn(lambda w: model(w, *args, **kwargs),
+                     elems=data_batch,
+                     back_prop=True,
+                     parallel_iterations=parallel_iterations,
+                     swap_memory=True,
+                     name='MapModels')
+
+
 def general_metrics(predictions, targets_batch):
     return {
         'false_negatives': tf.contrib.metrics.streaming_false_negatives(
@@ -172,7 +233,7 @@ def balancing_weights(num_classes, func, factor):
 # ---------------------------------------------------------------------------------------------------------------------
 
 
-def superpool_a(data):
+def superpool_a(data, output_size=NUM_OUTPUTS):
     superpool_outputs = {}
     name = 'FCSL1'
     superpool_outputs[name] = tf.layers.dense(data, 600, activation=tf.nn.elu, name=name)
@@ -181,11 +242,11 @@ def superpool_a(data):
     superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL1'], 600, activation=tf.nn.elu, name=name)
 
     name = 'FCSL3'
-    superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL2'], 50, activation=tf.identity, name=name)
+    superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL2'], output_size, activation=tf.identity, name=name)
     return superpool_outputs[name]
 
 
-def superpool_b(data):
+def superpool_b(data, output_size=NUM_OUTPUTS):
     superpool_outputs = {}
     name = 'FCSL1'
     output = tf.layers.dense(data, 600, activation=tf.nn.elu, name=name)
@@ -196,11 +257,11 @@ def superpool_b(data):
     superpool_outputs[name] = tf.layers.dropout(output, training=True)
 
     name = 'FCSL3'
-    superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL2'], 50, activation=tf.identity, name=name)
+    superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL2'], output_size, activation=tf.identity, name=name)
     return superpool_outputs[name]
 
 
-def superpool_c(data):
+def superpool_c(data, output_size=NUM_OUTPUTS):
     with tf.variable_scope('CL1_SP'):
         out_clsp = tf.layers.conv1d(data, 32, 3, strides=1, activation=None, name='conv')
         out_clsp = tf.layers.batch_normalization(out_clsp, name='batchNorm', training=True)
@@ -211,11 +272,11 @@ def superpool_c(data):
     out_fclsp = tf.layers.dense(out_fltnsp, 1500, activation=tf.nn.elu, name='FCSL')
     out_fclsp = tf.layers.dropout(out_fclsp, training=True)
 
-    output_final = tf.layers.dense(out_fclsp, 50, activation=tf.identity, name='FCSL_OUT')
+    output_final = tf.layers.dense(out_fclsp, output_size, activation=tf.identity, name='FCSL_OUT')
     return output_final
 
 
-def superpool_d(data):
+def superpool_d(data, output_size=NUM_OUTPUTS):
     with tf.variable_scope('CL1_SP'):
         out_clsp = tf.layers.conv1d(data, 50, 3, strides=1, activation=None, name='conv')
         out_clsp = tf.layers.batch_normalization(out_clsp, name='batchNorm', training=True)
@@ -226,11 +287,11 @@ def superpool_d(data):
     out_fclsp = tf.layers.dense(out_fltnsp, 500, activation=tf.nn.elu, name='FCSL')
     out_fclsp = tf.layers.dropout(out_fclsp, training=True)
 
-    output_final = tf.layers.dense(out_fclsp, 50, activation=tf.identity, name='FCSL_OUT')
+    output_final = tf.layers.dense(out_fclsp, output_size, activation=tf.identity, name='FCSL_OUT')
     return output_final
 
 
-def superpool_e(data):
+def superpool_e(data, output_size=NUM_OUTPUTS):
     with tf.variable_scope('CL1_SP'):
         out_clsp = tf.layers.conv1d(data, 50, 3, strides=1, activation=None, name='conv')
         out_clsp = tf.layers.batch_normalization(out_clsp, name='batchNorm', training=True)
@@ -241,11 +302,11 @@ def superpool_e(data):
     out_fclsp = tf.layers.dense(out_fltnsp, 2500, activation=tf.nn.elu, name='FCSL')
     out_fclsp = tf.layers.dropout(out_fclsp, training=True)
 
-    output_final = tf.layers.dense(out_fclsp, 50, activation=tf.identity, name='FCSL_OUT')
+    output_final = tf.layers.dense(out_fclsp, output_size, activation=tf.identity, name='FCSL_OUT')
     return output_final
 
 
-def superpool_f(data):
+def superpool_f(data, output_size=NUM_OUTPUTS):
     with tf.variable_scope('CL1_SP'):
         out_clsp = tf.layers.conv1d(data, 32, 3, strides=1, activation=None, name='conv')
         out_clsp = tf.layers.batch_normalization(out_clsp, name='batchNorm', training=True)
@@ -256,118 +317,330 @@ def superpool_f(data):
     out_fclsp = tf.layers.dense(out_fltnsp, 1500, activation=tf.nn.elu, name='FCSL')
     out_fclsp = tf.layers.dropout(out_fclsp, training=True)
 
-    output_final = tf.layers.dense(out_fclsp, 50, activation=tf.identity, name='FCSL_OUT')
+    output_final = tf.layers.dense(out_fclsp, output_size, activation=tf.identity, name='FCSL_OUT')
     return output_final
 
 
-# ---------------------------------------------------------------------------------------------------------------------
-# DM Models
-# ---------------------------------------------------------------------------------------------------------------------
+def batch_norm(in_layer):
+    """tf.contrib.layers.batch_norm on the statistics of the batch,
+    taking the moments of every window on the windows folded by
+    map_windows, with the same variables.
+
+    Args:
+        in_layer (tensor): Input of the layer
+
+    Returns:
+        Normalized input
+    """
+    if _folded_windows is None:
+        return tf.contrib.layers.batch_norm(in_layer)
+
+    channels = in_layer.get_shape()[-1].value
+    with tf.variable_scope(None, 'BatchNorm'):
+        beta = tf.contrib.framework.model_variable('beta', shape=[channels],
+                                                   initializer=tf.zeros_initializer())
+        moving_mean = tf.contrib.framework.model_variable('moving_mean', shape=[channels],
+                                                          initializer=tf.zeros_initializer(),
+                                                          trainable=False)
+        moving_variance = tf.contrib.framework.model_variable('moving_variance', shape=[channels],
+                                                              initializer=tf.ones_initializer(),
+                                                              trainable=False)
+        return window_normalization(in_layer, beta, None, moving_mean, moving_variance, decay=0.999)
+
+
+def batch_normalization(in_layer, name):
+    """tf.layers.batch_normalization in training mode, taking the
+    moments of every window on the windows folded by map_windows,
+    with the same variables.
+
+    Args:
+        in_layer (tensor): Input of the layer
+        name (str): Name of the layer
+
+    Returns:
+        Normalized input
+    """
+    if _folded_windows is None:
+        return tf.layers.batch_normalization(in_layer, name=name, training=True)
+
+    channels = in_layer.get_shape()[-1].value
+    with tf.variable_scope(name):
+        gamma = tf.get_variable('gamma', shape=[channels], initializer=tf.ones_initializer())
+        beta = tf.get_variable('beta', shape=[channels], initializer=tf.zeros_initializer())
+        moving_mean = tf.get_variable('moving_mean', shape=[channels], initializer=tf.zeros_initializer(),
+                                      trainable=False)
+        moving_variance = tf.get_variable('moving_variance', shape=[channels], initializer=tf.ones_initializer(),
+                                          trainable=False)
+        return window_normalization(in_layer, beta, gamma, moving_mean, moving_variance, decay=0.99)
+
+
+def window_normalization(in_layer, offset, scale, moving_mean, moving_variance, decay, epsilon=1e-3):
+    """Batch normalization of the windows folded by map_windows.
+
+    The batch [windows*batch, ..., channels] is reshaped to [windows,
+    batch, ..., channels], every window is normalized with its own
+    moments and the batch is reshaped back. The moving averages are
+    updated with the moments averaged over the windows, in UPDATE_OPS.
+
+    Args:
+        in_layer (tensor): Input of the layer
+        offset (tensor): Offset of the normalization
+        scale (tensor): Scale of the normalization, or None
+        moving_mean (tensor): Moving average of the mean
+        moving_variance (tensor): Moving average of the variance
+        decay (float): Decay of the moving averages
+        epsilon (float): Added to the variance
+
+    Returns:
+        Normalized input
+    """
+    shape = in_layer.get_shape().as_list()
+    windows = tf.reshape(in_layer, [_folded_windows, -1] + shape[1:])
+    mean, variance = tf.nn.moments(windows, list(range(1, len(shape))), keep_dims=True)
+    out_bn = tf.nn.batch_normalization(windows, mean, variance, offset, scale, epsilon)
+
+    for average, moment in [(moving_mean, mean), (moving_variance, variance)]:
+        moment = tf.reduce_mean(moment, axis=list(range(len(shape))))
+        tf.add_to_collection(tf.GraphKeys.UPDATE_OPS, tf.assign_sub(average, (average - moment) * (1 - decay)))
+
+    out_bn = tf.reshape(out_bn, tf.shape(in_layer))
+    out_bn.set_shape(in_layer.get_shape())
+    return out_bn
+
+
+def dropout(in_layer):
+    """Dropout keeping half of the units, unless DROPOUT is off.
+
+    Args:
+        in_layer (tensor): Input of the layer
+
+    Returns:
+        Output of the layer
+    """
+    if not DROPOUT:
+        return in_layer
+    return tf.contrib.layers.dropout(in_layer)
+
+
+def input_1d(data_batch):
+    """Shape a batch of songs [batch, samples, depth] for the 1-D
+    layers, adding a unit height for the conv2d path.
+
+    Args:
+        data_batch (tensor): Batch of songs
+
+    Returns:
+        Batch of songs for the 1-D layers
+    """
+    if NATIVE_1D:
+        return data_batch
+    return tf.expand_dims(data_batch, axis=1)
+
+
+def conv_1d(in_layer, depth, filter_length, filter_stride, dil_rate=1):
+    """Convolution followed by batch normalization and elu, under
+    the scope conv.
+
+    Inputs [batch, samples, depth] are convolved with
+    tf.nn.convolution. The weights are kept as the [1, length, in,
+    out] kernel of tf.contrib.layers.conv2d, with the same names and
+    batch normalization variables, so that checkpoints of both paths
+    are compatible. Inputs [batch, 1, samples, depth] use conv2d.
+
+    Args:
+        in_layer (tensor): Input of the layer
+        depth (int): Number of filters
+        filter_length (int): Length of the filters
+        filter_stride (int): Stride of the filters
+        dil_rate (int): Dilation rate of the filters
+
+    Returns:
+        Output of the layer
+    """
+    if in_layer.get_shape().ndims == 4:
+        return tf.contrib.layers.conv2d(in_layer, depth, [1, filter_length],
+                                        stride=[1, filter_stride],
+                                        scope='conv',
+                                        rate=dil_rate,
+                                        activation_fn=tf.nn.elu,
+                                        normalizer_fn=batch_norm)
+
+    with tf.variable_scope('conv'):
+        weights = tf.contrib.framework.model_variable(
+            'weights',
+            shape=[1, filter_length, in_layer.get_shape()[-1].value, depth],
+            initializer=tf.contrib.layers.xavier_initializer())
+        out_cl = tf.nn.convolution(in_layer, tf.squeeze(weights, axis=0), 'SAME',
+                                   strides=[filter_stride],
+                                   dilation_rate=[dil_rate])
+        out_cl = batch_norm(out_cl)
+    return tf.nn.elu(out_cl)
+
+
+def conv_max_layers_1d(in_layer,
+                       depth,
+                       filter_length,
+                       filter_stride,
+                       conv_name,
+                       pool_length,
+                       pool_stride,
+                       pool_name,
+                       dil_rate=1):
+
+    with tf.variable_scope(conv_name):
+        out_cl = conv_1d(in_layer, depth, filter_length, filter_stride, dil_rate)
+
+    out_mp = max_1d(out_cl, pool_length, pool_stride, pool_name)
+    return out_mp
+
+
+def conv_avg_layers_1d(in_layer,
+                       depth,
+                       filter_length,
+                       filter_stride,
+                       conv_name,
+                       pool_length,
+                       pool_stride,
+                       pool_name,
+                       dil_rate=1):
 
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm16_ra(data_batch):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 16],
-                                          stride=[1, 16],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 2427
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1')  # 605
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 4, 4, 'MP2')  # 150
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 17
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 6
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm64_ra(data_batch):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 64],
-                                          stride=[1, 64],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 606
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1')  # 150
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 2, 2, 'MP2')  # 73
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 2, 2, 'MP3')  # 34
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 15
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 5
-
-    with tf.variable_scope('CL7'):
-        out_l7 = tf.contrib.layers.conv2d(out_l6, 512, [1, 4],
-                                          stride=[1, 4],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm128_ra(data_batch):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 128],
-                                          stride=[1, 128],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 303
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 2, 2, 'MP1')  # 149
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 2, 2, 'MP2')  # 72
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 2, 2, 'MP3')  # 34
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 15
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 5
-
-    with tf.variable_scope('CL7'):
-        out_l7 = tf.contrib.layers.conv2d(out_l6, 512, [1, 4],
-                                          stride=[1, 4],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-def conv_max_layers_1d(in_layer, depth, filter_length, filter_stride, conv_name,
-                       pool_length, pool_stride, pool_name):
     with tf.variable_scope(conv_name):
-        out_cl = tf.contrib.layers.conv2d(in_layer, depth, [1, filter_length],
-                                          stride=[1, filter_stride],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)
+        out_cl = conv_1d(in_layer, depth, filter_length, filter_stride, dil_rate)
 
-    out_mp = tf.contrib.layers.max_pool2d(out_cl, [1, pool_length] , stride=[1, pool_stride], scope=pool_name)
+    out_mp = avg_1d(out_cl, pool_length, pool_stride, pool_name)
     return out_mp
+
+
+def conv_layers_1d(in_layer,
+                   depth,
+                   filter_length,
+                   filter_stride,
+                   conv_name,
+                   dil_rate=1):
+
+    with tf.variable_scope(conv_name):
+        return conv_1d(in_layer, depth, filter_length, filter_stride, dil_rate)
+
+
+def max_1d(in_layer,
+           pool_length,
+           pool_stride,
+           pool_name):
+    if in_layer.get_shape().ndims == 3:
+        return tf.layers.max_pooling1d(in_layer, pool_length, pool_stride, name=pool_name)
+    return tf.contrib.layers.max_pool2d(in_layer, [1, pool_length], stride=[1, pool_stride], scope=pool_name)
+
+
+
+def avg_1d(in_layer,
+           pool_length,
+           pool_stride,
+           pool_name):
+    if in_layer.get_shape().ndims == 3:
+        return tf.layers.average_pooling1d(in_layer, pool_length, pool_stride, name=pool_name)
+    return tf.contrib.layers.avg_pool2d(in_layer, [1, pool_length], stride=[1, pool_stride], scope=pool_name)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Model specs
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+def build_spec(layers, in_layer, output_size=NUM_OUTPUTS):
+    """Build the graph of a sequence of layers of a model spec.
+
+    The layers are built with the helpers above and the same names as
+    the hand-written models, hence with the same variables.
+
+    Args:
+        layers (list): Layers of the sequence, nested lists being sequences
+        in_layer (tensor): Input of the sequence
+        output_size (int): Number of tags in the targets
+
+    Returns:
+        Output of the sequence
+    """
+    for layer in layers:
+        if isinstance(layer, list):
+            in_layer = build_spec(layer, in_layer, output_size)
+        elif layer['type'] == CONV:
+            in_layer = conv_layers_1d(in_layer, layer['depth'], layer['length'], layer['stride'], layer['name'],
+                                      dil_rate=layer['dil_rate'])
+        elif layer['type'] == MAX_POOL:
+            in_layer = max_1d(in_layer, layer['length'], layer['stride'], layer['name'])
+        elif layer['type'] == AVG_POOL:
+            in_layer = avg_1d(in_layer, layer['length'], layer['stride'], layer['name'])
+        elif layer['type'] == BRANCHES:
+            in_layer = tf.concat([build_spec(path, in_layer, output_size) for path in layer['paths']], axis=-1)
+        elif layer['type'] == DROPOUT:
+            in_layer = dropout(in_layer)
+        elif layer['type'] == FLATTEN:
+            in_layer = tf.reshape(in_layer, [int(in_layer.shape[0]), -1], name=layer['name'])
+        elif layer['type'] == DENSE:
+            in_layer = tf.layers.dense(in_layer, layer['units'] or output_size,
+                                       activation=SPEC_ACTIVATIONS[layer['activation']],
+                                       name=layer['name'])
+        else:
+            raise ValueError('Layer type {} not recognized'.format(layer['type']))
+    return in_layer
+
+
+def spec_model(function_name):
+    """Model function building the spec of MODEL_SPECS of the same name.
+
+    Args:
+        function_name (str): Name of the model in MODEL_SPECS
+
+    Returns:
+        Function of the batch, mode and output size, as the models of
+        models_mgpu, the mode being optional as for the models above
+    """
+    def model(data_batch, mode=None, output_size=NUM_OUTPUTS):
+        return build_spec(MODEL_SPECS[function_name], input_1d(data_batch), output_size)
+
+    model.__name__ = function_name
+    return model
+
+
+def check_model(function_name, data_batch, output_size, max_params=None, max_activation_mb=None):
+    """Log the static cost of a model on the batches of a tower and
+    reject the model if over the limits.
+
+    The windows of [windows, batch, samples, depth] batches are counted
+    as examples, as they are folded into the batch by map_windows or
+    run together by the parallel iterations of tf.map_fn.
+    Models without a spec are rejected if a limit is given, as their
+    cost cannot be checked.
+
+    Args:
+        function_name (str): Name of the model
+        data_batch (tensor): Batch of a tower [..., samples, depth]
+        output_size (int): Number of tags in the targets
+        max_params (int): Maximum number of parameters, or None
+        max_activation_mb (float): Maximum activation memory of a batch in MB, or None
+
+    Returns:
+        Cost of the model, or None for models without a spec and limits
+    """
+    if function_name not in MODEL_SPECS:
+        if max_params is not None or max_activation_mb is not None:
+            raise ValueError('Model {} has no spec in model_specs, its cost cannot be checked against the '
+                             'limits'.format(function_name))
+        tf.logging.warn('Model {} has no spec, its cost is not estimated'.format(function_name))
+        return None
+
+    shape = data_batch.get_shape().as_list()
+    examples = 1
+    for dimension in shape[:-2]:
+        examples *= dimension
+
+    cost = estimate_cost(MODEL_SPECS[function_name], shape[-2], shape[-1], output_size, batch_size=examples)
+    for line in format_cost(cost):
+        tf.logging.info(line)
+    check_cost(cost, max_params, max_activation_mb)
+    return cost
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 # DS256 Models
 # ---------------------------------------------------------------------------------------------------------------------
@@ -377,11 +650,10 @@ def conv_max_layers_1d(in_layer, depth, filter_length, filter_stride, conv_name,
 # First Conv: FL256, FS256, FD1
 # Output: 50 Neurons
 # Structure: 3 Conv, 2 MLP
-def ds256ra(data_batch):
+def ds256ra(data_batch, output_size=NUM_OUTPUTS):
     filt_length = 256
     filt_depth = 128
     stride_length = 256
-    output_size = 50
 
     name = 'CL1'
     with tf.variable_scope(name):
@@ -391,13 +663,13 @@ def ds256ra(data_batch):
                                    strides=stride_length,
                                    activation=None,
                                    name='conv')
-        out_CL1 = tf.layers.batch_normalization(out_CL1, name='batchNorm', training=True)
+        out_CL1 = batch_normalization(out_CL1, 'batchNorm')
         out_CL1 = tf.nn.elu(out_CL1, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         out_CL2 = tf.layers.conv1d(out_CL1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL2 = tf.layers.batch_normalization(out_CL2, name='batchNorm', training=True)
+        out_CL2 = batch_normalization(out_CL2, 'batchNorm')
         out_CL2 = tf.nn.elu(out_CL2, name='nonLin')
 
     name = 'MP1'
@@ -406,7 +678,7 @@ def ds256ra(data_batch):
     name = 'CL3'
     with tf.variable_scope(name):
         out_CL3 = tf.layers.conv1d(out_MP1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL3 = tf.layers.batch_normalization(out_CL3, name='batchNorm', training=True)
+        out_CL3 = batch_normalization(out_CL3, 'batchNorm')
         out_CL3 = tf.nn.elu(out_CL3, name='nonLin')
 
     name = 'MP2'
@@ -425,14 +697,13 @@ def ds256ra(data_batch):
 
 # Model proposed by Dieleman et al. using FBanks data
 # Structure: 2 Conv, 2 MLP
-def ds256fa(data_batch):
-    output_size = 50
+def ds256fa(data_batch, output_size=NUM_OUTPUTS):
     outputs = {}
 
     name = 'CL1'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(data_batch, 32, (8, 1), strides=(1, 1), activation=None,  name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP1'
@@ -441,7 +712,7 @@ def ds256fa(data_batch):
     name = 'CL2'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(outputs['MP1'], 32, (8, 1), strides=(1, 1), activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP2'
@@ -462,7 +733,7 @@ def ds256fa(data_batch):
 # First Conv: FL256, FS256, FD1
 # Output: 200 neurons
 # Structure: 3 Conv, 2 MLP
-def ds256rb(data_batch):
+def ds256rb(data_batch, output_size=NUM_OUTPUTS):
     filt_length = 256
     filt_depth = 128
     stride_length = 256
@@ -475,13 +746,13 @@ def ds256rb(data_batch):
                                    strides=stride_length,
                                    activation=None,
                                    name='conv')
-        out_CL1 = tf.layers.batch_normalization(out_CL1, name='batchNorm', training=True)
+        out_CL1 = batch_normalization(out_CL1, 'batchNorm')
         out_CL1 = tf.nn.elu(out_CL1, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         out_CL2 = tf.layers.conv1d(out_CL1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL2 = tf.layers.batch_normalization(out_CL2, name='batchNorm', training=True)
+        out_CL2 = batch_normalization(out_CL2, 'batchNorm')
         out_CL2 = tf.nn.elu(out_CL2, name='nonLin')
 
     name = 'MP1'
@@ -490,7 +761,7 @@ def ds256rb(data_batch):
     name = 'CL3'
     with tf.variable_scope(name):
         out_CL3 = tf.layers.conv1d(out_MP1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL3 = tf.layers.batch_normalization(out_CL3, name='batchNorm', training=True)
+        out_CL3 = batch_normalization(out_CL3, 'batchNorm')
         out_CL3 = tf.nn.elu(out_CL3, name='nonLin')
 
     name = 'MP2'
@@ -501,11 +772,11 @@ def ds256rb(data_batch):
 
     name = 'FCL1'
     out_FCL1 = tf.layers.dense(out_FLTN, 1000, activation=tf.nn.elu, name=name)
-    out_FCL1 = tf.layers.dropout(out_FCL1, training=True)
+    out_FCL1 = dropout(out_FCL1)
 
     name = 'FCL2'
     out_FCL2 = tf.layers.dense(out_FCL1, 200, activation=tf.nn.elu, name=name)
-    out_FCL2 = tf.layers.dropout(out_FCL2, training=True)
+    out_FCL2 = dropout(out_FCL2)
     return out_FCL2
 
 
@@ -513,7 +784,7 @@ def ds256rb(data_batch):
 # First Conv: FL256, FS256, FD1
 # Output: 3x1x32
 # Structure: 4 Conv
-def ds256rc(data_batch):
+def ds256rc(data_batch, output_size=NUM_OUTPUTS):
     filt_length = 256
     filt_depth = 128
     stride_length = 256
@@ -526,13 +797,13 @@ def ds256rc(data_batch):
                                    strides=stride_length,
                                    activation=None,
                                    name='conv')
-        out_CL1 = tf.layers.batch_normalization(out_CL1, name='batchNorm', training=True)
+        out_CL1 = batch_normalization(out_CL1, 'batchNorm')
         out_CL1 = tf.nn.elu(out_CL1, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         out_CL2 = tf.layers.conv1d(out_CL1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL2 = tf.layers.batch_normalization(out_CL2, name='batchNorm', training=True)
+        out_CL2 = batch_normalization(out_CL2, 'batchNorm')
         out_CL2 = tf.nn.elu(out_CL2, name='nonLin')
 
     name = 'MP1'
@@ -541,7 +812,7 @@ def ds256rc(data_batch):
     name = 'CL3'
     with tf.variable_scope(name):
         out_CL3 = tf.layers.conv1d(out_MP1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL3 = tf.layers.batch_normalization(out_CL3, name='batchNorm', training=True)
+        out_CL3 = batch_normalization(out_CL3, 'batchNorm')
         out_CL3 = tf.nn.elu(out_CL3, name='nonLin')
     return out_CL3
 
@@ -553,19 +824,18 @@ def ds256rc(data_batch):
 
 # Basic CNN for raw data with
 # batch normalization.
-def mkc_r(data_batch):
-    output_size = 50
+def mkc_r(data_batch, output_size=NUM_OUTPUTS):
     outputs = {}
     name = 'CL1'
     with tf.variable_scope(name):
         output = tf.layers.conv1d(data_batch, 4, 16, strides=16, activation=None,  name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         output = tf.layers.conv1d(outputs['CL1'], 8, 8, strides=4, activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP1'
@@ -574,7 +844,7 @@ def mkc_r(data_batch):
     name = 'CL3'
     with tf.variable_scope(name):
         output = tf.layers.conv1d(outputs['MP1'], 12, 4, strides=1, activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP2'
@@ -596,19 +866,18 @@ def mkc_r(data_batch):
 
 # Basic CNN for fbanks data with
 # batch normalization.
-def mkc_f(data_batch):
-    output_size = 50
+def mkc_f(data_batch, output_size=NUM_OUTPUTS):
     outputs = {}
     name = 'CL1'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(data_batch, 4, [16, 1], strides=[16, 1], activation=None,  name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(outputs['CL1'], 8, [8, 1], strides=[4, 1], activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP1'
@@ -617,7 +886,7 @@ def mkc_f(data_batch):
     name = 'CL3'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(outputs['MP1'], 12, [4, 1], strides=[1, 1], activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP2'
@@ -635,3 +904,16 @@ def mkc_f(data_batch):
     name = 'FCL3'
     outputs[name] = tf.layers.dense(outputs['FCL2'], output_size, activation=tf.identity, name=name)
     return outputs[name]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Spec Models
+# ---------------------------------------------------------------------------------------------------------------------
+
+
+# Deeper Models similar to proposed by Lee et al.
+# Raw data, layers in MODEL_SPECS
+# Structure: 7 Conv, 1 MLP
+dm16_ra = spec_model('dm16_ra')
+dm64_ra = spec_model('dm64_ra')
+dm128_ra = spec_model('dm128_ra')
@@ -2,11 +2,17 @@
 
 import tensorflow as tf
 
+from .models import batch_normalization, check_model, dropout, map_windows, spec_model
+
 TRAIN, EVAL, PREDICT = 'TRAIN', 'EVAL', 'PREDICT'
 STME, SPM = 'STME', 'SPM'
 
 TRUE_POSITIVE_FACTOR = 10
 TAG_BALANCING_FACTOR = 10
+
+# Default number of tags in the targets
+NUM_OUTPUTS = 50
+
 # ---------------------------------------------------------------------------------------------------------------------
 # Controller
 # ---------------------------------------------------------------------------------------------------------------------
@@ -24,6 +30,9 @@ def controller(function_name,
     global_step = tf.contrib.framework.get_or_create_global_step()
     model = globals()[function_name]
 
+    # Output layers follow the number of tags in the targets
+    output_size = int(targets_super_batch[0].get_shape()[-1])
+
     # Gradients array for different towers having
     # the different GPUs.
     tower_grads = []
@@ -37,10 +46,10 @@ def controller(function_name,
 
             with tf.device(GPU):
                 with tf.name_scope(GPU.replace('/', '').replace(':', '_')) as scope:
-                    logits = get_logits(model, data_batch, window, mode)
+                    logits = get_logits(model, data_batch, window, mode, output_size)
 
                     with tf.name_scope('tower_loss'):
-                        class_weights = balancing_weights(50, 'log', TAG_BALANCING_FACTOR)
+                        class_weights = balancing_weights(output_size, 'log', TAG_BALANCING_FACTOR)
                         loss = weighted_sigmoid_cross_entropy(logits=logits,
                                                               labels=targets_batch,
                                                               false_negatives_weight=TRUE_POSITIVE_FACTOR,
@@ -130,33 +139,24 @@ def average_gradients(tower_grads):
     return average_grads
 
 
-def get_logits(model, data_batch, window, mode):
+def get_logits(model, data_batch, window, mode, output_size=NUM_OUTPUTS):
     if window is None:
         # normal model
-        logits = model(data_batch, mode)
+        logits = model(data_batch, mode, output_size=output_size)
     elif window in STME and mode in TRAIN:
         # normal model
-        logits = model(data_batch, mode)
+        logits = model(data_batch, mode, output_size=output_size)
     elif window in STME and mode in EVAL:
-        # model with tf.map_fn
-        logits_array = tf.map_fn(lambda w: model(w, mode),
-                                 elems=data_batch,
-                                 back_prop=True,
-                                 parallel_iterations=12,
-                                 swap_memory=True,
-                                 name='MapModels')
+        # model on every window
+        logits_array = map_windows(model, data_batch, 12, mode, output_size=output_size)
         logits = tf.reduce_mean(logits_array, axis=0, name='averageLogits')
     elif window in SPM:
         # super pooled model
-        # model with tf.map_fn
-        logits_array = tf.map_fn(lambda w: model(w, mode),
-                                 elems=data_batch,
-                                 back_prop=True,
-                                 parallel_iterations=12,
-                                 swap_memory=True,
-                                 name='MapModels')
+        # model on every window
+        logits_array = map_windows(model, data_batch, 12, mode, output_size=output_size)
 
-        logits = superpool_c(tf.stack(tf.unstack(logits_array), axis=1, name='mergingLogits'))
+        logits = superpool_c(tf.stack(tf.unstack(logits_array), axis=1, name='mergingLogits'),
+                             output_size=output_size)
 
     else:
         raise ValueError('Window type {} not recognized'.format(window))
@@ -228,85 +228,12 @@ def balancing_weights(num_classes, function_type, factor):
         raise NotImplementedError('Function {} not implemented! Only Log!'.format(function_type))
 
 
-def conv_max_layers_1d(in_layer,
-                       depth,
-                       filter_length,
-                       filter_stride,
-                       conv_name,
-                       pool_length,
-                       pool_stride,
-                       pool_name,
-                       dil_rate=1):
-
-    with tf.variable_scope(conv_name):
-        out_cl = tf.contrib.layers.conv2d(in_layer, depth, [1, filter_length],
-                                          stride=[1, filter_stride],
-                                          scope='conv',
-                                          rate=dil_rate,
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)
-
-    out_mp = tf.contrib.layers.max_pool2d(out_cl, [1, pool_length], stride=[1, pool_stride], scope=pool_name)
-    return out_mp
-
-
-def conv_avg_layers_1d(in_layer,
-                       depth,
-                       filter_length,
-                       filter_stride,
-                       conv_name,
-                       pool_length,
-                       pool_stride,
-                       pool_name,
-                       dil_rate=1):
-
-    with tf.variable_scope(conv_name):
-        out_cl = tf.contrib.layers.conv2d(in_layer, depth, [1, filter_length],
-                                          stride=[1, filter_stride],
-                                          scope='conv',
-                                          rate=dil_rate,
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)
-
-    out_mp = tf.contrib.layers.avg_pool2d(out_cl, [1, pool_length], stride=[1, pool_stride], scope=pool_name)
-    return out_mp
-
-
-def conv_layers_1d(in_layer,
-                   depth,
-                   filter_length,
-                   filter_stride,
-                   conv_name,
-                   dil_rate=1):
-
-    with tf.variable_scope(conv_name):
-        return tf.contrib.layers.conv2d(in_layer, depth, [1, filter_length],
-                                        stride=[1, filter_stride],
-                                        scope='conv',
-                                        rate=dil_rate,
-                                        activation_fn=tf.nn.elu,
-                                        normalizer_fn=tf.contrib.layers.batch_norm)
-
-def max_1d(in_layer,
-           pool_length,
-           pool_stride,
-           pool_name):
-    return tf.contrib.layers.max_pool2d(in_layer, [1, pool_length], stride=[1, pool_stride], scope=pool_name)
-
-def avg_1d(in_layer,
-           pool_length,
-           pool_stride,
-           pool_name):
-    return tf.contrib.layers.avg_pool2d(in_layer, [1, pool_length], stride=[1, pool_stride], scope=pool_name)
-
-
-
 # ---------------------------------------------------------------------------------------------------------------------
 # Super pooling models
 # ---------------------------------------------------------------------------------------------------------------------
 
 
-def superpool_a(data):
+def superpool_a(data, output_size=NUM_OUTPUTS):
     superpool_outputs = {}
     name = 'FCSL1'
     superpool_outputs[name] = tf.layers.dense(data, 600, activation=tf.nn.elu, name=name)
@@ -315,11 +242,11 @@ def superpool_a(data):
     superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL1'], 600, activation=tf.nn.elu, name=name)
 
     name = 'FCSL3'
-    superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL2'], 50, activation=tf.identity, name=name)
+    superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL2'], output_size, activation=tf.identity, name=name)
     return superpool_outputs[name]
 
 
-def superpool_b(data):
+def superpool_b(data, output_size=NUM_OUTPUTS):
     superpool_outputs = {}
     name = 'FCSL1'
     output = tf.layers.dense(data, 600, activation=tf.nn.elu, name=name)
@@ -330,11 +257,11 @@ def superpool_b(data):
     superpool_outputs[name] = tf.layers.dropout(output, training=True)
 
     name = 'FCSL3'
-    superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL2'], 50, activation=tf.identity, name=name)
+    superpool_outputs[name] = tf.layers.dense(superpool_outputs['FCSL2'], output_size, activation=tf.identity, name=name)
     return superpool_outputs[name]
 
 
-def superpool_c(data):
+def superpool_c(data, output_size=NUM_OUTPUTS):
     with tf.variable_scope('CL1_SP'):
         out_cl1_sp = tf.layers.conv1d(data, 32, 3, strides=1, activation=None,
                                       name='conv', data_format='channels_first')
@@ -346,7 +273,7 @@ def superpool_c(data):
     out_fcl2_sp = tf.layers.dense(out_fltn_sp, 1500, activation=tf.nn.elu, name='FCSL2')
     out_fcl2_sp = tf.layers.dropout(out_fcl2_sp, training=True)
 
-    output_final = tf.layers.dense(out_fcl2_sp, 50, activation=tf.identity, name='FCSL3')
+    output_final = tf.layers.dense(out_fcl2_sp, output_size, activation=tf.identity, name='FCSL3')
     return output_final
 
 
@@ -357,19 +284,18 @@ def superpool_c(data):
 
 # Basic CNN for raw data with
 # batch normalization.
-def mkc_r(data_batch, mode):
-    output_size=50
+def mkc_r(data_batch, mode, output_size=NUM_OUTPUTS):
     outputs = {}
     name = 'CL1'
     with tf.variable_scope(name):
         output = tf.layers.conv1d(data_batch, 4, 16, strides=16, activation=None,  name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         output = tf.layers.conv1d(outputs['CL1'], 8, 8, strides=4, activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP1'
@@ -378,7 +304,7 @@ def mkc_r(data_batch, mode):
     name = 'CL3'
     with tf.variable_scope(name):
         output = tf.layers.conv1d(outputs['MP1'], 12, 4, strides=1, activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP2'
@@ -400,19 +326,18 @@ def mkc_r(data_batch, mode):
 
 # Basic CNN for fbanks data with
 # batch normalization.
-def mkc_f(data_batch, mode):
-    output_size=50
+def mkc_f(data_batch, mode, output_size=NUM_OUTPUTS):
     outputs = {}
     name = 'CL1'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(data_batch, 4, [16, 1], strides=[16, 1], activation=None,  name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)#(mode==TRAIN))
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(outputs['CL1'], 8, [8, 1], strides=[4, 1], activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)#(mode==TRAIN))
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP1'
@@ -421,7 +346,7 @@ def mkc_f(data_batch, mode):
     name = 'CL3'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(outputs['MP1'], 12, [4, 1], strides=[1, 1], activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)#(mode==TRAIN))
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP2'
@@ -450,11 +375,10 @@ def mkc_f(data_batch, mode):
 # First Conv: FL256, FS256, FD1
 # Output: 50 Neurons
 # Structure: 3 Conv, 2 MLP
-def ds256ra(data_batch, mode):
+def ds256ra(data_batch, mode, output_size=NUM_OUTPUTS):
     filt_length = 256
     filt_depth = 128
     stride_length = 256
-    output_size = 50
 
     name = 'CL1'
     with tf.variable_scope(name):
@@ -464,13 +388,13 @@ def ds256ra(data_batch, mode):
                                    strides=stride_length,
                                    activation=None,
                                    name='conv')
-        out_cl1 = tf.layers.batch_normalization(out_cl1, name='batchNorm', training=True)
+        out_cl1 = batch_normalization(out_cl1, 'batchNorm')
         out_cl1 = tf.nn.elu(out_cl1, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         out_cl2 = tf.layers.conv1d(out_cl1, 32, 8, strides=1, activation=None, name='conv')
-        out_cl2 = tf.layers.batch_normalization(out_cl2, name='batchNorm', training=True)
+        out_cl2 = batch_normalization(out_cl2, 'batchNorm')
         out_cl2 = tf.nn.elu(out_cl2, name='nonLin')
 
     name = 'MP1'
@@ -479,7 +403,7 @@ def ds256ra(data_batch, mode):
     name = 'CL3'
     with tf.variable_scope(name):
         out_cl3 = tf.layers.conv1d(out_mp1, 32, 8, strides=1, activation=None, name='conv')
-        out_cl3 = tf.layers.batch_normalization(out_cl3, name='batchNorm', training=True)
+        out_cl3 = batch_normalization(out_cl3, 'batchNorm')
         out_cl3 = tf.nn.elu(out_cl3, name='nonLin')
 
     name = 'MP2'
@@ -498,14 +422,13 @@ def ds256ra(data_batch, mode):
 
 # Model proposed by Dieleman et al. using FBanks data
 # Structure: 2 Conv, 2 MLP
-def ds256fa(data_batch, mode):
-    output_size = 50
+def ds256fa(data_batch, mode, output_size=NUM_OUTPUTS):
     outputs = {}
 
     name = 'CL1'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(data_batch, 32, (8, 1), strides=(1, 1), activation=None,  name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP1'
@@ -514,7 +437,7 @@ def ds256fa(data_batch, mode):
     name = 'CL2'
     with tf.variable_scope(name):
         output = tf.layers.conv2d(outputs['MP1'], 32, (8, 1), strides=(1, 1), activation=None, name='conv')
-        output = tf.layers.batch_normalization(output, name='batchNorm', training=True)
+        output = batch_normalization(output, 'batchNorm')
         outputs[name] = tf.nn.elu(output, name='nonLin')
 
     name = 'MP2'
@@ -535,11 +458,10 @@ def ds256fa(data_batch, mode):
 # First Conv: FL256, FS256, FD1
 # Output: 200 neurons
 # Structure: 3 Conv, 2 MLP
-def ds256rb(data_batch, mode):
+def ds256rb(data_batch, mode, output_size=NUM_OUTPUTS):
     filt_length = 256
     filt_depth = 128
     stride_length = 256
-    output_size = 50
     outputs = {}
 
     name = 'CL1'
@@ -550,13 +472,13 @@ def ds256rb(data_batch, mode):
                                    strides=stride_length,
                                    activation=None,
                                    name='conv')
-        out_CL1 = tf.layers.batch_normalization(out_CL1, name='batchNorm', training=True)
+        out_CL1 = batch_normalization(out_CL1, 'batchNorm')
         out_CL1 = tf.nn.elu(out_CL1, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         out_CL2 = tf.layers.conv1d(out_CL1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL2 = tf.layers.batch_normalization(out_CL2, name='batchNorm', training=True)
+        out_CL2 = batch_normalization(out_CL2, 'batchNorm')
         out_CL2 = tf.nn.elu(out_CL2, name='nonLin')
 
     name = 'MP1'
@@ -565,7 +487,7 @@ def ds256rb(data_batch, mode):
     name = 'CL3'
     with tf.variable_scope(name):
         out_CL3 = tf.layers.conv1d(out_MP1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL3 = tf.layers.batch_normalization(out_CL3, name='batchNorm', training=True)
+        out_CL3 = batch_normalization(out_CL3, 'batchNorm')
         out_CL3 = tf.nn.elu(out_CL3, name='nonLin')
 
     name = 'MP2'
@@ -576,11 +498,11 @@ def ds256rb(data_batch, mode):
 
     name = 'FCL1'
     out_FCL1 = tf.layers.dense(out_FLTN, 1000, activation=tf.nn.elu, name=name)
-    out_FCL1 = tf.layers.dropout(out_FCL1, training=True)
+    out_FCL1 = dropout(out_FCL1)
 
     name = 'FCL2'
     out_FCL2 = tf.layers.dense(out_FCL1, 200, activation=tf.identity, name=name)
-    out_FCL2 = tf.layers.dropout(out_FCL2, training=True)
+    out_FCL2 = dropout(out_FCL2)
     return out_FCL2
 
 
@@ -588,11 +510,10 @@ def ds256rb(data_batch, mode):
 # First Conv: FL256, FS256, FD1
 # Output: 3x1x32
 # Structure: 4 Conv
-def ds256rc(data_batch, mode):
+def ds256rc(data_batch, mode, output_size=NUM_OUTPUTS):
     filt_length = 256
     filt_depth = 128
     stride_length = 256
-    output_size = 50
     outputs = {}
 
     name = 'CL1'
@@ -603,13 +524,13 @@ def ds256rc(data_batch, mode):
                                    strides=stride_length,
                                    activation=None,
                                    name='conv')
-        out_CL1 = tf.layers.batch_normalization(out_CL1, name='batchNorm', training=True)
+        out_CL1 = batch_normalization(out_CL1, 'batchNorm')
         out_CL1 = tf.nn.elu(out_CL1, name='nonLin')
 
     name = 'CL2'
     with tf.variable_scope(name):
         out_CL2 = tf.layers.conv1d(out_CL1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL2 = tf.layers.batch_normalization(out_CL2, name='batchNorm', training=True)
+        out_CL2 = batch_normalization(out_CL2, 'batchNorm')
         out_CL2 = tf.nn.elu(out_CL2, name='nonLin')
 
     name = 'MP1'
@@ -618,480 +539,35 @@ def ds256rc(data_batch, mode):
     name = 'CL3'
     with tf.variable_scope(name):
         out_CL3 = tf.layers.conv1d(out_MP1, 32, 8, strides=1, activation=None, name='conv')
-        out_CL3 = tf.layers.batch_normalization(out_CL3, name='batchNorm', training=True)
+        out_CL3 = batch_normalization(out_CL3, 'batchNorm')
         out_CL3 = tf.nn.elu(out_CL3, name='nonLin')
     return out_CL3
 
 
 # ---------------------------------------------------------------------------------------------------------------------
-# DM Models
+# Spec Models
 # ---------------------------------------------------------------------------------------------------------------------
 
 
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm8_ra(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 8],
-                                          stride=[1, 8],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 4854
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1')  # 1212
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 4, 4, 'MP2')  # 302
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 74
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 4, 4, 'MP4')  # 17
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 6
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm16_ra(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 16],
-                                          stride=[1, 16],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 2427
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1')  # 605
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 4, 4, 'MP2')  # 150
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 17
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 6
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm16_rb(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 16],
-                                          stride=[1, 16],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 2427
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1')  # 605
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 4, 4, 'MP2')  # 150
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 17
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 6
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.identity, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm16_rc(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 16],
-                                          stride=[1, 16],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 29124
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 8, 8, 'MP1')  # 3640
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 8, 8, 'MP2')  # 454
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 113
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 4, 4, 'MP4')  # 27
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 4, 4, 'MP5')  # 5
-
-    with tf.variable_scope('CL7'):
-        out_l7 = tf.contrib.layers.conv2d(out_l6, 512, [1, 4],
-                                          stride=[1, 4],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm64_ra(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 64],
-                                          stride=[1, 64],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 606
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1')  # 150
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 2, 2, 'MP2')  # 73
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 2, 2, 'MP3')  # 34
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 15
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 5
-
-    with tf.variable_scope('CL7'):
-        out_l7 = tf.contrib.layers.conv2d(out_l6, 512, [1, 4],
-                                          stride=[1, 4],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dm128_ra(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 128],
-                                          stride=[1, 128],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 303
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 2, 2, 'MP1')  # 149
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 2, 2, 'MP2')  # 72
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 2, 2, 'MP3')  # 34
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 15
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 5
-
-    with tf.variable_scope('CL7'):
-        out_l7 = tf.contrib.layers.conv2d(out_l6, 512, [1, 4],
-                                          stride=[1, 4],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# ---------------------------------------------------------------------------------------------------------------------
-# DL Models
-# ---------------------------------------------------------------------------------------------------------------------
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dl16_16_ra(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 16],
-                                          stride=[1, 16],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 2427
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1', dil_rate=16)  # 605
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 4, 4, 'MP2', dil_rate=8)  # 150
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3', dil_rate=4)  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4', dil_rate=2)  # 17
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 6
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dl16_8_ra(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 16],
-                                          stride=[1, 16],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 2427
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1', dil_rate=8)  # 605
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 4, 4, 'MP2', dil_rate=4)  # 150
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3', dil_rate=2)  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 17
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 6
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def dl16_4_ra(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    with tf.variable_scope('CL1'):
-        out_l1 = tf.contrib.layers.conv2d(data, 64, [1, 16],
-                                          stride=[1, 16],
-                                          scope='conv',
-                                          activation_fn=tf.nn.elu,
-                                          normalizer_fn=tf.contrib.layers.batch_norm)  # 2427
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1', dil_rate=4)  # 605
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 4, 4, 'MP2', dil_rate=2)  # 150
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 2, 2, 'MP4')  # 17
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 2, 2, 'MP5')  # 6
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# ---------------------------------------------------------------------------------------------------------------------
-# MUL Models
-# ---------------------------------------------------------------------------------------------------------------------
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def mul16a(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    out_l1 = conv_layers_1d(data, 64, 16, 16, 'CL1')  # 2427
-
-    out_l2a = conv_max_layers_1d(out_l1, 32, 4, 1, 'CL2a', 4, 4, 'MP1a')  # 606
-    out_l2b = conv_avg_layers_1d(out_l1, 32, 16, 1, 'CL2b', 4, 4, 'MP1b')  # 606
-
-    out_l2 = tf.concat([out_l2a, out_l2b], axis=-1)
-
-    out_l3a = conv_max_layers_1d(out_l2, 64, 4, 1, 'CL3a', 4, 4, 'MP2a')  # 151
-    out_l3b = conv_avg_layers_1d(out_l2, 64, 16, 1, 'CL3b', 4, 4, 'MP2b')  # 151
-
-    out_l3 = tf.concat([out_l3a, out_l3b], axis=-1)
-
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 4, 4, 'MP4')  # 9
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 4, 4, 'MP5')  # 2
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def mul16b(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    out_l1 = conv_layers_1d(data, 32, 16, 16, 'CL1')  # 2427
-
-    out_l2a = conv_max_layers_1d(out_l1, 32, 4, 1, 'CL2a', 4, 4, 'MP1a')  # 606
-
-    out_l2ba = conv_layers_1d(out_l1, 32, 8, 1, 'CL2ba', dil_rate=8)
-    out_l2bb = conv_layers_1d(out_l2ba, 32, 8, 1, 'CL2bb', dil_rate=4)
-    out_l2b = conv_avg_layers_1d(out_l2bb, 32, 8, 1, 'CL2b', 4, 4, 'MP1b', dil_rate=2)
-
-    out_l2 = tf.concat([out_l2a, out_l2b], axis=-1)
-
-    out_l3a = conv_max_layers_1d(out_l2, 64, 4, 1, 'CL3a', 4, 4, 'MP2a')  # 151
-
-    out_l3ba = conv_layers_1d(out_l2, 32, 8, 1, 'CL3ba', dil_rate=8)
-    out_l3bb = conv_layers_1d(out_l3ba, 32, 8, 1, 'CL3bb', dil_rate=4)
-    out_l3b = conv_avg_layers_1d(out_l3bb, 32, 8, 1, 'CL3b', 4, 4, 'MP2b', dil_rate=2)
-
-    out_l3 = tf.concat([out_l3a, out_l3b], axis=-1)
-
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 4, 4, 'MP4')  # 9
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 4, 4, 'MP5')  # 2
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def mul16c(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    out_l1 = conv_layers_1d(data, 32, 16, 16, 'CL1')  # 2427
-
-    out_l2a = conv_max_layers_1d(out_l1, 32, 4, 1, 'CL2a', 4, 4, 'MP1a')  # 606
-    out_l2ba = conv_layers_1d(out_l1, 32, 8, 1, 'CL2ba', dil_rate=8)
-    out_l2bb = conv_layers_1d(out_l2ba, 32, 8, 1, 'CL2bb', dil_rate=4)
-    out_l2b = conv_avg_layers_1d(out_l2bb, 32, 8, 1, 'CL2b', 4, 4, 'MP1b', dil_rate=2)
-    out_l2c = conv_avg_layers_1d(out_l1, 32, 16, 1, 'CL2c', 4, 4, 'MP1c')
-    out_l2 = tf.concat([out_l2a, out_l2b, out_l2c], axis=-1)
-
-    out_l3a = conv_max_layers_1d(out_l2, 64, 4, 1, 'CL3a', 4, 4, 'MP2a')  # 151
-    out_l3ba = conv_layers_1d(out_l2, 32, 8, 1, 'CL3ba', dil_rate=8)
-    out_l3bb = conv_layers_1d(out_l3ba, 32, 8, 1, 'CL3bb', dil_rate=4)
-    out_l3b = conv_avg_layers_1d(out_l3bb, 32, 8, 1, 'CL3b', 4, 4, 'MP2b', dil_rate=2)
-    out_l3c = conv_avg_layers_1d(out_l2, 64, 16, 1, 'CL3c', 4, 4, 'MP2c')
-    out_l3 = tf.concat([out_l3a, out_l3b, out_l3c], axis=-1)
-
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 4, 4, 'MP4')  # 9
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 4, 4, 'MP5')  # 2
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def mul16d(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    out_l1a = conv_layers_1d(data, 32, 16, 16, 'CL1a')
-    out_l1b = conv_layers_1d(data, 64, 64, 16, 'CL1b')
-    out_l1 = tf.concat([out_l1a, out_l1b], axis=-1)
-
-    out_l2a = conv_max_layers_1d(out_l1, 32, 4, 1, 'CL2a', 4, 4, 'MP1a')  # 606
-    out_l2b = conv_avg_layers_1d(out_l1, 32, 16, 1, 'CL2b', 4, 4, 'MP1b')  # 606
-
-    out_l2 = tf.concat([out_l2a, out_l2b], axis=-1)
-
-    out_l3a = conv_max_layers_1d(out_l2, 64, 4, 1, 'CL3a', 4, 4, 'MP2a')  # 151
-    out_l3b = conv_avg_layers_1d(out_l2, 64, 16, 1, 'CL3b', 4, 4, 'MP2b')  # 151
-
-    out_l3 = tf.concat([out_l3a, out_l3b], axis=-1)
-
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')  # 39
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 4, 4, 'MP4')  # 9
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 4, 4, 'MP5')  # 2
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
-# Structure: 7 Conv, 1 MLP
-def mul16ds(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    out_l1a = conv_layers_1d(data, 32, 16, 16, 'CL1a')
-    out_l1b = conv_layers_1d(data, 64, 64, 16, 'CL1b')
-    out_l1 = tf.concat([out_l1a, out_l1b], axis=-1)
-
-    out_l2 = conv_max_layers_1d(out_l1, 64, 4, 1, 'CL2', 4, 4, 'MP1')
-    out_l3 = conv_max_layers_1d(out_l2, 128, 4, 1, 'CL3', 4, 4, 'MP2')
-    out_l4 = conv_max_layers_1d(out_l3, 128, 4, 1, 'CL4', 4, 4, 'MP3')
-    out_l5 = conv_max_layers_1d(out_l4, 256, 4, 1, 'CL5', 4, 4, 'MP4')
-    out_l6 = conv_max_layers_1d(out_l5, 256, 4, 1, 'CL6', 4, 4, 'MP5')
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
-
-
-# Deeper Model similar to proposed by Lee et al.
-# Raw data
-# Output: 50 Neurons
+# Deeper Models similar to proposed by Lee et al.
+# Raw data, layers in MODEL_SPECS
 # Structure: 7 Conv, 1 MLP
-def mul16f(data_batch, mode):
-
-    data = tf.expand_dims(data_batch, axis=1)
-    out_l1 = conv_layers_1d(data, 64, 16, 16, 'CL1')
-
-    out_l2aa = conv_layers_1d(out_l1, 32, 4, 1, 'CL2aa')  # 606
-    out_l2ab = conv_max_layers_1d(out_l2aa, 32, 4, 1, 'CL2ab', 4, 4, 'MP1')  # 606
-    out_l2b = avg_1d(out_l1, 4, 4, 'AVG1')
-    out_l2 = tf.concat([out_l2ab, out_l2b], axis=-1)
-
-    out_l3aa = conv_layers_1d(out_l2, 32, 4, 1, 'CL3aa')  # 151
-    out_l3ab = conv_max_layers_1d(out_l3aa, 32, 4, 1, 'CL3ab', 4, 4, 'MP2')  # 151
-    out_l3b = avg_1d(out_l2, 4, 4, 'AVG2')
-    out_l3 = tf.concat([out_l3ab, out_l3b], axis=-1)
-
-    out_l4aa = conv_layers_1d(out_l3, 32, 4, 1, 'CL4aa')  # 151
-    out_l4ab = conv_max_layers_1d(out_l4aa, 32, 4, 1, 'CL4ab', 4, 4, 'MP3')  # 39
-    out_l4b = avg_1d(out_l3, 4, 4, 'AVG3')
-    out_l4 = tf.concat([out_l4ab, out_l4b], axis=-1)
-
-    out_l5aa = conv_layers_1d(out_l4, 64, 4, 1, 'CL5aa')  # 151
-    out_l5ab = conv_max_layers_1d(out_l5aa, 64, 4, 1, 'CL5ab', 4, 4, 'MP4')  # 9
-    out_l5b = avg_1d(out_l4, 4, 4, 'AVG4')
-    out_l5 = tf.concat([out_l5ab, out_l5b], axis=-1)
-
-    out_l6aa = conv_layers_1d(out_l5, 64, 4, 1, 'CL6aa')  # 151
-    out_l6ab = conv_max_layers_1d(out_l6aa, 64, 4, 1, 'CL6ab', 4, 4, 'MP5')  # 2
-    out_l6b = avg_1d(out_l5, 4, 4, 'AVG5')
-    out_l6 = tf.concat([out_l6ab, out_l6b], axis=-1)
-
-    out_l7 = conv_max_layers_1d(out_l6, 512, 4, 1, 'CL7', 2, 2, 'MP6')  # 1
-
-    out_drop = tf.contrib.layers.dropout(out_l7)
-    out_fltn = tf.reshape(out_drop, [int(out_drop.shape[0]), -1], name='FLTN')
-    out_fcl = tf.layers.dense(out_fltn, 50, activation=tf.nn.sigmoid, name='FCL')
-    return out_fcl
+dm8_ra = spec_model('dm8_ra')
+dm16_ra = spec_model('dm16_ra')
+dm16_rb = spec_model('dm16_rb')
+dm16_rc = spec_model('dm16_rc')
+dm64_ra = spec_model('dm64_ra')
+dm128_ra = spec_model('dm128_ra')
+
+# Deeper Models with dilated convolutions
+dl16_16_ra = spec_model('dl16_16_ra')
+dl16_8_ra = spec_model('dl16_8_ra')
+dl16_4_ra = spec_model('dl16_4_ra')
+
+# Multi-branch models
+mul16a = spec_model('mul16a')
+mul16b = spec_model('mul16b')
+mul16c = spec_model('mul16c')
+mul16d = spec_model('mul16d')
+mul16ds = spec_model('mul16ds')
+mul16f = spec_model('mul16f')
@@ -16,7 +16,8 @@ import threading
 
 import tensorflow as tf
 
-from cloud.backup.dataproviders import DataProvider
+from .dataproviders import (DataProvider, EvalDataCache, InputMonitorHook, QUEUE_BACKEND, RAW_FEATURES, ShardCache,
+                            load_tag_selection)
 from . import models as models
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
@@ -25,6 +26,7 @@ tf.logging.set_verbosity(tf.logging.INFO)
 TRAIN_CHECKPOINT = 120
 TRAIN_SUMMARIES = 120
 CHECKPOINT_PER_EVAL = 5
+INPUT_MONITOR_STEPS = 100
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -41,6 +43,8 @@ class EvaluationRunHook(tf.train.SessionRunHook):
         graph (tf.Graph): Evaluation graph
         eval_frequency (int): Frequency of evaluation every n train steps
         eval_steps (int): Evaluation steps to be performed
+        input_backend (str): Input pipeline of the evaluation graph
+        eval_cache (EvalDataCache): Cache of the evaluation split, if used
     """
 
     def __init__(self,
@@ -49,9 +53,13 @@ class EvaluationRunHook(tf.train.SessionRunHook):
                  graph,
                  eval_frequency,
                  eval_steps=None,
+                 input_backend=QUEUE_BACKEND,
+                 eval_cache=None,
                  **kwargs):
 
         self._eval_steps = eval_steps
+        self._input_backend = input_backend
+        self._eval_cache = eval_cache
         self._checkpoint_dir = checkpoint_dir
         self._kwargs = kwargs
         # self._eval_every = eval_frequency
@@ -139,8 +147,12 @@ class EvaluationRunHook(tf.train.SessionRunHook):
                 tf.local_variables_initializer()
             ])
 
-            # start queue runners to loade data
-            tf.train.start_queue_runners(coord=coord, sess=session)
+            # start queue runners to loade data, or
+            # provide the cached evaluation data
+            if self._eval_cache is not None:
+                self._eval_cache.initialize(session, coord)
+            elif self._input_backend == QUEUE_BACKEND:
+                tf.train.start_queue_runners(coord=coord, sess=session)
             train_step = session.run(self._gs)
 
             # metadata options for evaluation run
@@ -191,8 +203,29 @@ def run(target,
         eval_num_epochs,
         num_epochs,
         target_size,
+        selective_tags,
         num_song_samples,
-        windowing_type):
+        windowing_type,
+        fold,
+        input_backend,
+        shuffle_buffer_mb,
+        cache_eval_data,
+        window_count,
+        window_length,
+        window_hop,
+        num_excerpts,
+        excerpt_length,
+        tag_balance,
+        cache_dir,
+        cache_size_mb,
+        echo_factor,
+        auto_echo,
+        synthetic_data,
+        input_features,
+        max_params,
+        max_activation_mb,
+        worker_index=0,
+        num_workers=1):
     """Run the training and evaluation graph.
 
     Args:
@@ -217,12 +250,42 @@ def run(target,
         eval_num_epochs (int): Number of epochs during evaluation
         num_epochs (int): Maximum number of training data epochs on which to train
         target_size (int): The number of tags being use as an output
+        selective_tags (filename): Filename for selective tags in json, which
+            replace the top target_size tags as outputs
         num_song_samples (int): Samples from the songs to be used for training
         windowing_type (str): Windowing type for the model
             STME: Seperate training and merged evaluation
             SPM: Super-pooled model
+        fold (int): Cross-validation fold held out for evaluation
+        input_backend (str): Input pipeline built from queue runners or tf.data
+        shuffle_buffer_mb (float): Memory budget of the training shuffle buffer in MB
+        cache_eval_data (bool): Decode the evaluation split once and evaluate from memory
+        window_count (int): Windows cut from full-clip records, or None for windowed records
+        window_length (int): Samples in every window cut
+        window_hop (int): Samples between the starts of consecutive windows
+        num_excerpts (int): Random excerpts drawn from every training song, or None
+        excerpt_length (int): Samples in every excerpt
+        tag_balance (float): Strength of the resampling of the training songs by their rarest tag, or None
+        cache_dir (str): Local directory caching the files read, or None
+        cache_size_mb (float): Maximum size of the cache in MB
+        echo_factor (int): Times every training example is reused, or None
+        auto_echo (bool): Echo the training examples only while the input stalls
+        synthetic_data (bool): Train and evaluate on random batches shaped from the metadata
+        input_features (str): Samples of the records or log-mel filterbanks computed from raw records
+        max_params (int): Maximum number of parameters of the model, or None
+        max_activation_mb (float): Maximum activation memory of the training batches in MB, or None
+        worker_index (int): Index of this node among the nodes reading training data
+        num_workers (int): Number of nodes reading training data
     """
 
+    # Names of the tags projected from the targets while decoding,
+    # the output layers follow the size of the selection
+    selected_tags = load_tag_selection(selective_tags) if selective_tags else None
+
+    # Files copied to a local cache while read, shared by the
+    # training and evaluation data providers
+    shard_cache = ShardCache(cache_dir, cache_size_mb) if cache_dir else None
+
     # If the server is chief which is `master`
     # In between graph replication Chief is one node in
     # the cluster with extra responsibility and by default
@@ -238,22 +301,41 @@ def run(target,
         evaluation_graph = tf.Graph()
         with evaluation_graph.as_default():
 
-            # Evaluation data provider
+            # Evaluation data provider, read once into
+            # memory when caching the evaluation data
             eval_data = DataProvider(
-                [eval_files],
+                [eval_files] if eval_files else None,
                 metadata_files,
                 batch_size=eval_batch_size,
-                num_epochs=eval_num_epochs,
+                num_epochs=1 if cache_eval_data else eval_num_epochs,
                 num_tags=target_size,
-                num_samples=num_song_samples
+                selected_tags=selected_tags,
+                num_samples=num_song_samples,
+                split='valid',
+                fold=fold,
+                shuffle=not cache_eval_data,
+                backend=input_backend,
+                shard_cache=shard_cache,
+                synthetic=synthetic_data,
+                features=input_features,
+                window_count=window_count,
+                window_length=window_length,
+                window_hop=window_hop
             )
 
-            if windowing_type is None:
+            if windowing_type is not None and windowing_type not in ['SPM', 'STME']:
+                raise ValueError('windowing_type {} not recognised'.format(windowing_type))
+
+            if cache_eval_data:
+                eval_cache = EvalDataCache(eval_data, windows=windowing_type is not None,
+                                           num_epochs=eval_num_epochs)
+                features, labels = eval_cache.batch_in()
+            elif windowing_type is None:
+                eval_cache = None
                 features, labels = eval_data.batch_in()
-            elif windowing_type == 'SPM' or windowing_type == 'STME':
-                features, labels = eval_data.windows_batch_in()
             else:
-                raise ValueError('windowing_type {} not recognised'.format(windowing_type))
+                eval_cache = None
+                features, labels = eval_data.windows_batch_in()
 
             # Model for evaluation
             metrics = models.controller(
@@ -271,7 +353,9 @@ def run(target,
             metrics,
             evaluation_graph,
             eval_frequency,
-            eval_steps=eval_steps
+            eval_steps=eval_steps,
+            input_backend=input_backend,
+            eval_cache=eval_cache
         )]
 
     else:
@@ -283,12 +367,30 @@ def run(target,
         with tf.device(tf.train.replica_device_setter(cluster=cluster_spec)):
             # Training data provider
             train_data = DataProvider(
-                [train_files],
+                [train_files] if train_files else None,
                 metadata_files,
                 batch_size=train_batch_size,
                 num_epochs=num_epochs,
                 num_tags=target_size,
-                num_samples=num_song_samples
+                selected_tags=selected_tags,
+                num_samples=num_song_samples,
+                split='train',
+                fold=fold,
+                backend=input_backend,
+                shard_cache=shard_cache,
+                synthetic=synthetic_data,
+                features=input_features,
+                window_count=window_count,
+                window_length=window_length,
+                window_hop=window_hop,
+                num_excerpts=num_excerpts,
+                excerpt_length=excerpt_length,
+                tag_balance=tag_balance,
+                echo_factor=echo_factor,
+                auto_echo=auto_echo,
+                shuffle_buffer_mb=shuffle_buffer_mb,
+                worker_index=worker_index,
+                num_workers=num_workers
             )
 
             # Features and label tensors
@@ -299,6 +401,11 @@ def run(target,
             else:
                 raise ValueError('windowing_type {} not recognised'.format(windowing_type))
 
+            # Static cost of the model on the training batches, rejecting
+            # oversized models before any step runs
+            models.check_model(model_function, features, int(labels.get_shape()[-1]),
+                               max_params=max_params, max_activation_mb=max_activation_mb)
+
             # Model for training
             [train_op, global_step_tensor] = models.controller(
                 model_function,
@@ -309,6 +416,9 @@ def run(target,
                 window=windowing_type
             )
 
+        # Hook logging the input queue and warning of input stalls
+        hooks.append(InputMonitorHook(train_data, every_n_steps=INPUT_MONITOR_STEPS))
+
         if is_chief:
             train_file_writer = tf.summary.FileWriter(os.path.join(job_dir, 'eval'))
 
@@ -327,9 +437,11 @@ def run(target,
                 tf.logging.info('Starting coordinator')
             coord = tf.train.Coordinator(clean_stop_exception_types=(
                 tf.errors.CancelledError, tf.errors.OutOfRangeError))
-            if is_chief:
-                tf.logging.info('Starting queue runners')
-            tf.train.start_queue_runners(coord=coord, sess=session)
+            # The tf.data backend needs no queue runner threads
+            if input_backend == QUEUE_BACKEND:
+                if is_chief:
+                    tf.logging.info('Starting queue runners')
+                tf.train.start_queue_runners(coord=coord, sess=session)
 
             # Global step to keep track of global number of steps particularly in
             # distributed setting
@@ -393,7 +505,13 @@ def dispatch(*args, **kwargs):
         server.join()
         return
     elif job_name in ['master', 'worker']:
-        return run(server.target, cluster_spec, job_name == 'master', *args, **kwargs)
+        # Every node reading training data reads its own part,
+        # the master being the first node
+        num_masters = len(cluster.get('master', []))
+        num_workers = num_masters + len(cluster.get('worker', []))
+        worker_index = task_index if job_name == 'master' else num_masters + task_index
+        return run(server.target, cluster_spec, job_name == 'master', *args,
+                   worker_index=worker_index, num_workers=num_workers, **kwargs)
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -405,14 +523,20 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--train-files',
-                        required=True,
                         type=str,
-                        help='GCS or local dir to write checkpoints and export model')
+                        help="""\
+                        Training files as glob patterns or comma-separated lists,
+                        local or on GCS, each optionally weighted as path@weight.
+                        If not given, the files of the split in the metadata.
+                        """)
 
     parser.add_argument('--eval-files',
-                        required=True,
                         type=str,
-                        help='GCS or local dir to write checkpoints and export model')
+                        help="""\
+                        Evaluation files as glob patterns or comma-separated lists,
+                        local or on GCS, each optionally weighted as path@weight.
+                        If not given, the files of the split in the metadata.
+                        """)
 
     parser.add_argument('--metadata-files',
                         type=str,
@@ -474,6 +598,13 @@ if __name__ == "__main__":
                         default=50,
                         help='Number of tags to be used as an output')
 
+    parser.add_argument('--selective-tags',
+                        type=str,
+                        help="""\
+                        Json file listing the names of the tags used as an output,
+                        projected from the targets while reading instead of the
+                        top --target-size tags""")
+
     parser.add_argument('--num-song-samples',
                         type=int,
                         default=-1,
@@ -489,6 +620,134 @@ if __name__ == "__main__":
                         Windowing type for the model between SPM and STME.
                         """)
 
+    parser.add_argument('--fold',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Cross-validation fold held out for evaluation, the
+                        other folds are used for training. Needs the folds
+                        in the metadata.
+                        """)
+
+    parser.add_argument('--input-backend',
+                        type=str,
+                        default=QUEUE_BACKEND,
+                        help="""\
+                        Input pipeline built from queue runners (queue) or
+                        from tf.data (dataset), which reads files in parallel
+                        and needs TensorFlow 1.5 or later.
+                        """)
+
+    parser.add_argument('--shuffle-buffer-mb',
+                        type=float,
+                        default=None,
+                        help="""\
+                        Memory budget in MB of the training shuffle buffer.
+                        If not given, a buffer of 5 batches is used.
+                        """)
+
+    parser.add_argument('--cache-eval-data',
+                        action='store_true',
+                        help="""\
+                        Decode the evaluation split once into memory and
+                        feed every later evaluation from it (needs tf.data).
+                        """)
+
+    parser.add_argument('--window-count',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Number of windows cut from full-clip records at read
+                        time. If not given, windowed records are needed for
+                        the SPM and STME windowing types.
+                        """)
+
+    parser.add_argument('--window-length',
+                        type=int,
+                        default=None,
+                        help='Samples in every window, by default the clip over the window count')
+
+    parser.add_argument('--window-hop',
+                        type=int,
+                        default=None,
+                        help='Samples between the starts of windows, by default the window length')
+
+    parser.add_argument('--num-excerpts',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Number of random excerpts drawn from every training
+                        song, each being a training example. Full songs can be
+                        evaluated with STME windows of the excerpt length.
+                        """)
+
+    parser.add_argument('--excerpt-length',
+                        type=int,
+                        default=None,
+                        help='Samples in every random excerpt')
+
+    parser.add_argument('--tag-balance',
+                        type=float,
+                        default=None,
+                        help="""\
+                        Strength between 0 and 1 of the rejection resampling
+                        of the training songs by the frequency of their rarest
+                        tag, 1 accepting every tag at the rate of the rarest tag.
+                        Needs the tag counts saved in the metadata""")
+
+    parser.add_argument('--cache-dir',
+                        type=str,
+                        default=None,
+                        help="""\
+                        Local directory, such as on a local SSD, where the files
+                        read are copied in the background during the first epoch
+                        and read from in later epochs and evaluations""")
+
+    parser.add_argument('--cache-size-mb',
+                        type=float,
+                        default=None,
+                        help='Maximum size in MB of the local file cache, no file is evicted once full')
+
+    parser.add_argument('--echo-factor',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Times every decoded training example is reused, reshuffled
+                        with the other examples, when the input cannot keep up""")
+
+    parser.add_argument('--auto-echo',
+                        action='store_true',
+                        help='Echo the training examples only while the input stalls')
+
+    parser.add_argument('--synthetic-data',
+                        action='store_true',
+                        help="""\
+                        Train and evaluate on random batches with the shapes of the
+                        songs and tags in the metadata, reading no records, to
+                        measure the throughput of the model alone""")
+
+    parser.add_argument('--input-features',
+                        type=str,
+                        default=RAW_FEATURES,
+                        help="""\
+                        Features provided to the model, the samples of the records
+                        (raw) or 40 log-mel filterbanks computed from raw records
+                        while reading (log_mel), as in the fbank datasets""")
+
+    parser.add_argument('--max-params',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Maximum number of parameters of the model, models over it
+                        or without a spec being rejected before training""")
+
+    parser.add_argument('--max-activation-mb',
+                        type=float,
+                        default=None,
+                        help="""\
+                        Maximum activation memory in MB of the training batches,
+                        estimated from the spec of the model""")
+
     parse_args, unknown = parser.parse_known_args()
 
     # If unknown arguments found, warn them on the console
@@ -15,7 +15,8 @@ import os
 from . import models_mgpu as models
 import threading
 import tensorflow as tf
-from .dataproviders import DataProvider
+from .dataproviders import (DataProvider, EvalDataCache, InputMonitorHook, QUEUE_BACKEND, RAW_FEATURES, ShardCache,
+                            StagingHook, load_tag_selection, stage_towers)
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 tf.logging.set_verbosity(tf.logging.INFO)
@@ -23,8 +24,6 @@ tf.logging.set_verbosity(tf.logging.INFO)
 GPU_MEMORY_FRACTION=0.9
 EVAL_GPUS = ['/gpu:0', '/gpu:1', '/gpu:2', '/gpu:3']
 TRAIN_GPUS = ['/gpu:0', '/gpu:1', '/gpu:2', '/gpu:3']
-NUM_EVAL_GPUS = len(EVAL_GPUS)
-NUM_TRAIN_GPUS = len(TRAIN_GPUS)
 
 # Possible GPUS to use on Cloud ML
 # ['/gpu:0', '/gpu:1', '/gpu:2', '/gpu:3', '/gpu:4', '/gpu:5', '/gpu:6', '/gpu:7']
@@ -33,6 +32,20 @@ NUM_TRAIN_GPUS = len(TRAIN_GPUS)
 TRAIN_CHECKPOINT = 60
 TRAIN_SUMMARIES = 60
 CHECKPOINT_PER_EVAL = 10
+INPUT_MONITOR_STEPS = 100
+
+
+def session_config(virtual_cpus=None, **kwargs):
+    """Session configuration limiting the GPU memory used and
+    creating virtual CPU devices to run the towers on CPU-only hosts.
+
+    Args:
+        virtual_cpus (int): Number of CPU devices, /cpu:0 to /cpu:N-1
+        kwargs: Other arguments of the ConfigProto
+    """
+    gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=GPU_MEMORY_FRACTION)
+    device_count = {'CPU': virtual_cpus} if virtual_cpus else None
+    return tf.ConfigProto(gpu_options=gpu_options, device_count=device_count, **kwargs)
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -49,6 +62,9 @@ class EvaluationRunHook(tf.train.SessionRunHook):
         graph (tf.Graph): Evaluation graph
         eval_frequency (int): Frequency of evaluation every n train steps
         eval_steps (int): Evaluation steps to be performed
+        input_backend (str): Input pipeline of the evaluation graph
+        eval_cache (EvalDataCache): Cache of the evaluation split, if used
+        virtual_cpus (int): Number of virtual CPU devices of the evaluation session
     """
 
     def __init__(self,
@@ -57,9 +73,15 @@ class EvaluationRunHook(tf.train.SessionRunHook):
                  graph,
                  eval_frequency,
                  eval_steps=None,
+                 input_backend=QUEUE_BACKEND,
+                 eval_cache=None,
+                 virtual_cpus=None,
                  **kwargs):
 
         self._eval_steps = eval_steps
+        self._virtual_cpus = virtual_cpus
+        self._input_backend = input_backend
+        self._eval_cache = eval_cache
         self._checkpoint_dir = checkpoint_dir
         self._kwargs = kwargs
         # self._eval_every = eval_frequency
@@ -138,8 +160,7 @@ class EvaluationRunHook(tf.train.SessionRunHook):
         """Run model evaluation and generate summaries."""
         coord = tf.train.Coordinator(clean_stop_exception_types=(
             tf.errors.CancelledError, tf.errors.OutOfRangeError))
-        gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=GPU_MEMORY_FRACTION)
-        with tf.Session(graph=self._graph, config=tf.ConfigProto(gpu_options=gpu_options,
+        with tf.Session(graph=self._graph, config=session_config(self._virtual_cpus,
                                                                  allow_soft_placement=True)) as session:
 
             # Restores previously saved variables from latest checkpoint
@@ -153,8 +174,13 @@ class EvaluationRunHook(tf.train.SessionRunHook):
             ])
 
             # start queue runners for data queues
-            tf.logging.info('Starting evaluation queue')
-            tf.train.start_queue_runners(coord=coord, sess=session)
+            # or provide the cached evaluation data
+            if self._eval_cache is not None:
+                tf.logging.info('Initializing evaluation cache')
+                self._eval_cache.initialize(session, coord)
+            elif self._input_backend == QUEUE_BACKEND:
+                tf.logging.info('Starting evaluation queue')
+                tf.train.start_queue_runners(coord=coord, sess=session)
             train_step = session.run(self._gs)
 
             # save metadata object
@@ -208,7 +234,31 @@ def run(target,
         target_size,
         selective_tags,
         num_song_samples,
-        windowing_type):
+        windowing_type,
+        fold,
+        input_backend,
+        shuffle_buffer_mb,
+        cache_eval_data,
+        window_count,
+        window_length,
+        window_hop,
+        num_excerpts,
+        excerpt_length,
+        tag_balance,
+        cache_dir,
+        cache_size_mb,
+        echo_factor,
+        auto_echo,
+        synthetic_data,
+        input_features,
+        train_devices,
+        eval_devices,
+        virtual_cpus,
+        stage_input,
+        max_params,
+        max_activation_mb,
+        worker_index=0,
+        num_workers=1):
     """Run the training and evaluation graph.
 
     Args:
@@ -233,14 +283,47 @@ def run(target,
         eval_num_epochs (int): Number of epochs during evaluation
         num_epochs (int): Maximum number of training data epochs on which to train
         target_size (int): The number of tags being use as an output
-        selective_tags (filename): Filename for selective tags in json
+        selective_tags (filename): Filename for selective tags in json, which
+            replace the top target_size tags as outputs
         num_song_samples (int): Samples from the songs to be used for training
         windowing_type (str): The type of windowing to be used.
             None: No windowing
             STME: Seperate training and merged evaluation
             SPM: Super-pooled model
+        fold (int): Cross-validation fold held out for evaluation
+        input_backend (str): Input pipeline built from queue runners or tf.data
+        shuffle_buffer_mb (float): Memory budget of the training shuffle buffer in MB
+        cache_eval_data (bool): Decode the evaluation split once and evaluate from memory
+        window_count (int): Windows cut from full-clip records, or None for windowed records
+        window_length (int): Samples in every window cut
+        window_hop (int): Samples between the starts of consecutive windows
+        num_excerpts (int): Random excerpts drawn from every training song, or None
+        excerpt_length (int): Samples in every excerpt
+        tag_balance (float): Strength of the resampling of the training songs by their rarest tag, or None
+        cache_dir (str): Local directory caching the files read, or None
+        cache_size_mb (float): Maximum size of the cache in MB
+        echo_factor (int): Times every training example is reused, or None
+        auto_echo (bool): Echo the training examples only while the input stalls
+        synthetic_data (bool): Train and evaluate on random batches shaped from the metadata
+        input_features (str): Samples of the records or log-mel filterbanks computed from raw records
+        train_devices (str): Comma-separated devices of the training towers
+        eval_devices (str): Comma-separated devices of the evaluation towers
+        virtual_cpus (int): Number of virtual CPU devices, to run the towers on CPU-only hosts
+        stage_input (bool): Stage the next batch of every training tower on its device during the step
+        max_params (int): Maximum number of parameters of the model, or None
+        max_activation_mb (float): Maximum activation memory of the batches of a tower in MB, or None
+        worker_index (int): Index of this node among the nodes reading training data
+        num_workers (int): Number of nodes reading training data
     """
 
+    # Names of the tags projected from the targets while decoding,
+    # the output layers follow the size of the selection
+    selected_tags = load_tag_selection(selective_tags) if selective_tags else None
+
+    # Files copied to a local cache while read, shared by the
+    # training and evaluation data providers
+    shard_cache = ShardCache(cache_dir, cache_size_mb) if cache_dir else None
+
     # If the server is chief which is `master`
     # In between graph replication Chief is one node in
     # the cluster with extra responsibility and by default
@@ -253,27 +336,48 @@ def run(target,
 
 # --------------------------------------------------------------------------------------------------
 
+    train_gpus = train_devices.split(',')
+    eval_gpus = eval_devices.split(',')
+
     # Evaluation Two GPUs (6-7)
     # Data input producer CPU
     if is_chief:
         # Construct evaluation graph
         evaluation_graph = tf.Graph()
         with evaluation_graph.as_default(), tf.device('/cpu:0'):
-            # Evaluation data provider
+            # Evaluation data provider, read once into
+            # memory when caching the evaluation data
             eval_data = DataProvider(
-                [eval_files],
+                [eval_files] if eval_files else None,
                 metadata_files,
-                batch_size=eval_batch_size*NUM_EVAL_GPUS,
-                num_epochs=eval_num_epochs,
+                batch_size=eval_batch_size*len(eval_gpus),
+                num_epochs=1 if cache_eval_data else eval_num_epochs,
                 num_tags=target_size,
+                selected_tags=selected_tags,
                 num_samples=num_song_samples,
-                split_nums=NUM_EVAL_GPUS
+                split='valid',
+                fold=fold,
+                shuffle=not cache_eval_data,
+                backend=input_backend,
+                shard_cache=shard_cache,
+                synthetic=synthetic_data,
+                features=input_features,
+                window_count=window_count,
+                window_length=window_length,
+                window_hop=window_hop,
+                split_nums=len(eval_gpus)
             )
 
             # Features and label tensors
-            if windowing_type is None:
+            if cache_eval_data:
+                eval_cache = EvalDataCache(eval_data, windows=windowing_type is not None,
+                                           num_epochs=eval_num_epochs)
+                features, labels = eval_cache.batch_in()
+            elif windowing_type is None:
+                eval_cache = None
                 features, labels = eval_data.batch_in()
             else:
+                eval_cache = None
                 features, labels = eval_data.windows_batch_in()
 
             # Create evaluation model
@@ -282,7 +386,7 @@ def run(target,
                 models.EVAL,
                 features,
                 labels,
-                gpus=EVAL_GPUS,
+                gpus=eval_gpus,
                 learning_rate=learning_rate,
                 window=windowing_type
             )
@@ -293,7 +397,10 @@ def run(target,
             metrics,
             evaluation_graph,
             eval_frequency,
-            eval_steps=eval_steps
+            eval_steps=eval_steps,
+            input_backend=input_backend,
+            eval_cache=eval_cache,
+            virtual_cpus=virtual_cpus
         )]
 
     else:
@@ -304,13 +411,31 @@ def run(target,
 
         # Training data provider
         train_data = DataProvider(
-            [train_files],
+            [train_files] if train_files else None,
             metadata_files,
-            batch_size=train_batch_size*NUM_TRAIN_GPUS,
+            batch_size=train_batch_size*len(train_gpus),
             num_epochs=num_epochs,
             num_tags=target_size,
+            selected_tags=selected_tags,
             num_samples=num_song_samples,
-            split_nums=NUM_TRAIN_GPUS
+            split='train',
+            fold=fold,
+            backend=input_backend,
+            shard_cache=shard_cache,
+            synthetic=synthetic_data,
+            features=input_features,
+            window_count=window_count,
+            window_length=window_length,
+            window_hop=window_hop,
+            num_excerpts=num_excerpts,
+            excerpt_length=excerpt_length,
+            tag_balance=tag_balance,
+            echo_factor=echo_factor,
+            auto_echo=auto_echo,
+            shuffle_buffer_mb=shuffle_buffer_mb,
+            worker_index=worker_index,
+            num_workers=num_workers,
+            split_nums=len(train_gpus)
         )
 
         # Features and label tensors
@@ -321,19 +446,32 @@ def run(target,
         else:
             features, labels = train_data.windows_batch_in()
 
+        # Static cost of the model on the batches of a tower, rejecting
+        # oversized models before any step runs
+        models.check_model(model_function, features[0], int(labels[0].get_shape()[-1]),
+                           max_params=max_params, max_activation_mb=max_activation_mb)
+
+        # Batches of the next step copied to the towers during the step
+        if stage_input:
+            features, labels, stage_op = stage_towers(features, labels, train_gpus)
+
         # Model for training
         [train_op, global_step_tensor] = models.controller(
             model_function,
             models.TRAIN,
             features,
             labels,
-            gpus=TRAIN_GPUS,
+            gpus=train_gpus,
             learning_rate=learning_rate,
             window=windowing_type
         )
 
-        # GPU option to limit usage of GPU memory per process.
-        gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=GPU_MEMORY_FRACTION)
+        if stage_input:
+            train_op = tf.group(train_op, stage_op)
+            hooks.append(StagingHook(stage_op))
+
+        # Hook logging the input queue and warning of input stalls
+        hooks.append(InputMonitorHook(train_data, every_n_steps=INPUT_MONITOR_STEPS))
 
         # Creates a MonitoredSession for training
         # MonitoredSession is a Session-like object that handles
@@ -345,7 +483,7 @@ def run(target,
                                                hooks=hooks,
                                                save_checkpoint_secs=TRAIN_CHECKPOINT,
                                                save_summaries_steps=TRAIN_SUMMARIES,
-                                               config=tf.ConfigProto(gpu_options=gpu_options,
+                                               config=session_config(virtual_cpus,
                                                                      log_device_placement=True,
                                                                      allow_soft_placement=True)) as session:
 
@@ -355,7 +493,9 @@ def run(target,
             # Important to start all queue runners so that data is available
             # for reading.
             # Initialize the input_fn thread to load the queue runner.
-            tf.train.start_queue_runners(coord=coord, sess=session)
+            # The tf.data backend needs no queue runner threads.
+            if input_backend == QUEUE_BACKEND:
+                tf.train.start_queue_runners(coord=coord, sess=session)
 
             # Global step to keep track of global number of steps particularly in
             # distributed setting
@@ -410,7 +550,13 @@ def dispatch(*args, **kwargs):
         server.join()
         return
     elif job_name in ['master', 'worker']:
-        return run(server.target, cluster_spec, job_name == 'master', *args, **kwargs)
+        # Every node reading training data reads its own part,
+        # the master being the first node
+        num_masters = len(cluster.get('master', []))
+        num_workers = num_masters + len(cluster.get('worker', []))
+        worker_index = task_index if job_name == 'master' else num_masters + task_index
+        return run(server.target, cluster_spec, job_name == 'master', *args,
+                   worker_index=worker_index, num_workers=num_workers, **kwargs)
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -422,14 +568,20 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--train-files',
-                        required=True,
                         type=str,
-                        help='GCS or local dir to write checkpoints and export model')
+                        help="""\
+                        Training files as glob patterns or comma-separated lists,
+                        local or on GCS, each optionally weighted as path@weight.
+                        If not given, the files of the split in the metadata.
+                        """)
 
     parser.add_argument('--eval-files',
-                        required=True,
                         type=str,
-                        help='GCS or local dir to write checkpoints and export model')
+                        help="""\
+                        Evaluation files as glob patterns or comma-separated lists,
+                        local or on GCS, each optionally weighted as path@weight.
+                        If not given, the files of the split in the metadata.
+                        """)
 
     parser.add_argument('--metadata-files',
                         type=str,
@@ -493,7 +645,10 @@ if __name__ == "__main__":
 
     parser.add_argument('--selective-tags',
                         type=str,
-                        help='Path to selective tag file')
+                        help="""\
+                        Json file listing the names of the tags used as an output,
+                        projected from the targets while reading instead of the
+                        top --target-size tags""")
 
     parser.add_argument('--num-song-samples',
                         type=int,
@@ -513,6 +668,159 @@ if __name__ == "__main__":
                             spm: Super-pooled output layer model
                             """)
 
+    parser.add_argument('--fold',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Cross-validation fold held out for evaluation, the
+                        other folds are used for training. Needs the folds
+                        in the metadata.
+                        """)
+
+    parser.add_argument('--input-backend',
+                        type=str,
+                        default=QUEUE_BACKEND,
+                        help="""\
+                        Input pipeline built from queue runners (queue) or
+                        from tf.data (dataset), which reads files in parallel
+                        and needs TensorFlow 1.5 or later.
+                        """)
+
+    parser.add_argument('--shuffle-buffer-mb',
+                        type=float,
+                        default=None,
+                        help="""\
+                        Memory budget in MB of the training shuffle buffer.
+                        If not given, a buffer of 5 batches is used.
+                        """)
+
+    parser.add_argument('--cache-eval-data',
+                        action='store_true',
+                        help="""\
+                        Decode the evaluation split once into memory and
+                        feed every later evaluation from it (needs tf.data).
+                        """)
+
+    parser.add_argument('--window-count',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Number of windows cut from full-clip records at read
+                        time. If not given, windowed records are needed for
+                        the SPM and STME windowing types.
+                        """)
+
+    parser.add_argument('--window-length',
+                        type=int,
+                        default=None,
+                        help='Samples in every window, by default the clip over the window count')
+
+    parser.add_argument('--window-hop',
+                        type=int,
+                        default=None,
+                        help='Samples between the starts of windows, by default the window length')
+
+    parser.add_argument('--num-excerpts',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Number of random excerpts drawn from every training
+                        song, each being a training example. Full songs can be
+                        evaluated with STME windows of the excerpt length.
+                        """)
+
+    parser.add_argument('--excerpt-length',
+                        type=int,
+                        default=None,
+                        help='Samples in every random excerpt')
+
+    parser.add_argument('--tag-balance',
+                        type=float,
+                        default=None,
+                        help="""\
+                        Strength between 0 and 1 of the rejection resampling
+                        of the training songs by the frequency of their rarest
+                        tag, 1 accepting every tag at the rate of the rarest tag.
+                        Needs the tag counts saved in the metadata""")
+
+    parser.add_argument('--cache-dir',
+                        type=str,
+                        default=None,
+                        help="""\
+                        Local directory, such as on a local SSD, where the files
+                        read are copied in the background during the first epoch
+                        and read from in later epochs and evaluations""")
+
+    parser.add_argument('--cache-size-mb',
+                        type=float,
+                        default=None,
+                        help='Maximum size in MB of the local file cache, no file is evicted once full')
+
+    parser.add_argument('--echo-factor',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Times every decoded training example is reused, reshuffled
+                        with the other examples, when the input cannot keep up""")
+
+    parser.add_argument('--auto-echo',
+                        action='store_true',
+                        help='Echo the training examples only while the input stalls')
+
+    parser.add_argument('--synthetic-data',
+                        action='store_true',
+                        help="""\
+                        Train and evaluate on random batches with the shapes of the
+                        songs and tags in the metadata, reading no records, to
+                        measure the throughput of the model alone""")
+
+    parser.add_argument('--input-features',
+                        type=str,
+                        default=RAW_FEATURES,
+                        help="""\
+                        Features provided to the model, the samples of the records
+                        (raw) or 40 log-mel filterbanks computed from raw records
+                        while reading (log_mel), as in the fbank datasets""")
+
+    parser.add_argument('--train-devices',
+                        type=str,
+                        default=','.join(TRAIN_GPUS),
+                        help="""\
+                        Comma-separated devices of the training towers, such as
+                        /gpu:0,/gpu:1 or /cpu:0,/cpu:1 with virtual CPUs""")
+
+    parser.add_argument('--eval-devices',
+                        type=str,
+                        default=','.join(EVAL_GPUS),
+                        help='Comma-separated devices of the evaluation towers')
+
+    parser.add_argument('--virtual-cpus',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Number of virtual CPU devices /cpu:0 to /cpu:N-1, to test
+                        the tower code on CPU-only hosts""")
+
+    parser.add_argument('--stage-input',
+                        action='store_true',
+                        help="""\
+                        Stage the next batch of every training tower on its device
+                        while the current step computes""")
+
+    parser.add_argument('--max-params',
+                        type=int,
+                        default=None,
+                        help="""\
+                        Maximum number of parameters of the model, models over it
+                        or without a spec being rejected before training""")
+
+    parser.add_argument('--max-activation-mb',
+                        type=float,
+                        default=None,
+                        help="""\
+                        Maximum activation memory in MB of the training batches of
+                        a tower, estimated from the spec of the model""")
+
     parse_args, unknown = parser.parse_known_args()
 
     # If unknown arguments found, warn them on the console
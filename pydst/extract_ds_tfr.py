@@ -13,6 +13,8 @@ import numpy as np
 from array import array
 import tensorflow as tf
 from pydst import DEFAULT_SEED
+from pydst.records import ALL_SPLIT, pack_tags, write_order, ShardedRecordWriter, tagged_songs, new_songs, \
+    merge_splits, next_index, index_folds, build_metadata, merge_metadata, load_metadata, save_metadata
 from pydub import AudioSegment
 from time import gmtime, strftime
 
@@ -20,6 +22,7 @@ from time import gmtime, strftime
 LOGGER_FORMAT = '%(levelname)s:%(asctime)s:%(name)s:%(message)s'
 TIME = strftime("%Y%m%d_%H%M%S", gmtime())
 LOG_FILENAME = 'logs/ext_ds_'+TIME+'.log'
+METADATA_FILENAME = 'raw_metadata.json'
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -116,20 +119,36 @@ def sort_tags(targets, labels):
     return sorted_targets, sorted_labels
 
 
-def extract_data(mp3s_split, targets_split, root):
+def extract_data(mp3s_split, targets_split, tids_split, root, rng=None, num_shards=1, file_tag='',
+                 index_offsets=None):
     """Extract mp3 files and convert to numpy arrays.
         This data is saved in npy files in tracks folder.
         
     :param mp3_filenames
     :param trackid
+    :param tids_split
     :param root
+    :param rng: Random generator class for the write order.
+        If None the songs are written in the split order.
+    :param num_shards: Number of tfrecord shards per split.
+        Songs are interleaved across the shards in write order.
+    :param file_tag: Tag added to the file names, used to write
+        appended songs in new shards.
+    :param index_offsets: Dictionary with the index of the first
+        song of every split, saved in the records. Defaults to 0.
+    :return: max_num_samples, sample_depth of the saved songs
+        and the files and number of records of every split
     """
+    max_num_samples, sample_depth = 0, 1
+    splits = {}
     for setname, mp3_filenames in mp3s_split.items():
 
-        save_name = root + setname + '_rawdata.tfrecords'
-        writer = tf.python_io.TFRecordWriter(save_name)
+        save_prefix = root + setname + '_rawdata' + file_tag
+        writer = ShardedRecordWriter(save_prefix, num_shards)
+        index_offset = index_offsets.get(setname, 0) if index_offsets else 0
 
-        for idx, mp3_filename in enumerate(mp3_filenames):
+        for position, idx in enumerate(write_order(rng, len(mp3_filenames))):
+            mp3_filename = mp3_filenames[idx]
             load_filename = root + 'mp3_files/' + mp3_filename
             try:
                 song = AudioSegment.from_mp3(load_filename)
@@ -138,24 +157,31 @@ def extract_data(mp3s_split, targets_split, root):
             else:
                 song_samples = np.asarray(song.get_array_of_samples().tolist())
                 tags = targets_split[setname][idx]
+                index = index_offset + idx
 
                 num_samples = song_samples.shape[0]
                 sample_depth = 1
                 num_tags = tags.shape[0]
+                max_num_samples = max(max_num_samples, num_samples)
                 song_samples_sting = song_samples.tostring()
-                tags_string = tags.tostring()
+                tags_string = pack_tags(tags)
 
                 record = tf.train.Example(features=tf.train.Features(
                     feature={
                         'num_samples': _int64_feature(num_samples),
                         'sample_depth': _int64_feature(sample_depth),
                         'num_tags': _int64_feature(num_tags),
+                        'index': _int64_feature(index),
                         'tags': _bytes_feature(tags_string),
                         'song': _bytes_feature(song_samples_sting)
                     }
                 ))
-                writer.write(record.SerializeToString())
+                writer.write(record.SerializeToString(), shard=position)
+                writer.add_samples(song_samples)
+                writer.add_song(tids_split[setname][idx], index, shard=position, tags=tags)
         writer.close()
+        splits[setname] = writer.split_info()
+    return max_num_samples, sample_depth, splits
 
 
 def seperate_merge(targets, tids, mp3_filenames, split):
@@ -196,12 +222,21 @@ def seperate_merge(targets, tids, mp3_filenames, split):
     return targets_split, tids_split, mp3s_split
 
 
-def get_dataset(rng, root_folder, data_div, _size_of):
+def get_dataset(rng, root_folder, data_div, _size_of, num_shards=1, index_splits=False, num_folds=None,
+                filter_top_tags=None):
     """Function to perform the functions to extract the data.
     
     :param rng 
     :param root_folder
     :param _size_of: Number of samples.
+    :param num_shards: Number of shards per split. With more than
+        one shard, songs are written in a seeded global order.
+    :param index_splits: Store all the songs once, with the splits
+        defined as index lists in the metadata.
+    :param num_folds: Number of cross-validation folds saved in the
+        metadata when index_splits is used.
+    :param filter_top_tags: Only extract the songs with at least
+        one of the top N tags, if given.
     :returns: trn_data, vld_data, tst_data, label_map
     """
 
@@ -222,17 +257,90 @@ def get_dataset(rng, root_folder, data_div, _size_of):
     [targets, map_of_labels] = sort_tags(targets, map_of_labels)
     logger.info("Tags sorted according to frequency")
 
+    # Remove the songs without any of the top tags
+    if filter_top_tags:
+        [targets, mp3_files, tids] = tagged_songs(targets, mp3_files, tids, filter_top_tags)
+        logger.info("Kept {} songs with tags in the top {}".format(len(tids), filter_top_tags))
+
     # Seperate in test, valid, training sets - 20, 10, 70
     [targets_split, tids_split, mp3s_split] = seperate_merge(targets, tids, mp3_files, data_div)
     logger.info("Data separated and merged into dictionaries")
 
+    # Store the songs once with the splits as index lists
+    split_indices, folds = None, None
+    if index_splits:
+        [targets_split, tids_split, mp3s_split, split_indices] = merge_splits(targets_split, tids_split, mp3s_split)
+        logger.info("Splits defined as index lists")
+
     # Extract data from mp3 files and save npy
-    extract_data(mp3s_split, targets_split, root_folder)
+    write_rng = rng if num_shards > 1 else None
+    [max_num_samples, sample_depth, splits] = extract_data(mp3s_split, targets_split, tids_split, root_folder,
+                                                           write_rng, num_shards)
     logger.info("Data extracted from mp3 files and saved")
 
+    if index_splits and num_folds:
+        folds = index_folds(split_indices, splits[ALL_SPLIT]['shard_indices'], num_folds)
+        logger.info("Songs assigned to {} folds".format(num_folds))
+
+    # Save metadata needed by the data providers
+    metadata = build_metadata(map_of_labels, max_num_samples, sample_depth, splits, split_indices, folds,
+                              filter_top_tags)
+    save_metadata(metadata, root_folder + METADATA_FILENAME)
+    logger.info("Metadata saved in {}".format(METADATA_FILENAME))
+
     return tids_split, mp3s_split, map_of_labels
 
 
+def append_dataset(rng, root_folder, data_div, num_shards=1):
+    """Function to append the songs not yet extracted to the
+        dataset without rewriting the existing shards.
+
+    New songs are assigned to the splits by a stable hash of
+    their tid and written in new shards. The files, counts and
+    normalization statistics in the metadata are updated.
+
+    :param rng
+    :param root_folder
+    :param data_div: Fractions of the training, validation
+        and test set sizes.
+    :param num_shards: Number of new shards per split.
+    :returns: tids_split, mp3s_split of the appended songs
+    """
+    metadata = load_metadata(root_folder + METADATA_FILENAME)
+
+    # Extract tags and names and keep the new songs
+    [targets, mp3_files, tids, map_of_labels] = extract_tags_names(root_folder)
+    [targets_split, tids_split, mp3s_split] = new_songs(metadata, targets, mp3_files, tids,
+                                                        map_of_labels, data_div)
+    logger.info("New songs {}".format({setname: len(tids_split[setname]) for setname in tids_split}))
+    if not tids_split:
+        return tids_split, mp3s_split
+
+    # Continue the indices of the saved songs, merging the
+    # new songs if the splits are defined as index lists
+    split_indices = None
+    if 'index_splits' in metadata:
+        index_offsets = {ALL_SPLIT: next_index(metadata, ALL_SPLIT)}
+        [targets_split, tids_split, mp3s_split, split_indices] = merge_splits(targets_split, tids_split, mp3s_split,
+                                                                              index_offsets[ALL_SPLIT])
+    else:
+        index_offsets = {setname: next_index(metadata, setname) for setname in tids_split}
+
+    # Extract data of the new songs in new shards
+    write_rng = rng if num_shards > 1 else None
+    [max_num_samples, _, splits] = extract_data(mp3s_split, targets_split, tids_split, root_folder,
+                                                write_rng, num_shards, file_tag='-append_' + TIME,
+                                                index_offsets=index_offsets)
+    logger.info("New songs extracted from mp3 files and saved")
+
+    # Update the metadata with the appended shards
+    metadata = merge_metadata(metadata, max_num_samples, splits, split_indices)
+    save_metadata(metadata, root_folder + METADATA_FILENAME)
+    logger.info("Metadata updated in {}".format(METADATA_FILENAME))
+
+    return tids_split, mp3s_split
+
+
 def save_archives(train_md, valid_md, test_md, label_map, root):
     """Function to save the data in archives.
     
@@ -270,10 +378,26 @@ if __name__ == "__main__":
     size_of_sets = -1
     down_sampling = 1
     divisions = [0.7, 0.1, 0.2]
+    num_shards = 1
+    append = False
+    index_splits = False
+    num_folds = None
+    filter_top_tags = 50
+
+    # Append only the new songs to an extracted dataset
+    if append:
+        append_dataset(rndState, dataset_folder, divisions, num_shards)
+        logger.info("Appended the new songs and updated the metadata")
+        exit()
+
     [tids_split, mp3s_split, label_map] = get_dataset(rndState,
                                                       dataset_folder,
                                                       divisions,
-                                                      size_of_sets)
+                                                      size_of_sets,
+                                                      num_shards,
+                                                      index_splits,
+                                                      num_folds,
+                                                      filter_top_tags)
 
     np.savez(dataset_folder + 'tfrecords_metadata.npz',
              tids_split=tids_split,
@@ -0,0 +1,209 @@
+"""Export of the dataset as memory-mapped numpy arrays and
+    a random-access batch provider reading them.
+
+Each split is saved as a samples array (N x samples, int16),
+a labels array with the bit-packed tags and an index with the
+tids and mp3 files of the saved clips. Batches are gathered
+with one fancy-index from the page cache, hence no TensorFlow
+is needed for baselines, data analysis or CPU inference.
+"""
+
+import queue
+import logging
+import threading
+import numpy as np
+from pydub import AudioSegment
+from pydst import DEFAULT_SEED
+from pydst.tags import unpack_tags
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the checks of the stop event by the
+# background thread while the queue of batches is full
+PUT_TIMEOUT = 0.1
+
+
+def export_split(mp3_filenames, targets, tids, label_map, root, setname, num_samples):
+    """Export one split as memory-mapped arrays.
+
+    Songs shorter than num_samples are padded with zeros and
+    longer songs are clipped. Songs that fail to load are skipped
+    and only the first num_clips rows of the arrays are valid.
+
+    :param mp3_filenames: mp3 files of the split
+    :param targets: Frequency sorted multi-hot targets of the split
+    :param tids: Track ids of the split
+    :param label_map: Labels sorted according to frequency
+    :param root: Folder of the dataset
+    :param setname: Name of the split, such as train
+    :param num_samples: Number of samples saved per song
+    :return: Number of clips saved
+    """
+    samples = np.lib.format.open_memmap(root + setname + '_samples.npy', mode='w+',
+                                        dtype=np.int16, shape=(len(mp3_filenames), num_samples))
+    labels = np.lib.format.open_memmap(root + setname + '_labels.npy', mode='w+', dtype=np.uint8,
+                                       shape=(len(mp3_filenames), -(-targets.shape[1] // 8)))
+
+    kept = []
+    for idx, mp3_filename in enumerate(mp3_filenames):
+        load_filename = root + 'mp3_files/' + mp3_filename
+        try:
+            song = AudioSegment.from_mp3(load_filename)
+        except:
+            pass
+        else:
+            song_samples = np.asarray(song.get_array_of_samples(), dtype=np.int16)[:num_samples]
+            row = len(kept)
+            samples[row, :song_samples.shape[0]] = song_samples
+            samples[row, song_samples.shape[0]:] = 0
+            labels[row] = np.packbits(targets[idx] != 0)
+            kept.append(idx)
+
+    samples.flush()
+    labels.flush()
+    np.savez(root + setname + '_index.npz',
+             num_clips=len(kept),
+             num_samples=num_samples,
+             num_tags=targets.shape[1],
+             tids=np.asarray(tids)[kept],
+             mp3_files=np.asarray(mp3_filenames)[kept],
+             label_map=label_map)
+    return len(kept)
+
+
+class MemmapDataProvider(object):
+
+    def __init__(self,
+                 root,
+                 setname,
+                 batch_size=20,
+                 num_epochs=1,
+                 num_tags=50,
+                 shuffle=True,
+                 rng=None,
+                 prefetch=4,
+                 drop_remainder=False):
+        """Class to provide batches of an exported split by
+        random access of the memory-mapped arrays. A background
+        thread gathers the next batches while the current one
+        is being used.
+
+        :param root: Folder of the exported dataset
+        :param setname: Name of the split, such as train
+        :param batch_size: The size of batches to be provided
+        :param num_epochs: The number of epochs to be provided.
+            If None, and indefinite number is provided.
+        :param num_tags: The number of top tags in the targets
+        :param shuffle: Boolean whether to shuffle the clips or not
+        :param rng: Random generator class
+        :param prefetch: Number of batches gathered in advance
+        :param drop_remainder: Whether to drop the last partial
+            batch of every epoch, so that every batch has batch_size
+            clips. By default every clip is provided.
+        """
+        self._batch_size = batch_size
+        self._num_epochs = num_epochs
+        self._num_tags = num_tags
+        self._shuffle = shuffle
+        self._rng = rng if rng is not None else np.random.RandomState(DEFAULT_SEED)
+        self._prefetch = prefetch
+        self._drop_remainder = drop_remainder
+
+        index = np.load(root + setname + '_index.npz')
+        self.num_clips = int(index['num_clips'])
+        self.tids = index['tids']
+        self.mp3_files = index['mp3_files']
+        self.label_map = index['label_map']
+
+        self._samples = np.load(root + setname + '_samples.npy', mmap_mode='r')
+        self._labels = np.load(root + setname + '_labels.npy', mmap_mode='r')
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self._prefetch)
+        stop = threading.Event()
+        worker = threading.Thread(target=self._fill, args=(batches, stop))
+        worker.daemon = True
+        worker.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            # Stop the thread, which checks the event while the
+            # queue is full, if the iteration ends early
+            stop.set()
+            worker.join()
+
+    def _fill(self, batches, stop):
+        """Gather batches in a background thread and put them
+        in the queue, with None marking the end of the epochs.
+
+        :param batches: Queue of batches
+        :param stop: Event set when the consumer stops
+        """
+        last_start = self.num_clips - self._batch_size + 1 if self._drop_remainder else self.num_clips
+        epoch = 0
+        while not stop.is_set() and (self._num_epochs is None or epoch < self._num_epochs):
+            order = self._rng.permutation(self.num_clips) if self._shuffle else np.arange(self.num_clips)
+            for start in range(0, last_start, self._batch_size):
+                if not self._put(batches, self.gather(order[start:start + self._batch_size]), stop):
+                    return
+            epoch += 1
+        self._put(batches, None, stop)
+
+    @staticmethod
+    def _put(batches, item, stop):
+        """Put an item in the queue, waiting while it is full
+        until the consumer stops.
+
+        :param batches: Queue of batches
+        :param item: Batch, or None marking the end of the epochs
+        :param stop: Event set when the consumer stops
+        :return: Whether the item was put
+        """
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def gather(self, indices):
+        """Gather the clips at the indices given.
+
+        The indices are sorted so that the reads from the
+        memory-mapped arrays are sequential.
+
+        :param indices: Indices of the clips
+        :return: samples (int16) and multi-hot tags (uint8)
+        """
+        indices = np.sort(indices)
+        samples = self._samples[indices]
+        tags = unpack_tags(self._labels[indices], self._num_tags)
+        return samples, tags
+
+
+if __name__ == "__main__":
+    # Repeat the split of extract_ds_tfr and export it
+    from pydst.extract_ds_tfr import extract_tags_names, shuffle, reduction_samples, sort_tags, seperate_merge
+
+    logging.basicConfig(level=logging.INFO)
+    dataset_folder = 'magnatagatune/'
+    rndState = np.random.RandomState(DEFAULT_SEED)
+    size_of_sets = -1
+    divisions = [0.7, 0.1, 0.2]
+    song_samples = 465984
+
+    [targets, mp3_files, tids, label_map] = extract_tags_names(dataset_folder)
+    [targets, mp3_files, tids] = shuffle(rndState, targets, mp3_files, tids)
+    [targets, mp3_files, tids] = reduction_samples(targets, mp3_files, tids, size_of_sets)
+    [targets, label_map] = sort_tags(targets, label_map)
+    [targets_split, tids_split, mp3s_split] = seperate_merge(targets, tids, mp3_files, divisions)
+
+    for setname in mp3s_split:
+        num_clips = export_split(mp3s_split[setname], targets_split[setname], tids_split[setname],
+                                 label_map, dataset_folder, setname, song_samples)
+        logger.info("Exported {} clips of {} set".format(num_clips, setname))
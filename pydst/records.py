@@ -0,0 +1,423 @@
+"""Functions shared by the tfrecord extraction scripts.
+
+These handle the encoding of the tags stored in the records
+(from pydst.tags, kept free of TensorFlow),
+the writing of the records across shards and the metadata file
+describing the extracted dataset, including the updates needed
+to append new songs without rewriting the existing shards.
+
+Splits can also be defined as index lists in the metadata over
+one physical dataset, so that other splits and cross-validation
+folds are selected by the readers without re-extracting.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import tensorflow as tf
+from pydst.tags import pack_tags, unpack_tags
+
+# Tags are stored as a bitset packed into uint8 values
+# with the most frequent tag in the most significant bit
+TAG_ENCODING = 'packed_bits'
+
+# Name of the split holding all the songs when the
+# splits are defined as index lists
+ALL_SPLIT = 'all'
+SPLIT_NAMES = ('train', 'valid', 'test')
+
+
+def write_order(rng, num_songs):
+    """Order in which the songs of a split are written.
+
+    :param rng: Random generator class. If None the songs
+        are written in the order given.
+    :param num_songs: Number of songs in the split
+    :return: Indices of the songs in writing order
+    """
+    if rng is None:
+        return np.arange(num_songs)
+    return rng.permutation(num_songs)
+
+
+def hash_split(tid, divisions, names=SPLIT_NAMES):
+    """Assign a song to a split by a stable hash of its tid,
+    so that appended songs never move between splits.
+
+    :param tid: Track id of the song
+    :param divisions: Fractions of the training, validation
+        and test set sizes.
+    :param names: Names of the splits
+    :return: Name of the split
+    """
+    digest = hashlib.md5(str(tid).encode('utf-8')).hexdigest()
+    position = (int(digest, 16) % 1000000) / 1000000.0
+    cumulative = 0.0
+    for name, fraction in zip(names, divisions):
+        cumulative += fraction
+        if position < cumulative:
+            return name
+    return names[-1]
+
+
+def tagged_songs(targets, mp3_files, tids, num_top_tags):
+    """Keep the songs with at least one of the top N tags.
+
+    Songs without any of the top tags would be thrown away by
+    the data providers, hence they are not extracted at all.
+
+    :param targets: Frequency sorted multi-hot targets
+    :param mp3_files: mp3 files of the songs
+    :param tids: tids of the songs
+    :param num_top_tags: Number of top tags a song needs one of
+    :return: targets, mp3_files, tids of the tagged songs
+    """
+    keep = np.any(np.asarray(targets)[:, :num_top_tags] != 0, axis=1)
+    return targets[keep], np.asarray(mp3_files)[keep], np.asarray(tids)[keep]
+
+
+def new_songs(metadata, targets, mp3_files, tids, labels, divisions):
+    """Find the songs not yet in the dataset and assign them
+    to the splits by hash. The targets are reordered to the
+    frequency order of the label_map already saved. Songs without
+    any of the top tags are skipped if the dataset was filtered.
+
+    :param metadata: Metadata dictionary of the saved dataset
+    :param targets: Targets of all the songs annotated
+    :param mp3_files: mp3 files of all the songs annotated
+    :param tids: tids of all the songs annotated
+    :param labels: Labels of the targets columns
+    :param divisions: Fractions of the training, validation
+        and test set sizes.
+    :return: targets_split, tids_split, mp3s_split of the new songs
+    """
+    if 'splits' not in metadata or any('tids' not in split for split in metadata['splits'].values()):
+        raise ValueError('Metadata has no tids of the saved songs, the dataset needs to be re-extracted')
+
+    saved_tids = set()
+    for split in metadata['splits'].values():
+        saved_tids.update(split['tids'])
+
+    labels = [str(label) for label in labels]
+    columns = [labels.index(label) for label in metadata['label_map']]
+    targets = targets[:, columns]
+
+    targets_split, tids_split, mp3s_split = {}, {}, {}
+    for setname in SPLIT_NAMES:
+        targets_split[setname], tids_split[setname], mp3s_split[setname] = [], [], []
+
+    filtered_top_tags = metadata.get('filtered_top_tags')
+    for idx, tid in enumerate(tids):
+        if str(tid) in saved_tids:
+            continue
+        if filtered_top_tags and not np.any(targets[idx, :filtered_top_tags] != 0):
+            continue
+        setname = hash_split(tid, divisions)
+        targets_split[setname].append(targets[idx])
+        tids_split[setname].append(tid)
+        mp3s_split[setname].append(mp3_files[idx])
+
+    # Only splits with new songs are returned
+    for setname in list(targets_split):
+        if len(tids_split[setname]) == 0:
+            del(targets_split[setname], tids_split[setname], mp3s_split[setname])
+        else:
+            targets_split[setname] = np.asarray(targets_split[setname])
+            tids_split[setname] = np.asarray(tids_split[setname])
+            mp3s_split[setname] = np.asarray(mp3s_split[setname])
+    return targets_split, tids_split, mp3s_split
+
+
+def update_stats(stats, samples):
+    """Update the normalization statistics with a song.
+
+    :param stats: Statistics dictionary, None to start new ones
+    :param samples: Samples (or fbanks) of the song
+    :return: Updated statistics
+    """
+    if stats is None:
+        stats = {'count': 0, 'sum': 0.0, 'sum_squares': 0.0, 'max_abs': 0.0}
+    samples = np.asarray(samples, dtype=np.float64)
+    stats['count'] += int(samples.size)
+    stats['sum'] += float(np.sum(samples))
+    stats['sum_squares'] += float(np.sum(np.square(samples)))
+    stats['max_abs'] = max(stats['max_abs'], float(np.max(np.abs(samples))))
+    return stats
+
+
+def merge_stats(stats, other):
+    """Merge two normalization statistics dictionaries.
+
+    :param stats: Statistics dictionary or None
+    :param other: Statistics dictionary or None
+    :return: Merged statistics
+    """
+    if stats is None or other is None:
+        return stats if other is None else dict(other)
+    return {
+        'count': stats['count'] + other['count'],
+        'sum': stats['sum'] + other['sum'],
+        'sum_squares': stats['sum_squares'] + other['sum_squares'],
+        'max_abs': max(stats['max_abs'], other['max_abs'])
+    }
+
+
+def merge_counts(counts, other):
+    """Merge two lists of tag counts.
+
+    :param counts: Number of songs with every tag or None
+    :param other: Number of songs with every tag or None
+    :return: Merged counts
+    """
+    if counts is None or other is None:
+        return counts if other is None else list(other)
+    return [count + other_count for count, other_count in zip(counts, other)]
+
+
+def merge_tag_songs(tag_songs, other):
+    """Merge two lists of the song indices of every tag.
+
+    :param tag_songs: Indices of the songs with every tag or None
+    :param other: Indices of the songs with every tag or None
+    :return: Merged indices
+    """
+    if tag_songs is None or other is None:
+        return tag_songs if other is None else [list(indices) for indices in other]
+    return [indices + other_indices for indices, other_indices in zip(tag_songs, other)]
+
+
+def merge_splits(targets_split, tids_split, mp3s_split, index_offset=0):
+    """Merge the splits into one split stored once, with the
+    splits defined by the indices of the songs.
+
+    :param targets_split: Targets of every split
+    :param tids_split: tids of every split
+    :param mp3s_split: mp3 files of every split
+    :param index_offset: Index of the first song, the number of
+        songs already saved when appending
+    :return: targets, tids and mp3s dictionaries of the merged split
+        and the indices of every split
+    """
+    names = [name for name in SPLIT_NAMES if name in tids_split]
+    index_splits, start = {}, index_offset
+    for name in names:
+        index_splits[name] = list(range(start, start + len(tids_split[name])))
+        start += len(tids_split[name])
+
+    targets = np.concatenate([targets_split[name] for name in names])
+    tids = np.concatenate([tids_split[name] for name in names])
+    mp3s = np.concatenate([mp3s_split[name] for name in names])
+    return {ALL_SPLIT: targets}, {ALL_SPLIT: tids}, {ALL_SPLIT: mp3s}, index_splits
+
+
+def next_index(metadata, setname):
+    """Index following the largest song index saved in a split.
+
+    :param metadata: Metadata dictionary of the saved dataset
+    :param setname: Name of the split
+    :return: Index of the first appended song
+    """
+    indices = [idx for shard in metadata['splits'][setname].get('shard_indices', []) for idx in shard]
+    if setname == ALL_SPLIT:
+        indices += [idx for split in metadata.get('index_splits', {}).values() for idx in split]
+    return max(indices) + 1 if indices else 0
+
+
+def index_folds(index_splits, shard_indices, num_folds, first_shard=0, held_out='test'):
+    """Assign the songs not held out to cross-validation folds.
+
+    With at least as many shards as folds, whole shards are
+    assigned to a fold so that a fold is read from its own
+    shards. Otherwise songs are assigned round robin.
+
+    :param index_splits: Indices of every split
+    :param shard_indices: Indices of the songs in every shard
+    :param num_folds: Number of folds
+    :param first_shard: Number of the first shard, used to keep
+        assigning shards round robin when appending
+    :param held_out: Split kept out of the folds
+    :return: List with the indices of every fold
+    """
+    held_out_indices = set(index_splits.get(held_out, []))
+    folds = [[] for _ in range(num_folds)]
+    if len(shard_indices) >= num_folds:
+        for shard, indices in enumerate(shard_indices):
+            folds[(first_shard + shard) % num_folds] += [idx for idx in indices if idx not in held_out_indices]
+    else:
+        indices = sorted(idx for shard in shard_indices for idx in shard if idx not in held_out_indices)
+        for position, idx in enumerate(indices):
+            folds[position % num_folds].append(idx)
+    return folds
+
+
+def merge_metadata(metadata, max_num_samples, splits, index_splits=None):
+    """Merge the splits of appended shards into the metadata.
+
+    :param metadata: Metadata dictionary of the saved dataset
+    :param max_num_samples: Number of samples in the longest
+        appended song
+    :param splits: Files, records, tids and statistics of the
+        appended shards per split
+    :param index_splits: Indices of the appended songs in every
+        split when the splits are defined as index lists
+    :return: Updated metadata dictionary
+    """
+    metadata['max_num_samples'] = max(metadata['max_num_samples'], int(max_num_samples))
+    for setname, appended in splits.items():
+        split = metadata['splits'][setname]
+        first_shard = len(split.get('shard_indices', []))
+        split['files'] += appended['files']
+        split['num_records'] += appended['num_records']
+        split['tids'] += appended['tids']
+        split['sample_stats'] = merge_stats(split.get('sample_stats'), appended['sample_stats'])
+        split['tag_counts'] = merge_counts(split.get('tag_counts'), appended['tag_counts'])
+        split['tag_songs'] = merge_tag_songs(split.get('tag_songs'), appended['tag_songs'])
+        if 'shard_indices' in split:
+            split['shard_indices'] += appended['shard_indices']
+
+        if index_splits is not None and setname == ALL_SPLIT:
+            for name, indices in index_splits.items():
+                metadata['index_splits'].setdefault(name, [])
+                metadata['index_splits'][name] += indices
+            if 'folds' in metadata:
+                folds = index_folds(index_splits, appended['shard_indices'],
+                                    len(metadata['folds']), first_shard)
+                for fold, indices in zip(metadata['folds'], folds):
+                    fold += indices
+    return metadata
+
+
+class ShardedRecordWriter(object):
+
+    def __init__(self, save_prefix, num_shards=1):
+        """Class to write the records of a split across a number
+        of tfrecord shards. With one shard the file is named as
+        before, save_prefix.tfrecords.
+
+        :param save_prefix: Location and name of the files
+            without the extension
+        :param num_shards: Number of shards to write
+        """
+        if num_shards == 1:
+            self.filenames = [save_prefix + '.tfrecords']
+        else:
+            self.filenames = ['{}-{:05d}-of-{:05d}.tfrecords'.format(save_prefix, shard, num_shards)
+                              for shard in range(num_shards)]
+        self.num_records = 0
+        self.tids = []
+        self.shard_indices = [[] for _ in self.filenames]
+        self.sample_stats = None
+        self.tag_counts = None
+        self.tag_songs = None
+        self._writers = [tf.python_io.TFRecordWriter(filename) for filename in self.filenames]
+
+    def write(self, record, shard=0):
+        """Write a serialized record in a shard.
+
+        :param record: Serialized example
+        :param shard: Index of the shard
+        """
+        self._writers[shard % len(self._writers)].write(record)
+        self.num_records += 1
+
+    def add_song(self, tid, index, shard=0, tags=None):
+        """Keep track of a song written.
+
+        :param tid: Track id of the song
+        :param index: Index of the song saved in its records
+        :param shard: Index of the shard
+        :param tags: Targets of the song, counted per tag
+        """
+        self.tids.append(str(tid))
+        self.shard_indices[shard % len(self.filenames)].append(int(index))
+        if tags is not None:
+            tagged = (np.asarray(tags) != 0).astype(np.int64)
+            self.tag_counts = tagged if self.tag_counts is None else self.tag_counts + tagged
+            if self.tag_songs is None:
+                self.tag_songs = [[] for _ in tagged]
+            for column in np.flatnonzero(tagged):
+                self.tag_songs[column].append(int(index))
+
+    def add_samples(self, samples):
+        """Update the statistics with the samples saved.
+
+        :param samples: Samples (or fbanks) saved in a record
+        """
+        self.sample_stats = update_stats(self.sample_stats, samples)
+
+    def close(self):
+        for writer in self._writers:
+            writer.close()
+
+    def split_info(self):
+        """Files (relative to the dataset folder), number of records,
+        tids, song indices per shard, statistics, tag counts and
+        indices of the songs with every tag of the split for the
+        metadata."""
+        return {
+            'files': [os.path.basename(filename) for filename in self.filenames],
+            'num_records': self.num_records,
+            'tids': self.tids,
+            'shard_indices': self.shard_indices,
+            'sample_stats': self.sample_stats,
+            'tag_counts': None if self.tag_counts is None else [int(count) for count in self.tag_counts],
+            'tag_songs': self.tag_songs
+        }
+
+
+def build_metadata(label_map, max_num_samples, sample_depth, splits=None, index_splits=None, folds=None,
+                   filtered_top_tags=None):
+    """Build the metadata dictionary read by the data providers.
+
+    :param label_map: Labels sorted according to frequency.
+    :param max_num_samples: Number of samples (or frames) in
+        the longest song saved.
+    :param sample_depth: Depth of every sample, 1 for raw data
+        or the number of filters for fbanks.
+    :param splits: Dictionary with the files, number of records,
+        tids, normalization statistics, tag counts and indices of the
+        songs with every tag of every split.
+    :param index_splits: Indices of every split when all the
+        songs are stored once.
+    :param folds: Indices of every cross-validation fold.
+    :param filtered_top_tags: Number of top tags every saved song
+        has at least one of, if the untagged songs were filtered.
+    :return: Metadata dictionary
+    """
+    metadata = {
+        'label_map': [str(label) for label in label_map],
+        'max_num_samples': int(max_num_samples),
+        'max_num_tags': len(label_map),
+        'sample_depth': int(sample_depth),
+        'tag_encoding': TAG_ENCODING
+    }
+    if splits is not None:
+        metadata['splits'] = splits
+    if index_splits is not None:
+        metadata['index_splits'] = index_splits
+    if folds is not None:
+        metadata['folds'] = folds
+    if filtered_top_tags is not None:
+        metadata['filtered_top_tags'] = int(filtered_top_tags)
+    return metadata
+
+
+def load_metadata(filename):
+    """Load the metadata dictionary saved as json.
+
+    :param filename: Name of the json file
+    :return: Metadata dictionary
+    """
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def save_metadata(metadata, filename):
+    """Save the metadata dictionary as json.
+
+    :param metadata: Metadata dictionary
+    :param filename: Name of the json file
+    """
+    with open(filename, 'w') as f:
+        json.dump(metadata, f, indent=2)
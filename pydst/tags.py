@@ -0,0 +1,33 @@
+"""Encoding of the tags as uint8 bitsets.
+
+Shared by the record extraction and the memory-mapped dataset,
+with numpy only, so that reading the exported arrays needs no
+TensorFlow.
+"""
+
+import numpy as np
+
+
+def pack_tags(tags):
+    """Pack a multi-hot tag vector into a uint8 bitset.
+
+    The tags are expected to be sorted by frequency (sort_tags)
+    so that the first N bits of the bitset are the top N tags.
+
+    :param tags: Multi-hot vector of tags.
+    :return: Bytes of the bitset, ceil(num_tags / 8) long.
+    """
+    return np.packbits(np.asarray(tags) != 0).tobytes()
+
+
+def unpack_tags(packed_tags, num_tags):
+    """Unpack the top tags from one or more uint8 bitsets.
+
+    :param packed_tags: Array of packed tags with the bytes
+        of each bitset in the last dimension.
+    :param num_tags: Number of top tags to unpack.
+    :return: Multi-hot array of the top num_tags tags.
+    """
+    num_bytes = -(-num_tags // 8)
+    packed_tags = np.asarray(packed_tags, dtype=np.uint8)[..., :num_bytes]
+    return np.unpackbits(packed_tags, axis=-1)[..., :num_tags]